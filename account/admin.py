@@ -19,7 +19,14 @@ class CustomUserAdmin(UserAdmin):
                 "fields": ("birth_date", "photo", "about"),
             },
         ),
+        (
+            "Счётчики",
+            {
+                "fields": ("subscription_count", "subscriber_count", "article_count"),
+            },
+        ),
     )
+    readonly_fields = ["subscription_count", "subscriber_count", "article_count"]
 
 
 admin.site.register(Subscription)
@@ -0,0 +1,23 @@
+from .services.user_cache_service import USER_CACHE
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    Аутентификация JWT, загружающая пользователя из кэша (см. UserCache).
+    Из БД пользователь загружается только при промахе кэша, проверки
+    пользователя те же, что в JWTAuthentication, в кэш попадают
+    только прошедшие их пользователи
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        # проверка отзыва токена сравнивает его с хэшем пароля из БД
+        if user_id is None or getattr(api_settings, "CHECK_REVOKE_TOKEN", False):
+            return super().get_user(validated_token)
+        user, version = USER_CACHE.get(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            USER_CACHE.set(user, version)
+        return user
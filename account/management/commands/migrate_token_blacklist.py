@@ -0,0 +1,36 @@
+from account.services.token_blacklist_service import (
+    migrate_blacklisted_tokens,
+    prune_outstanding_tokens,
+)
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит отозванные неистёкшие токены из таблиц token_blacklist "
+        "в чёрный список в redis и удаляет из таблиц истёкшие токены"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=10000,
+            help="Количество токенов в одном запросе к БД и pipeline redis",
+        )
+        parser.add_argument(
+            "--prune-all",
+            action="store_true",
+            help="Удалить из таблиц все токены, а не только истёкшие",
+        )
+
+    def handle(self, *args, **options):
+        migrated = migrate_blacklisted_tokens(chunk_size=options["chunk_size"])
+        pruned = prune_outstanding_tokens(
+            expired_only=not options["prune_all"], chunk_size=options["chunk_size"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Перенесено в redis: {migrated}, удалено из таблиц: {pruned}"
+            )
+        )
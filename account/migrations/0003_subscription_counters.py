@@ -0,0 +1,72 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:28
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_subscriptions(apps, schema_editor):
+    """Оставляет по одной (самой ранней) подписке на каждую пару пользователей"""
+    Subscription = apps.get_model("account", "Subscription")
+    first_ids = (
+        Subscription.objects.values("from_user_id", "to_user_id")
+        .annotate(first_id=Min("id"))
+        .values("first_id")
+    )
+    Subscription.objects.exclude(id__in=first_ids).delete()
+
+
+def fill_counters(apps, schema_editor):
+    """Заполняет счётчики подписок и подписчиков существующих пользователей"""
+    CustomUser = apps.get_model("account", "CustomUser")
+    Subscription = apps.get_model("account", "Subscription")
+    subscriptions = (
+        Subscription.objects.filter(from_user_id=OuterRef("pk"))
+        .order_by()
+        .values("from_user_id")
+        .annotate(count=Count("*"))
+        .values("count")
+    )
+    subscribers = (
+        Subscription.objects.filter(to_user_id=OuterRef("pk"))
+        .order_by()
+        .values("to_user_id")
+        .annotate(count=Count("*"))
+        .values("count")
+    )
+    CustomUser.objects.update(
+        subscription_count=Coalesce(Subquery(subscriptions), 0),
+        subscriber_count=Coalesce(Subquery(subscribers), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("account", "0002_alter_customuser_email"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customuser",
+            name="subscriber_count",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Количество подписчиков"
+            ),
+        ),
+        migrations.AddField(
+            model_name="customuser",
+            name="subscription_count",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Количество подписок"
+            ),
+        ),
+        migrations.RunPython(remove_duplicate_subscriptions, migrations.RunPython.noop),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="subscription",
+            constraint=models.UniqueConstraint(
+                fields=("from_user", "to_user"), name="unique_subscription"
+            ),
+        ),
+    ]
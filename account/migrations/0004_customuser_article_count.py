@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:30
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_article_count(apps, schema_editor):
+    """Заполняет счётчик постов существующих пользователей"""
+    CustomUser = apps.get_model("account", "CustomUser")
+    Article = apps.get_model("blog", "Article")
+    articles = (
+        Article.objects.filter(author_id=OuterRef("pk"))
+        .order_by()
+        .values("author_id")
+        .annotate(count=Count("*"))
+        .values("count")
+    )
+    CustomUser.objects.update(article_count=Coalesce(Subquery(articles), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("account", "0003_subscription_counters"),
+        ("blog", "0015_article_search_document"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customuser",
+            name="article_count",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Количество постов"
+            ),
+        ),
+        migrations.RunPython(fill_article_count, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="customuser",
+            index=models.Index(
+                fields=["-article_count", "id"], name="user_article_count_idx"
+            ),
+        ),
+    ]
@@ -26,10 +26,22 @@ class CustomUser(AbstractUser):
         verbose_name="Подписки",
         symmetrical=False,
     )
+    subscription_count = models.PositiveIntegerField(
+        default=0, verbose_name="Количество подписок"
+    )
+    subscriber_count = models.PositiveIntegerField(
+        default=0, verbose_name="Количество подписчиков"
+    )
+    article_count = models.PositiveIntegerField(
+        default=0, verbose_name="Количество постов"
+    )
 
     class Meta:
         verbose_name = "Пользователь"
         verbose_name_plural = "Пользователи"
+        indexes = [
+            models.Index(fields=["-article_count", "id"], name="user_article_count_idx")
+        ]
 
     def __str__(self):
         return self.username
@@ -61,5 +73,12 @@ class Subscription(models.Model):
     )
     subscription_datatime = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["from_user", "to_user"], name="unique_subscription"
+            )
+        ]
+
     def __str__(self):
         return f"{self.from_user} subscribed {self.to_user}"
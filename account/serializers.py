@@ -1,18 +1,40 @@
 from .models import CustomUser
 from .services.mixins import PasswordsMatchValidationMixin
+from .services.rating_service import UsersRating
+from .services.subscription_service import get_subscribed_user_ids
+from .tokens import RefreshToken
 from django.conf import settings
+from django.db import models
+from drf_yasg.utils import swagger_serializer_method
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
+from rest_framework_simplejwt import serializers as jwt_serializers
 import logging.config
 
 
 logging.config.dictConfig(settings.LOGGING)
 LOGGER = logging.getLogger("account_logger")
 
+USERS_RATING = UsersRating()
+
+
+class BatchListSerializer(serializers.ListSerializer):
+    """
+    Перед сериализацией страницы вызывает child.preload_page(objects),
+    чтобы данные для всех объектов страницы были загружены
+    одним запросом, а не запросом на каждый объект
+    """
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        objects = list(iterable)
+        self.child.preload_page(objects)
+        return super().to_representation(objects)
+
 
 class UserBaseSerializer(serializers.ModelSerializer):
-    user_rating = serializers.IntegerField(source="get_user_rating", read_only=True)
-    article_count = serializers.IntegerField(source="articles.count", read_only=True)
+    user_rating = serializers.SerializerMethodField(read_only=True)
+    article_count = serializers.IntegerField(read_only=True)
     is_subscription = serializers.SerializerMethodField(
         "is_user_in_subscriptions", read_only=True
     )
@@ -21,17 +43,47 @@ class UserBaseSerializer(serializers.ModelSerializer):
         model = CustomUser
         fields = ["id", "username", "user_rating", "article_count", "is_subscription"]
         read_only_fields = ["id"]
+        list_serializer_class = BatchListSerializer
+
+    def preload_page(self, users: list) -> None:
+        """
+        Рейтинг всех пользователей страницы одним запросом к redis,
+        подписки на них - одним запросом к БД. Данные, уже переданные
+        в контексте (асинхронными представлениями), не запрашиваются
+        """
+        user_ratings = self.context.setdefault("user_ratings", {})
+        user_ratings.update(
+            USERS_RATING.get_rating_by_ids(
+                [user.id for user in users if user.id not in user_ratings]
+            )
+        )
+        checked_ids = self.context.setdefault("subscription_checked_ids", set())
+        user_ids = [user.id for user in users if user.id not in checked_ids]
+        self.context.setdefault("subscription_ids", set()).update(
+            get_subscribed_user_ids(self._get_request_user(), user_ids)
+        )
+        checked_ids.update(user_ids)
+
+    def _get_request_user(self):
+        request = self.context.get("request")
+        return getattr(request, "user", None)
+
+    @swagger_serializer_method(serializer_or_field=serializers.IntegerField)
+    def get_user_rating(self, user):
+        user_ratings = self.context.setdefault("user_ratings", {})
+        if user.id not in user_ratings:
+            user_ratings[user.id] = USERS_RATING.get_rating_by_id(user.id)
+        return user_ratings[user.id]
 
+    @swagger_serializer_method(serializer_or_field=serializers.BooleanField)
     def is_user_in_subscriptions(self, user):
-        """Проверяет, находится ли пользователь в подписках"""
-        request = self.context.get("request")
-        try:
-            my_user = request.user
-            if user in my_user.subscriptions.all():
-                return True
-        except AttributeError:
-            LOGGER.error(f"request.user not found")
-        return False
+        """
+        Проверяет, находится ли пользователь в подписках.
+        Для страницы списка подписки загружены в preload_page
+        """
+        if user.id in self.context.get("subscription_checked_ids", ()):
+            return user.id in self.context["subscription_ids"]
+        return bool(get_subscribed_user_ids(self._get_request_user(), [user.id]))
 
 
 class UserListSerializer(UserBaseSerializer):
@@ -42,12 +94,8 @@ class UserListSerializer(UserBaseSerializer):
 
 
 class UserDetailUpdateSerializer(UserBaseSerializer):
-    subscription_count = serializers.IntegerField(
-        source="subscriptions.count", read_only=True
-    )
-    subscriber_count = serializers.IntegerField(
-        source="subscribers.count", read_only=True
-    )
+    subscription_count = serializers.IntegerField(read_only=True)
+    subscriber_count = serializers.IntegerField(read_only=True)
 
     class Meta(UserBaseSerializer.Meta):
         fields = UserBaseSerializer.Meta.fields + [
@@ -98,7 +146,7 @@ class PasswordSetSerializer(PasswordsMatchValidationMixin, serializers.Serialize
 
     def update(self, instance, validate_data):
         instance.set_password(validate_data.get("password"))
-        instance.save()
+        instance.save(update_fields=["password"])
         return instance
 
 
@@ -109,5 +157,17 @@ class PasswordChangeSerializer(PasswordSetSerializer):
         if not instance.check_password(validated_data.get("old_password")):
             raise ValidationError("old password incorrect")
         instance.set_password(validated_data.get("password"))
-        instance.save()
+        instance.save(update_fields=["password"])
         return instance
+
+
+class TokenObtainPairSerializer(jwt_serializers.TokenObtainPairSerializer):
+    token_class = RefreshToken
+
+
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    token_class = RefreshToken
+
+
+class TokenBlacklistSerializer(jwt_serializers.TokenBlacklistSerializer):
+    token_class = RefreshToken
@@ -1,37 +1,174 @@
+from .redis_service import ASYNC_REDIS, REDIS, redis_read, redis_write
+from asgiref.sync import sync_to_async
 from django.conf import settings
-import redis
+from typing import Iterable, Optional
+import hashlib
+import uuid
 
 
 class ChangeRatingError(Exception):
     pass
 
 
-REDIS = redis.StrictRedis(
-    host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB
-)
-
-
 class RatingBase:
     """Базовый класс для подсчёта рейтинга"""
 
     redis_key = None
     rating_by_action = None
+    filter_cache_timeout = settings.RATING_FILTER_CACHE_TIMEOUT
 
+    # объекты с рейтингом ARGV[1] стоят в ZREVRANGE подряд после объектов
+    # с большим рейтингом, в обратном лексикографическом порядке id,
+    # позиция после id ARGV[2] среди них ищется бинарным поиском
+    _get_position_after = REDIS.register_script(
+        """
+        local low = redis.call("ZCOUNT", KEYS[1], "(" .. ARGV[1], "+inf")
+        local high = low + redis.call("ZCOUNT", KEYS[1], ARGV[1], ARGV[1])
+        while low < high do
+            local middle = math.floor((low + high) / 2)
+            local member = redis.call("ZREVRANGE", KEYS[1], middle, middle)[1]
+            if member >= ARGV[2] then
+                low = middle + 1
+            else
+                high = middle
+            end
+        end
+        return low
+        """
+    )
+
+    @redis_read(default=0, stale=True)
     def get_rating_by_id(self, object_id: int) -> int:
         """
-        Получение рейтинга объекта по id, если объекта нет, он
-        добавляется с рейтингом 0
+        Получение рейтинга объекта по id. Чтение ничего не пишет в redis:
+        объект без рейтинга считается объектом с рейтингом 0
         """
         rating = REDIS.zscore(name=self.redis_key, value=object_id)
         if not rating:
-            self.incr_or_decr_rating_by_id(action="init", object_id=object_id)
             return 0
         return int(rating)
 
-    def get_range_list_by_rating(self) -> list:
-        """Получение отсортированного списка по рейтингу"""
-        return REDIS.zrange(name=self.redis_key, start=0, end=-1, desc=True)
+    def get_rating_by_ids(self, object_ids: list) -> dict:
+        """
+        Рейтинг нескольких объектов одним запросом (ZMSCORE).
+        Пустой список в redis не запрашивается и не закрывает выключатель
+        """
+        if not object_ids:
+            return {}
+        return self._get_rating_by_ids(object_ids)
+
+    @redis_read(fallback=lambda self, object_ids: dict.fromkeys(object_ids, 0))
+    def _get_rating_by_ids(self, object_ids: list) -> dict:
+        ratings = REDIS.zmscore(self.redis_key, object_ids)
+        return {
+            object_id: int(rating or 0)
+            for object_id, rating in zip(object_ids, ratings)
+        }
+
+    @redis_read(default=0, stale=True)
+    async def aget_rating_by_id(self, object_id: int) -> int:
+        rating = await ASYNC_REDIS.zscore(self.redis_key, object_id)
+        return int(rating or 0)
+
+    async def aget_rating_by_ids(self, object_ids: list) -> dict:
+        if not object_ids:
+            return {}
+        return await self._aget_rating_by_ids(object_ids)
+
+    @redis_read(fallback=lambda self, object_ids: dict.fromkeys(object_ids, 0))
+    async def _aget_rating_by_ids(self, object_ids: list) -> dict:
+        ratings = await ASYNC_REDIS.zmscore(self.redis_key, object_ids)
+        return {
+            object_id: int(rating or 0)
+            for object_id, rating in zip(object_ids, ratings)
+        }
+
+    @redis_read(fallback=lambda *args, **kwargs: [])
+    def get_range_list_by_rating(
+        self,
+        start: int = 0,
+        end: int = -1,
+        name: Optional[str] = None,
+        withscores: bool = False,
+    ) -> list:
+        """
+        Получение отсортированного по рейтингу списка id
+        в окне [start, end] (включительно).
+        name - ключ отфильтрованного рейтинга (см. get_filtered_rating_key),
+        withscores - вернуть пары (id, рейтинг)
+        """
+        return REDIS.zrange(
+            name=name or self.redis_key,
+            start=start,
+            end=end,
+            desc=True,
+            withscores=withscores,
+        )
 
+    @redis_read(default=0)
+    def get_position_after(
+        self, object_id: int, rating: float, name: Optional[str] = None
+    ) -> int:
+        """
+        Позиция в отсортированном рейтинге, следующая за парой
+        (rating, object_id). Если рейтинг объекта с тех пор изменился
+        или объект удалён, позиция определяется по прежнему значению
+        рейтинга и id объекта, поэтому объекты с тем же рейтингом
+        не повторяются и не пропускаются
+        """
+        return self._get_position_after(
+            keys=[name or self.redis_key], args=[rating, object_id]
+        )
+
+    @redis_read(default=0)
+    def get_count(self, name: Optional[str] = None) -> int:
+        """Количество объектов в рейтинге"""
+        return REDIS.zcard(name or self.redis_key)
+
+    @redis_read(default=None)
+    def get_rank(self, object_id: int, name: Optional[str] = None) -> Optional[int]:
+        """Позиция объекта в отсортированном рейтинге, None - объекта нет"""
+        return REDIS.zrevrank(name or self.redis_key, object_id)
+
+    def get_filtered_rating_key(
+        self,
+        intersect_keys: list,
+        union_keys: Optional[list] = None,
+        name: Optional[str] = None,
+    ) -> str:
+        """
+        Возвращает ключ sorted set с рейтингом объектов, которые входят
+        во все множества intersect_keys и хотя бы в одно из union_keys.
+        name - ключ рейтинга, который фильтруется (по умолчанию общий).
+        Пересечение считается в redis и хранится filter_cache_timeout секунд,
+        поэтому соседние страницы списка читаются из одного снимка
+        """
+        rating_key = name or self.redis_key
+        union_keys = sorted(union_keys or [])
+        digest = hashlib.md5(
+            "|".join(
+                [rating_key] + sorted(intersect_keys) + ["union"] + union_keys
+            ).encode()
+        ).hexdigest()
+        name = f"{self.redis_key}:filter:{digest}"
+        if REDIS.exists(name):
+            return name
+
+        weights = {rating_key: 1}
+        weights.update({key: 0 for key in intersect_keys})
+        pipe = REDIS.pipeline()
+        if union_keys:
+            union_name = f"{name}:union"
+            pipe.zunionstore(union_name, union_keys)
+            weights[union_name] = 0
+        pipe.zinterstore(name, weights)
+        pipe.expire(name, self.filter_cache_timeout)
+        if union_keys:
+            pipe.delete(union_name)
+        pipe.execute()
+        return name
+
+    @redis_write()
     def incr_or_decr_rating_by_id(self, action: str, object_id: int) -> None:
         """Изменение рейтинга объекта"""
         if action in self.rating_by_action:
@@ -44,10 +181,228 @@ class RatingBase:
             # и пишем в лог
             raise ChangeRatingError("Action does not exist")
 
+    def incr_ratings(self, amounts: dict) -> None:
+        """Изменение рейтинга объектов {object_id: amount} одним pipeline"""
+        pipe = REDIS.pipeline(transaction=False)
+        for object_id, amount in amounts.items():
+            pipe.zincrby(self.redis_key, amount, object_id)
+        pipe.execute()
+
+    @redis_write()
     def clear_rating_by_id(self, object_id: int) -> None:
         """Очистка рейтинг объекта"""
         REDIS.zrem(self.redis_key, object_id)
 
+    def get_rating_key_for_ids(
+        self,
+        object_ids: Iterable[int],
+        cache_key: Optional[str] = None,
+        chunk_size: int = 10000,
+    ) -> str:
+        """
+        Возвращает ключ sorted set с рейтингом только объектов object_ids.
+        Ключ хранится filter_cache_timeout секунд. С cache_key ключ
+        переиспользуется, пока не истёк или не сброшен
+        (delete_rating_keys_for_ids): object_ids тогда не читаются,
+        и ленивый итератор не выполняет запрос к БД
+        """
+        suffix = uuid.uuid4().hex
+        ids_key = f"{self.redis_key}:ids:{suffix}"
+        name = f"{self.redis_key}:filter:{cache_key or suffix}"
+        if cache_key is not None and REDIS.exists(name):
+            return name
+        chunk = []
+        for object_id in object_ids:
+            chunk.append(object_id)
+            if len(chunk) == chunk_size:
+                REDIS.zadd(ids_key, dict.fromkeys(chunk, 0))
+                chunk = []
+        if chunk:
+            REDIS.zadd(ids_key, dict.fromkeys(chunk, 0))
+        pipe = REDIS.pipeline()
+        pipe.zinterstore(name, {self.redis_key: 1, ids_key: 0})
+        pipe.expire(name, self.filter_cache_timeout)
+        pipe.delete(ids_key)
+        pipe.execute()
+        return name
+
+    @redis_write(retry=False)
+    def delete_rating_keys_for_ids(self, *cache_keys: str) -> None:
+        """Сброс ключей get_rating_key_for_ids, построенных с cache_keys"""
+        REDIS.delete(*(f"{self.redis_key}:filter:{key}" for key in cache_keys))
+
+    def rebuild(self, ratings: Iterable[tuple], chunk_size: int = 10000) -> int:
+        """
+        Замена рейтинга значениями (object_id, рейтинг).
+        Новый рейтинг пишется во временный ключ пачками ZADD по chunk_size
+        и подменяет старый одной транзакцией (RENAME).
+        Возвращает количество объектов в рейтинге
+        """
+        rebuild_key = f"{self.redis_key}:rebuild"
+        REDIS.delete(rebuild_key)
+        count, chunk = 0, {}
+        for object_id, rating in ratings:
+            chunk[object_id] = rating
+            if len(chunk) == chunk_size:
+                REDIS.zadd(rebuild_key, chunk)
+                count, chunk = count + len(chunk), {}
+        if chunk:
+            REDIS.zadd(rebuild_key, chunk)
+            count += len(chunk)
+        pipe = REDIS.pipeline()
+        if count:
+            pipe.rename(rebuild_key, self.redis_key)
+        else:
+            pipe.delete(self.redis_key)
+        for key in self._get_derived_keys():
+            pipe.delete(key)
+        pipe.execute()
+        return count
+
+    def _get_derived_keys(self) -> list:
+        """Ключи, построенные из рейтинга и удаляемые при его замене"""
+        return []
+
+
+class SortedRatingList:
+    """
+    Ленивый список объектов, упорядоченный по убыванию score
+    sorted set'а key в redis. При взятии среза из redis читается
+    только окно id нужной страницы, после чего объекты страницы
+    загружаются из БД одним запросом (_get_objects_by_ids).
+    exclude_id - id объекта, который не входит в список
+    (например, сам пользователь в списке пользователей)
+    """
+
+    rating = None
+
+    def __init__(self, key: Optional[str], exclude_id: Optional[int] = None):
+        # key = None - заведомо пустой список
+        self.key = key
+        self.exclude_id = exclude_id
+        self._count = None
+        self._exclude_rank = None
+
+    def count(self) -> int:
+        if self._count is None:
+            self._count = self.rating.get_count(self.key) if self.key else 0
+            if self._get_exclude_rank() is not None:
+                self._count -= 1
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self[0:])
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            if item.step is not None:
+                raise ValueError("step is not supported")
+            start = item.start or 0
+            if item.stop is None:
+                return self._get_objects(start, -1)
+            if item.stop <= start:
+                return []
+            return self._get_objects(start, item.stop - 1)
+        objects = self._get_objects(item, item)
+        if not objects:
+            raise IndexError("list index out of range")
+        return objects[0]
+
+    def get_keyset_page(self, position: Optional[list], limit: int) -> tuple:
+        """
+        Страница для keyset пагинации. position - (score, id) последнего
+        объекта предыдущей страницы, его место в sorted set ищется за O(log n)
+        """
+        if not self.key:
+            return [], None
+        start = 0
+        if position:
+            score, object_id = position
+            start = self.rating.get_position_after(object_id, score, name=self.key)
+        page = [
+            (object_id, score)
+            for object_id, score in self.rating.get_range_list_by_rating(
+                start, start + limit + 1, name=self.key, withscores=True
+            )
+            if int(object_id) != self.exclude_id
+        ][: limit + 1]
+        objects = self._get_objects_by_ids(
+            [int(object_id) for object_id, _ in page[:limit]]
+        )
+        if len(page) <= limit:
+            return objects, None
+        last_object_id, last_score = page[limit - 1]
+        return objects, [last_score, int(last_object_id)]
+
+    def _get_exclude_rank(self) -> Optional[int]:
+        if self.exclude_id is None or not self.key:
+            return None
+        if self._exclude_rank is None:
+            rank = self.rating.get_rank(self.exclude_id, name=self.key)
+            self._exclude_rank = -1 if rank is None else rank
+        return None if self._exclude_rank == -1 else self._exclude_rank
+
+    @staticmethod
+    def _get_window(start: int, end: int, exclude_rank: Optional[int]) -> tuple:
+        """Позиции в sorted set, после исключённого объекта они сдвинуты на 1"""
+        if exclude_rank is not None:
+            start = start if start < exclude_rank else start + 1
+            end = end if end < exclude_rank or end == -1 else end + 1
+        return start, end
+
+    def _get_objects(self, start: int, end: int) -> list:
+        """Объекты с позиции start по end (включительно) в порядке score"""
+        if not self.key:
+            return []
+        start, end = self._get_window(start, end, self._get_exclude_rank())
+        return self._get_objects_by_ids(
+            [
+                int(object_id)
+                for object_id in self.rating.get_range_list_by_rating(
+                    start, end, name=self.key
+                )
+                if int(object_id) != self.exclude_id
+            ]
+        )
+
+    def _get_objects_by_ids(self, object_ids: list) -> list:
+        """Объекты из БД в порядке object_ids"""
+        raise NotImplementedError
+
+    @redis_read(fallback=lambda self, offset, limit: (0, []))
+    async def aget_page(self, offset: int, limit: int) -> tuple:
+        """
+        Асинхронно возвращает (количество объектов, limit объектов
+        с позиции offset). Количество и позиция исключённого объекта
+        читаются одним pipeline
+        """
+        if not self.key:
+            return 0, []
+        pipe = ASYNC_REDIS.pipeline(transaction=False)
+        pipe.zcard(self.key)
+        if self.exclude_id is not None:
+            pipe.zrevrank(self.key, self.exclude_id)
+        count, *exclude_rank = await pipe.execute()
+        exclude_rank = exclude_rank[0] if exclude_rank else None
+        if exclude_rank is not None:
+            count -= 1
+        start, end = self._get_window(offset, offset + limit - 1, exclude_rank)
+        object_ids = await ASYNC_REDIS.zrange(self.key, start, end, desc=True)
+        objects = await self._aget_objects_by_ids(
+            [
+                int(object_id)
+                for object_id in object_ids
+                if int(object_id) != self.exclude_id
+            ]
+        )
+        return count, objects
+
+    async def _aget_objects_by_ids(self, object_ids: list) -> list:
+        return await sync_to_async(self._get_objects_by_ids)(object_ids)
+
 
 class UsersRating(RatingBase):
     """Класс для подсчёта рейтинга пользователей"""
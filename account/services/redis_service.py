@@ -0,0 +1,347 @@
+from collections import OrderedDict, deque
+from django.conf import settings
+from typing import Callable, Optional
+import asyncio
+import functools
+import inspect
+import logging.config
+import redis
+import redis.asyncio
+import threading
+import time
+
+try:
+    from redis._parsers import _AsyncRESP2Parser, _RESP2Parser
+except ImportError:
+    # redis < 5
+    from redis.asyncio.connection import PythonParser as _AsyncRESP2Parser
+    from redis.connection import PythonParser as _RESP2Parser
+
+
+logging.config.dictConfig(settings.LOGGING)
+LOGGER = logging.getLogger("account_logger")
+
+
+def _get_connection_pool(client=redis):
+    """
+    Пул соединений с redis по настройкам REDIS_*: unix socket или TCP,
+    размер пула, таймауты и интервал проверки соединений.
+    Ответы разбирает hiredis, если он установлен и не отключён REDIS_HIREDIS.
+    client - redis или redis.asyncio
+    """
+    kwargs = {
+        "db": settings.REDIS_DB,
+        "max_connections": settings.REDIS_MAX_CONNECTIONS,
+        "socket_timeout": settings.REDIS_SOCKET_TIMEOUT,
+        "socket_connect_timeout": settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+        "health_check_interval": settings.REDIS_HEALTH_CHECK_INTERVAL,
+    }
+    if settings.REDIS_HIREDIS:
+        # пулы асинхронного клиента создаются на каждый event loop,
+        # предупреждение пишется один раз, для пула синхронного клиента
+        if not client.connection.HIREDIS_AVAILABLE and client is redis:
+            LOGGER.warning("hiredis is not installed, python parser is used")
+    else:
+        kwargs["parser_class"] = _RESP2Parser if client is redis else _AsyncRESP2Parser
+    if settings.REDIS_UNIX_SOCKET_PATH:
+        return client.ConnectionPool(
+            connection_class=client.UnixDomainSocketConnection,
+            path=settings.REDIS_UNIX_SOCKET_PATH,
+            **kwargs,
+        )
+    return client.ConnectionPool(
+        host=settings.REDIS_HOST, port=settings.REDIS_PORT, **kwargs
+    )
+
+
+class RedisCircuitBreaker:
+    """
+    Автоматический выключатель обращений к redis.
+    После failure_threshold ошибок подряд redis считается недоступным
+    reset_timeout секунд: чтения сразу возвращают запасные значения,
+    записи ставятся в очередь повтора. Затем пропускаются пробные
+    обращения, первое успешное закрывает выключатель и запускает
+    повтор очереди в фоновом потоке
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = settings.REDIS_CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = settings.REDIS_CIRCUIT_RESET_TIMEOUT,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def is_available(self) -> bool:
+        """False - выключатель разомкнут и время пробы ещё не пришло"""
+        opened_at = self._opened_at
+        return opened_at is None or time.monotonic() - opened_at >= self.reset_timeout
+
+    def record_success(self) -> None:
+        if self._opened_at is None and not self._failures:
+            return
+        with self._lock:
+            was_open = self._opened_at is not None
+            self._failures, self._opened_at = 0, None
+        if was_open:
+            LOGGER.warning("redis is available again")
+            REDIS_RETRY_QUEUE.replay_in_background()
+
+    def record_failure(self, error: Exception) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._failures < self.failure_threshold:
+                return
+            if self._opened_at is None:
+                LOGGER.error(f"redis is unavailable: {error}")
+            self._opened_at = time.monotonic()
+
+
+class RedisRetryQueue:
+    """
+    Очередь записей в redis, не выполненных из-за его недоступности.
+    Записи повторяются по порядку, когда redis снова доступен.
+    Очередь хранится в памяти процесса и ограничена max_size записями,
+    при переполнении теряются самые старые.
+    Повтор не идемпотентен: запись, которая выполнилась в redis, но
+    завершилась ошибкой (например, по таймауту ответа), выполняется
+    повторно, и ZINCRBY/INCR рейтинга и просмотров учитываются дважды.
+    Точные значения восстанавливает manage.py rebuild_ratings
+    """
+
+    def __init__(self, max_size: int = settings.REDIS_RETRY_QUEUE_SIZE):
+        self._calls = deque(maxlen=max_size)
+        self._lock = threading.Lock()
+        self._replaying = False
+
+    def __len__(self):
+        return len(self._calls)
+
+    def put(self, func: Callable, args: tuple, kwargs: dict) -> None:
+        with self._lock:
+            if len(self._calls) == self._calls.maxlen:
+                LOGGER.error(f"redis retry queue is full, {func.__qualname__} lost")
+            self._calls.append((func, args, kwargs))
+
+    def replay_in_background(self) -> None:
+        """
+        Повтор записей в фоновом потоке, чтобы не задерживать запрос,
+        который закрыл выключатель. Одновременно идёт только один повтор
+        """
+        with self._lock:
+            if self._replaying or not self._calls:
+                return
+            self._replaying = True
+        threading.Thread(
+            target=self._replay_once, name="redis-retry-queue", daemon=True
+        ).start()
+
+    def _replay_once(self) -> None:
+        try:
+            self.replay()
+        finally:
+            with self._lock:
+                self._replaying = False
+
+    def replay(self) -> None:
+        """
+        Повтор записей. При ошибке redis невыполненная запись
+        возвращается в начало очереди, повтор прекращается.
+        Запись, завершившаяся другой ошибкой, пишется в лог и теряется,
+        чтобы не останавливать повтор остальных
+        """
+        while True:
+            with self._lock:
+                if not self._calls:
+                    return
+                func, args, kwargs = self._calls.popleft()
+            try:
+                func(*args, **kwargs)
+            except redis.RedisError as e:
+                with self._lock:
+                    self._calls.appendleft((func, args, kwargs))
+                REDIS_BREAKER.record_failure(e)
+                return
+            except Exception as e:
+                LOGGER.error(f"{func.__qualname__} replay failed, write lost: {e}")
+
+
+class StaleValues:
+    """Последние прочитанные из redis значения (LRU на max_size значений)"""
+
+    def __init__(self, max_size: int = settings.REDIS_STALE_CACHE_SIZE):
+        self.max_size = max_size
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, default=None):
+        with self._lock:
+            return self._values.get(key, default)
+
+    def set(self, key: tuple, value) -> None:
+        with self._lock:
+            self._values[key] = value
+            self._values.move_to_end(key)
+            if len(self._values) > self.max_size:
+                self._values.popitem(last=False)
+
+
+class AsyncRedisClients:
+    """
+    Клиент redis.asyncio текущего event loop. Соединения асинхронного
+    клиента привязаны к loop, в котором открыты, а под WSGI каждое
+    асинхронное представление выполняется в новом loop (async_to_sync),
+    поэтому у каждого loop свой пул соединений. Клиенты закрытых loop
+    удаляются при создании нового клиента (соединения ссылаются на свой
+    loop, слабые ссылки его бы не освободили). Атрибуты (команды,
+    pipeline) берутся у клиента текущего loop
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get_client(self) -> redis.asyncio.StrictRedis:
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            with self._lock:
+                for closed_loop in [
+                    other for other in self._clients if other.is_closed()
+                ]:
+                    del self._clients[closed_loop]
+                client = self._clients[loop] = self._create_client()
+        return client
+
+    def _create_client(self) -> redis.asyncio.StrictRedis:
+        return redis.asyncio.StrictRedis(
+            connection_pool=_get_connection_pool(redis.asyncio)
+        )
+
+    def __getattr__(self, name: str):
+        return getattr(self.get_client(), name)
+
+
+REDIS = redis.StrictRedis(connection_pool=_get_connection_pool())
+# клиент для асинхронных представлений
+ASYNC_REDIS = AsyncRedisClients()
+REDIS_BREAKER = RedisCircuitBreaker()
+REDIS_RETRY_QUEUE = RedisRetryQueue()
+STALE_VALUES = StaleValues()
+
+
+def _get_stale_key(func: Callable, args: tuple, kwargs: dict) -> tuple:
+    """Ключ запомненного значения, для методов вместо экземпляра - его класс"""
+    if args and hasattr(type(args[0]), func.__name__):
+        args = (type(args[0]),) + args[1:]
+    return func.__qualname__, args, tuple(sorted(kwargs.items()))
+
+
+def redis_read(
+    default=None, fallback: Optional[Callable] = None, stale: bool = False
+) -> Callable:
+    """
+    Декоратор чтения из redis (синхронного или асинхронного).
+    Если redis недоступен, возвращается результат fallback(*args, **kwargs)
+    или default, а при stale=True - последнее прочитанное этим методом
+    значение для тех же аргументов
+    """
+
+    def get_fallback(key: Optional[tuple], args: tuple, kwargs: dict):
+        if stale:
+            result = STALE_VALUES.get(key, STALE_VALUES)
+            if result is not STALE_VALUES:
+                return result
+        if fallback is not None:
+            return fallback(*args, **kwargs)
+        return default
+
+    def get_result(key: Optional[tuple], result):
+        REDIS_BREAKER.record_success()
+        if stale:
+            STALE_VALUES.set(key, result)
+        return result
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                key = _get_stale_key(func, args, kwargs) if stale else None
+                if REDIS_BREAKER.is_available():
+                    try:
+                        result = await func(*args, **kwargs)
+                    except redis.RedisError as e:
+                        _record_redis_error(func, e)
+                    else:
+                        return get_result(key, result)
+                return get_fallback(key, args, kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = _get_stale_key(func, args, kwargs) if stale else None
+            if REDIS_BREAKER.is_available():
+                try:
+                    result = func(*args, **kwargs)
+                except redis.RedisError as e:
+                    _record_redis_error(func, e)
+                else:
+                    return get_result(key, result)
+            return get_fallback(key, args, kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def redis_write(retry: bool = True) -> Callable:
+    """
+    Декоратор записи в redis. Если redis недоступен, запись ставится
+    в очередь повтора (retry=False - пропускается, например запись кэша).
+    Асинхронные записи в очередь не ставятся
+    """
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if REDIS_BREAKER.is_available():
+                    try:
+                        result = await func(*args, **kwargs)
+                    except redis.RedisError as e:
+                        _record_redis_error(func, e)
+                    else:
+                        REDIS_BREAKER.record_success()
+                        return result
+                return None
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if REDIS_BREAKER.is_available():
+                try:
+                    result = func(*args, **kwargs)
+                except redis.RedisError as e:
+                    _record_redis_error(func, e)
+                else:
+                    REDIS_BREAKER.record_success()
+                    return result
+            if retry:
+                REDIS_RETRY_QUEUE.put(func, args, kwargs)
+            return None
+
+        return wrapper
+
+    return decorator
+
+
+def _record_redis_error(func: Callable, error: Exception) -> None:
+    LOGGER.error(f"{func.__qualname__} redis error: {error}")
+    REDIS_BREAKER.record_failure(error)
@@ -1,7 +1,10 @@
 from ..models import CustomUser, Subscription
+from ..signals import subscription_changed
 from .rating_service import UsersRating
-from .users_range_service import get_user_object
+from .user_counter_service import change_user_counter
+from .users_range_service import get_rating_cache_key, get_user_object
 from django.conf import settings
+from django.db import transaction
 import logging.config
 
 
@@ -16,38 +19,80 @@ def subscribe_user(from_user: CustomUser, to_user_username: str, action: str) ->
     Функция подписывает одного пользователя на другого или отписывает,
     в зависимости от значения 'action' (add/delete)
     и вызывает функцию изменения рейтинга.
+    Подписка создаётся и удаляется одной строкой (уникальный индекс
+    from_user, to_user), счётчики и рейтинг меняются, только если
+    строка действительно изменилась.
     Возвращает True, в случае успеха.
     """
     to_user = get_user_object(to_user_username)
-    if action == "add":
-        if from_user not in to_user.subscribers.all():
-            Subscription.objects.create(from_user=from_user, to_user=to_user)
-            RATING.incr_or_decr_rating_by_id(
-                action="add_subscriber", object_id=to_user.id
+    with transaction.atomic():
+        if action == "add":
+            _, changed = Subscription.objects.get_or_create(
+                from_user=from_user, to_user=to_user
             )
         else:
+            changed = bool(
+                Subscription.objects.filter(
+                    from_user=from_user, to_user=to_user
+                ).delete()[0]
+            )
+        if changed:
+            delta = 1 if action == "add" else -1
+            change_user_counter(from_user.id, "subscription_count", delta)
+            change_user_counter(to_user.id, "subscriber_count", delta)
+    if not changed:
+        if action == "add":
             LOGGER.warning(
                 f"can not create relation: "
                 f"user {from_user} already subscribed to {to_user}."
             )
-            return False
-    else:
-        if from_user in to_user.subscribers.all():
-            try:
-                Subscription.objects.get(from_user=from_user, to_user=to_user).delete()
-                RATING.incr_or_decr_rating_by_id(
-                    action="delete_subscriber", object_id=to_user.id
-                )
-            except Subscription.DoesNotExist:
-                LOGGER.error(
-                    f"delete subscription error from {from_user} to {to_user}."
-                    f"Relation does not exist"
-                )
-                return False
         else:
             LOGGER.warning(
                 f"can not delete relation: "
                 f"user {from_user} is not subscribed to {to_user}."
             )
-            return False
+        return False
+    RATING.incr_or_decr_rating_by_id(
+        action="add_subscriber" if action == "add" else "delete_subscriber",
+        object_id=to_user.id,
+    )
+    RATING.delete_rating_keys_for_ids(
+        get_rating_cache_key(from_user.username, "subscriptions"),
+        get_rating_cache_key(to_user.username, "subscribers"),
+    )
+    _send_subscription_changed(from_user, to_user, action)
     return True
+
+
+def get_subscribed_user_ids(user, user_ids: list) -> set:
+    """id пользователей из user_ids, на которых подписан user, одним запросом"""
+    if not user or not user.is_authenticated or not user_ids:
+        return set()
+    return set(
+        Subscription.objects.filter(
+            from_user_id=user.id, to_user_id__in=user_ids
+        ).values_list("to_user_id", flat=True)
+    )
+
+
+async def aget_subscribed_user_ids(user, user_ids: list) -> set:
+    """Асинхронная версия get_subscribed_user_ids"""
+    if not user or not user.is_authenticated or not user_ids:
+        return set()
+    return {
+        user_id
+        async for user_id in Subscription.objects.filter(
+            from_user_id=user.id, to_user_id__in=user_ids
+        ).values_list("to_user_id", flat=True)
+    }
+
+
+def _send_subscription_changed(
+    from_user: CustomUser, to_user: CustomUser, action: str
+) -> None:
+    subscription_changed.send(
+        sender=Subscription,
+        from_user_id=from_user.id,
+        to_user_id=to_user.id,
+        action=action,
+    )
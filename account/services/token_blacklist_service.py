@@ -0,0 +1,221 @@
+from .redis_service import REDIS, redis_read, redis_write
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+from typing import Iterable, Optional
+import hashlib
+import math
+import threading
+import time
+
+
+class BloomFilter:
+    """
+    Фильтр Блума на capacity строк с долей ложных срабатываний error_rate.
+    Отрицательный ответ точный, положительный нужно проверять
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hash_count = max(round(self.size / capacity * math.log(2)), 1)
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _get_positions(self, value: str) -> Iterable[int]:
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "big"), int.from_bytes(
+            digest[8:], "big"
+        )
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, value: str) -> None:
+        for position in self._get_positions(value):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._get_positions(value)
+        )
+
+
+class TokenBlacklist:
+    """
+    Чёрный список токенов в redis: ключ на каждый отозванный jti
+    с временем жизни до истечения токена.
+    Проверка сначала выполняется фильтром Блума процесса, токены,
+    которых в нём нет, в redis не проверяются. Фильтр дополняется
+    из журнала отзывов (sorted set jti по времени отзыва) не чаще
+    раза в sync_interval сек., поэтому токен, отозванный в другом
+    процессе, может ещё sync_interval сек. проходить проверку
+    """
+
+    log_key = "token_blacklist:revoked"
+    sync_interval = settings.TOKEN_BLACKLIST_SYNC_INTERVAL
+    # запас (сек.) на расхождение часов процессов при чтении журнала
+    clock_skew = 60
+
+    def __init__(
+        self,
+        capacity: int = settings.TOKEN_BLACKLIST_BLOOM_CAPACITY,
+        error_rate: float = settings.TOKEN_BLACKLIST_BLOOM_ERROR_RATE,
+    ):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._bloom = BloomFilter(capacity, error_rate)
+        # время последнего прочитанного отзыва, None - фильтр не заполнен
+        self._synced_until = None
+        self._next_sync = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(jti: str) -> str:
+        return f"token_blacklist:{jti}"
+
+    @staticmethod
+    def get_max_lifetime() -> float:
+        """Дольше этого токены не живут, старые отзывы из журнала удаляются"""
+        return max(
+            api_settings.REFRESH_TOKEN_LIFETIME,
+            api_settings.SLIDING_TOKEN_REFRESH_LIFETIME,
+        ).total_seconds()
+
+    def is_revoked(self, jti: str) -> bool:
+        """
+        Отозван ли токен. Пока фильтр ни разу не заполнен,
+        проверка выполняется в redis, если redis недоступен -
+        токен считается отозванным
+        """
+        self.sync()
+        if self._synced_until is not None and jti not in self._bloom:
+            return False
+        return self._is_revoked(jti)
+
+    def revoke(self, jti: str, exp: int) -> None:
+        with self._lock:
+            self._bloom.add(jti)
+        self._revoke(jti, exp)
+
+    @redis_write()
+    def _revoke(self, jti: str, exp: int) -> None:
+        self.add_tokens([(jti, exp)])
+
+    def add_tokens(self, tokens: Iterable[tuple]) -> int:
+        """
+        Отзывает токены (jti, exp) одним pipeline.
+        Истёкшие токены пропускаются, возвращается количество отозванных
+        """
+        now = time.time()
+        pipeline = REDIS.pipeline(transaction=False)
+        revoked = {}
+        for jti, exp in tokens:
+            if exp > now:
+                pipeline.set(self.get_key(jti), 1, ex=math.ceil(exp - now))
+                revoked[jti] = now
+        if revoked:
+            pipeline.zadd(self.log_key, revoked)
+        pipeline.zremrangebyscore(self.log_key, "-inf", now - self.get_max_lifetime())
+        pipeline.execute()
+        return len(revoked)
+
+    def sync(self) -> None:
+        """
+        Дополняет фильтр отзывами из журнала. Переполненный фильтр
+        строится заново по всему журналу, из которого сначала удаляются
+        истёкшие отзывы. Новый фильтр рассчитан на вдвое большее
+        количество отзывов, чем в журнале, но не меньше capacity
+        """
+        now = time.monotonic()
+        if now < self._next_sync or not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._next_sync = now + self.sync_interval
+            rebuild = (
+                self._synced_until is None or self._bloom.count > self._bloom.capacity
+            )
+            since = None if rebuild else self._synced_until - self.clock_skew
+            revoked = self._get_revoked_since(since)
+            if revoked is None:
+                return
+            if rebuild:
+                self._bloom = BloomFilter(
+                    max(self.capacity, 2 * len(revoked)), self.error_rate
+                )
+            for jti, revoked_at in revoked:
+                self._bloom.add(jti.decode())
+                self._synced_until = max(self._synced_until or 0, revoked_at)
+            if self._synced_until is None:
+                self._synced_until = time.time()
+        finally:
+            self._lock.release()
+
+    @redis_read(default=None)
+    def _get_revoked_since(self, since: Optional[float]) -> list:
+        """
+        [(jti, время отзыва)] отзывов позже since,
+        since=None - весь журнал без истёкших отзывов
+        """
+        if since is not None:
+            return REDIS.zrangebyscore(
+                self.log_key, f"({since}", "+inf", withscores=True
+            )
+        pipeline = REDIS.pipeline()
+        pipeline.zremrangebyscore(
+            self.log_key, "-inf", time.time() - self.get_max_lifetime()
+        )
+        pipeline.zrangebyscore(self.log_key, "-inf", "+inf", withscores=True)
+        return pipeline.execute()[1]
+
+    @redis_read(default=True)
+    def _is_revoked(self, jti: str) -> bool:
+        return bool(REDIS.exists(self.get_key(jti)))
+
+
+TOKEN_BLACKLIST = TokenBlacklist()
+
+
+def migrate_blacklisted_tokens(chunk_size: int = 10000) -> int:
+    """
+    Переносит неистёкшие токены из таблицы BlacklistedToken в redis
+    пачками по chunk_size. Возвращает количество перенесённых токенов
+    """
+    tokens = (
+        BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+        .values_list("token__jti", "token__expires_at")
+        .iterator(chunk_size=chunk_size)
+    )
+    migrated, chunk = 0, []
+    for jti, expires_at in tokens:
+        chunk.append((jti, expires_at.timestamp()))
+        if len(chunk) >= chunk_size:
+            migrated += TOKEN_BLACKLIST.add_tokens(chunk)
+            chunk = []
+    if chunk:
+        migrated += TOKEN_BLACKLIST.add_tokens(chunk)
+    return migrated
+
+
+def prune_outstanding_tokens(expired_only: bool = True, chunk_size: int = 10000) -> int:
+    """
+    Удаляет из таблиц token_blacklist истёкшие токены пачками
+    по chunk_size (expired_only=False - все токены: новые токены
+    в таблицы не записываются). Возвращает количество удалённых токенов
+    """
+    tokens = OutstandingToken.objects.order_by("id")
+    if expired_only:
+        tokens = tokens.filter(expires_at__lte=timezone.now())
+    deleted = 0
+    while True:
+        token_ids = list(tokens.values_list("id", flat=True)[:chunk_size])
+        if not token_ids:
+            break
+        BlacklistedToken.objects.filter(token_id__in=token_ids).delete()
+        OutstandingToken.objects.filter(id__in=token_ids).delete()
+        deleted += len(token_ids)
+    return deleted
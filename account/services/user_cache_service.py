@@ -0,0 +1,111 @@
+from ..models import CustomUser
+from .redis_service import REDIS, redis_read, redis_write
+from collections import OrderedDict
+from django.conf import settings
+from typing import Optional
+import copy
+import pickle
+import threading
+import time
+
+
+class UserCache:
+    """
+    Кэш пользователей, загружаемых при аутентификации по токену.
+    Пользователь хранится в LRU процесса local_timeout сек.
+    и в redis timeout сек. вместе с версией пользователя на момент
+    загрузки из БД. Любое изменение пользователя увеличивает версию,
+    и закэшированная копия перестаёт отдаваться (в других процессах -
+    после истечения local_timeout).
+    Хэш пароля в кэш не попадает: поле password отложено
+    и загружается из БД при обращении к нему
+    """
+
+    timeout = settings.AUTH_USER_CACHE_TIMEOUT
+    local_timeout = settings.AUTH_USER_LOCAL_CACHE_TIMEOUT
+
+    def __init__(self, max_size: int = settings.AUTH_USER_LOCAL_CACHE_SIZE):
+        self.max_size = max_size
+        # str(user_id): (время истечения, pickle пользователя),
+        # в токене id пользователя может быть строкой
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(user_id: int) -> str:
+        return f"auth_user:{user_id}"
+
+    @staticmethod
+    def get_version_key(user_id: int) -> str:
+        return f"auth_user:{user_id}:version"
+
+    def get(self, user_id: int) -> tuple:
+        """
+        Возвращает (пользователь или None, текущая версия пользователя),
+        версия None - пользователь взят из LRU процесса или redis недоступен.
+        Каждый вызов возвращает новый объект пользователя
+        """
+        user_id = str(user_id)
+        with self._lock:
+            expires, data = self._local.get(user_id, (0, None))
+            if data is not None and expires > time.monotonic():
+                self._local.move_to_end(user_id)
+                return pickle.loads(data), None
+        data, version = self._get_shared(user_id)
+        if data is None:
+            return None, version
+        self._set_local(user_id, data)
+        return pickle.loads(data), version
+
+    def set(self, user: CustomUser, version: Optional[bytes]) -> None:
+        """Сохраняет пользователя с версией, прочитанной до загрузки из БД"""
+        user = copy.copy(user)
+        user.__dict__.pop("password", None)
+        data = pickle.dumps(user)
+        self._set_local(str(user.id), data)
+        self._set_shared(user.id, data, version)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._local.pop(str(user_id), None)
+        self._invalidate_shared(user_id)
+
+    def _set_local(self, user_id: str, data: bytes) -> None:
+        with self._lock:
+            self._local[user_id] = (time.monotonic() + self.local_timeout, data)
+            self._local.move_to_end(user_id)
+            if len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+
+    @redis_read(default=(None, None))
+    def _get_shared(self, user_id: int) -> tuple:
+        """(pickle пользователя или None, текущая версия)"""
+        version, value = REDIS.mget(
+            self.get_version_key(user_id), self.get_key(user_id)
+        )
+        version = version or b"0"
+        if value is None:
+            return None, version
+        value_version, _, data = value.partition(b":")
+        return (data if value_version == version else None), version
+
+    @redis_write(retry=False)
+    def _set_shared(self, user_id: int, data: bytes, version: Optional[bytes]) -> None:
+        if version is None:
+            return
+        REDIS.set(self.get_key(user_id), version + b":" + data, ex=self.timeout)
+
+    @redis_write()
+    def _invalidate_shared(self, user_id: int) -> None:
+        pipeline = REDIS.pipeline()
+        pipeline.incr(self.get_version_key(user_id))
+        pipeline.delete(self.get_key(user_id))
+        pipeline.execute()
+
+
+USER_CACHE = UserCache()
+
+
+def invalidate_cached_user(user_id: int) -> None:
+    """Сбрасывает закэшированного пользователя после его изменения"""
+    USER_CACHE.invalidate(user_id)
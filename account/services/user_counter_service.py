@@ -0,0 +1,22 @@
+from ..models import CustomUser
+from django.conf import settings
+from django.db.models import F
+import logging.config
+
+
+logging.config.dictConfig(settings.LOGGING)
+LOGGER = logging.getLogger("account_logger")
+
+USER_COUNTERS = ("subscription_count", "subscriber_count", "article_count")
+
+
+def change_user_counter(user_id: int, counter: str, delta: int) -> None:
+    """
+    Атомарно изменяет счётчик пользователя
+    (subscription_count/subscriber_count/article_count)
+    на delta одним UPDATE без чтения строки
+    """
+    if counter not in USER_COUNTERS:
+        LOGGER.error(f"unknown user counter {counter}")
+        raise ValueError(f"unknown user counter {counter}")
+    CustomUser.objects.filter(id=user_id).update(**{counter: F(counter) + delta})
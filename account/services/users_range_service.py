@@ -1,15 +1,30 @@
 from ..models import CustomUser
-from .rating_service import UsersRating
+from .rating_service import SortedRatingList, UsersRating
+from .redis_service import REDIS_BREAKER
 from django.conf import settings
 from django.db.models.query import QuerySet
-from django.db.models import Count
 from django.http import Http404
+from typing import Union
 import logging.config
+import redis
 
 
 logging.config.dictConfig(settings.LOGGING)
 LOGGER = logging.getLogger("account_logger")
 
+USERS_RATING = UsersRating()
+
+
+class SortedUserList(SortedRatingList):
+    """Ленивый список пользователей, упорядоченный по рейтингу в redis"""
+
+    rating = USERS_RATING
+
+    def _get_objects_by_ids(self, user_ids: list) -> list:
+        """Пользователи из БД в порядке user_ids"""
+        users = CustomUser.objects.in_bulk(user_ids)
+        return [users[user_id] for user_id in user_ids if user_id in users]
+
 
 def get_user_object(username: str) -> CustomUser:
     """Получаем пользователя по имени"""
@@ -33,62 +48,76 @@ def get_filtered_user_list(username: str, filter_by: str) -> QuerySet[CustomUser
     if filter_by in settings.USER_FILTER_LIST:
         if filter_by == "subscriptions":
             user = get_user_object(username)
-            return user.subscriptions.prefetch_related("articles").all()
+            return user.subscriptions.all()
         elif filter_by == "subscribers":
             user = get_user_object(username)
-            return user.subscribers.prefetch_related("articles").all()
+            return user.subscribers.all()
         elif filter_by == "all":
-            return CustomUser.objects.prefetch_related("articles").exclude(
-                username=username
-            )
+            return CustomUser.objects.exclude(username=username)
     LOGGER.error(f"unknown filter {filter_by}")
-    return CustomUser.objects.prefetch_related("articles").exclude(username=username)
+    return CustomUser.objects.exclude(username=username)
 
 
-def _get_order_by_rating(user_list: QuerySet[CustomUser]) -> list:
-    """Возвращает список пользователей, отсортированный по рейтингу"""
-    user_list = list(user_list)
-    rating = UsersRating()
-    users_sorted_by_rating_ids = [
-        int(user_id) for user_id in rating.get_range_list_by_rating()
-    ]
-    try:
-        user_list.sort(key=lambda user: users_sorted_by_rating_ids.index(user.id))
-    except ValueError as e:
-        LOGGER.warning(
-            f"Rating sort error of user list {user_list}. Some users have not rating"
+def _get_order_by_rating(username: str, filter_by: str) -> SortedUserList:
+    """
+    Возвращает список пользователей, отсортированный по рейтингу.
+    Все пользователи читаются окном из общего рейтинга, подписки
+    и подписчики - из рейтинга, отфильтрованного по их id.
+    Отфильтрованный рейтинг кэшируется и сбрасывается при изменении подписок
+    """
+    if filter_by in ("subscriptions", "subscribers"):
+        user_ids = (
+            get_filtered_user_list(username, filter_by)
+            .values_list("id", flat=True)
+            .iterator()
         )
-    return user_list
+        return SortedUserList(
+            USERS_RATING.get_rating_key_for_ids(
+                user_ids, cache_key=get_rating_cache_key(username, filter_by)
+            )
+        )
+    if filter_by != "all":
+        LOGGER.error(f"unknown filter {filter_by}")
+    user_id = (
+        CustomUser.objects.filter(username=username)
+        .values_list("id", flat=True)
+        .first()
+    )
+    return SortedUserList(USERS_RATING.redis_key, exclude_id=user_id)
+
+
+def get_rating_cache_key(username: str, filter_by: str) -> str:
+    """Ключ кэша рейтинга подписок или подписчиков пользователя"""
+    return f"{filter_by}:{username}"
 
 
 def _get_order_by_article_count(
     user_list: QuerySet[CustomUser],
 ) -> QuerySet[CustomUser]:
-    """Возвращает список пользователей, отсортированный по количеству постов"""
-    return user_list.annotate(articles_count=Count("articles")).order_by(
-        "-articles_count"
-    )
+    """
+    Возвращает список пользователей, отсортированный по количеству постов
+    (счётчик article_count, индекс user_article_count_idx)
+    """
+    return user_list.order_by("-article_count", "id")
 
 
-def _get_sorted_user_list(user_list: QuerySet[CustomUser], order_by: str):
+def get_filtered_and_sorted_user_list(
+    username: str, filter_by: str = "all", order_by: str = "rating"
+) -> Union[QuerySet[CustomUser], SortedUserList]:
     """
-    Получаем отсортированный qs пользователей
+    Вызывает функции фильтрации и сортировки пользователей
     Значения order_by:
         'rating' - сортировать по рейтингу;
         'article_count' - сортировать по количеству постов.
+    Если redis недоступен или при чтении из него произошла ошибка,
+    рейтинг заменяется количеством постов
     """
-    if order_by in settings.USER_ORDER_LIST:
-        if order_by == "article_count":
-            return _get_order_by_article_count(user_list)
-        if order_by == "rating":
-            return _get_order_by_rating(user_list)
-    LOGGER.error(f"unknown order {order_by}")
-    return _get_order_by_rating(user_list)
-
-
-def get_filtered_and_sorted_user_list(
-    username: str, filter_by: str = "all", order_by: str = "rating"
-) -> QuerySet[CustomUser]:
-    """Вызывает функции фильтрации и сортировки пользователей"""
-    users = get_filtered_user_list(username, filter_by)
-    return _get_sorted_user_list(users, order_by)
+    if order_by != "article_count" and REDIS_BREAKER.is_available():
+        if order_by not in settings.USER_ORDER_LIST:
+            LOGGER.error(f"unknown order {order_by}")
+        try:
+            return _get_order_by_rating(username, filter_by)
+        except redis.RedisError as e:
+            LOGGER.error(f"user list redis error: {e}")
+            REDIS_BREAKER.record_failure(e)
+    return _get_order_by_article_count(get_filtered_user_list(username, filter_by))
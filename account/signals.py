@@ -0,0 +1,47 @@
+from .models import CustomUser
+from .services.rating_service import UsersRating
+from .services.user_cache_service import invalidate_cached_user
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+
+# отправляется после создания или удаления подписки с аргументами
+# from_user_id, to_user_id и action ("add"/"delete")
+subscription_changed = Signal()
+
+USERS_RATING = UsersRating()
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_cached_user_on_change(sender, instance, **kwargs):
+    """
+    Пароль, активность и профиль пользователя меняются через save(),
+    закэшированная для аутентификации копия сбрасывается после коммита,
+    чтобы параллельный запрос не закэшировал её заново до коммита
+    """
+    if kwargs.get("created"):
+        return
+    user_id = instance.id
+    transaction.on_commit(lambda: invalidate_cached_user(user_id))
+
+
+@receiver(post_save, sender=CustomUser)
+def init_user_rating_on_create(sender, instance, created, **kwargs):
+    """
+    Пользователь попадает в рейтинг при создании любым способом
+    (регистрация, create_user, createsuperuser, админка)
+    """
+    if created:
+        user_id = instance.id
+        transaction.on_commit(
+            lambda: USERS_RATING.incr_or_decr_rating_by_id("init", user_id)
+        )
+
+
+@receiver(post_delete, sender=CustomUser)
+def clear_user_rating_on_delete(sender, instance, **kwargs):
+    """Удалённый пользователь не должен учитываться в количестве рейтинга"""
+    user_id = instance.id
+    transaction.on_commit(lambda: USERS_RATING.clear_rating_by_id(user_id))
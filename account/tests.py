@@ -1,3 +1,601 @@
-from django.test import TestCase
+from .models import CustomUser
+from .serializers import UserListSerializer
+from .services import redis_service
+from .services.rating_service import UsersRating
+from .services.token_blacklist_service import (
+    TOKEN_BLACKLIST,
+    BloomFilter,
+    TokenBlacklist,
+)
+from .services.user_cache_service import USER_CACHE
+from .services.users_range_service import SortedUserList
+from .tokens import RefreshToken
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+from rest_framework_simplejwt.tokens import AccessToken
+from unittest import mock
+import asyncio
+import fakeredis
+import io
+import pickle
+import redis
+import threading
+import time
 
-# Create your tests here.
+
+class RedisTestCase(TestCase):
+    """
+    Тест с redis в памяти процесса (fakeredis, скрипты Lua выполняет lupa).
+    Клиенты REDIS и ASYNC_REDIS подключаются к новому серверу на каждый
+    тест, выключатель, очередь повтора и кэши процесса сбрасываются.
+    set_redis_available(False) имитирует недоступный redis
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.redis_server = fakeredis.FakeServer()
+        pool = redis.ConnectionPool(
+            connection_class=fakeredis.FakeConnection, server=self.redis_server
+        )
+        self.redis = redis.StrictRedis(connection_pool=pool)
+        breaker = redis_service.REDIS_BREAKER
+        retry_queue = redis_service.REDIS_RETRY_QUEUE
+        for patcher in (
+            mock.patch.object(redis_service.REDIS, "connection_pool", pool),
+            mock.patch.object(redis_service.ASYNC_REDIS, "_clients", {}),
+            mock.patch.object(
+                redis_service.ASYNC_REDIS,
+                "_create_client",
+                lambda: fakeredis.FakeAsyncRedis(server=self.redis_server),
+            ),
+            mock.patch.object(breaker, "_failures", 0),
+            mock.patch.object(breaker, "_opened_at", None),
+            mock.patch.object(
+                retry_queue, "_calls", deque(maxlen=retry_queue._calls.maxlen)
+            ),
+            mock.patch.object(retry_queue, "replay_in_background", retry_queue.replay),
+            mock.patch.object(redis_service.STALE_VALUES, "_values", OrderedDict()),
+            mock.patch.object(USER_CACHE, "_local", OrderedDict()),
+            mock.patch.object(
+                TOKEN_BLACKLIST,
+                "_bloom",
+                BloomFilter(TOKEN_BLACKLIST.capacity, TOKEN_BLACKLIST.error_rate),
+            ),
+            mock.patch.object(TOKEN_BLACKLIST, "_synced_until", None),
+            mock.patch.object(TOKEN_BLACKLIST, "_next_sync", 0),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def set_redis_available(self, available: bool) -> None:
+        self.redis_server.connected = available
+        breaker = redis_service.REDIS_BREAKER
+        if available and breaker._opened_at is not None:
+            # пробное обращение пропускается без ожидания reset_timeout
+            breaker._opened_at = time.monotonic() - breaker.reset_timeout
+
+    def open_breaker(self) -> None:
+        """Недоступный redis после failure_threshold ошибок подряд"""
+        self.set_redis_available(False)
+        breaker = redis_service.REDIS_BREAKER
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure(redis.ConnectionError("connection refused"))
+
+    @contextmanager
+    def record_round_trips(self):
+        """
+        Обращения клиента REDIS к redis: список команд каждого
+        обращения (одна команда или pipeline)
+        """
+        round_trips = []
+        execute_command = redis.Redis.execute_command
+        execute = redis.client.Pipeline.execute
+
+        def record_command(client, *args, **options):
+            round_trips.append([args[0]])
+            return execute_command(client, *args, **options)
+
+        def record_pipeline(pipe, *args, **kwargs):
+            round_trips.append([command[0][0] for command in pipe.command_stack])
+            return execute(pipe, *args, **kwargs)
+
+        with mock.patch.object(
+            redis.Redis, "execute_command", record_command
+        ), mock.patch.object(redis.client.Pipeline, "execute", record_pipeline):
+            yield round_trips
+
+    def create_user(self, username: str, **kwargs) -> CustomUser:
+        """Пользователь с рейтингом (рейтинг заводится после коммита)"""
+        with self.captureOnCommitCallbacks(execute=True):
+            return CustomUser.objects.create_user(
+                username, f"{username}@example.com", "password", **kwargs
+            )
+
+
+class RatingPositionTest(RedisTestCase):
+    """Позиция после курсора (рейтинг, id) в рейтинге с одинаковыми значениями"""
+
+    def setUp(self):
+        super().setUp()
+        self.rating = UsersRating()
+        self.redis.zadd(
+            self.rating.redis_key,
+            {1: 10, 2: 10, 3: 5, 11: 10, 12: 5, 21: 5, 30: 0, 31: 0},
+        )
+        self.members = [
+            (int(member), score)
+            for member, score in self.redis.zrevrange(
+                self.rating.redis_key, 0, -1, withscores=True
+            )
+        ]
+
+    def test_position_after_each_member(self):
+        for position, (member, score) in enumerate(self.members):
+            self.assertEqual(
+                self.rating.get_position_after(member, score), position + 1
+            )
+
+    def test_position_after_removed_member(self):
+        member, score = self.members[2]
+        self.redis.zrem(self.rating.redis_key, member)
+        self.assertEqual(self.rating.get_position_after(member, score), 2)
+
+    def test_position_after_member_with_changed_rating(self):
+        member, score = self.members[4]
+        self.redis.zincrby(self.rating.redis_key, 100, member)
+        self.assertEqual(self.rating.get_position_after(member, score), 5)
+
+    def test_keyset_pages_keep_ties_in_order(self):
+        users = {
+            user.id: user for user in [self.create_user(f"user{i}") for i in range(6)]
+        }
+        self.redis.delete(self.rating.redis_key)
+        self.redis.zadd(self.rating.redis_key, dict.fromkeys(users, 0))
+        user_list = SortedUserList(self.rating.redis_key)
+        position, walked = None, []
+        while True:
+            page, position = user_list.get_keyset_page(position, 4)
+            walked += [user.id for user in page]
+            if position is None:
+                break
+            self.redis.zincrby(self.rating.redis_key, 10, position[1])
+        expected = [int(member) for member in sorted(map(str, users), reverse=True)]
+        self.assertEqual(walked, expected)
+
+
+class SubscriptionTest(RedisTestCase):
+    """Подписки: счётчики пользователей и рейтинг меняются один раз"""
+
+    def setUp(self):
+        super().setUp()
+        self.alice = self.create_user("alice")
+        self.bob = self.create_user("bob")
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def subscribe(self, username: str, action: str) -> int:
+        return self.client.post(
+            f"/api/accounts/profile/{username}/subscribe/", {"action": action}
+        ).status_code
+
+    def get_counters(self) -> tuple:
+        self.alice.refresh_from_db()
+        self.bob.refresh_from_db()
+        return (
+            self.alice.subscription_count,
+            self.bob.subscriber_count,
+            self.redis.zscore("user_rating", self.bob.id),
+        )
+
+    def test_subscribe_and_unsubscribe(self):
+        rating = settings.USER_RATING_BY_ACTION["add_subscriber"]
+        self.assertEqual(self.subscribe("bob", "add"), 200)
+        self.assertEqual(self.subscribe("bob", "add"), 400)
+        self.assertEqual(self.get_counters(), (1, 1, rating))
+        self.assertEqual(self.subscribe("bob", "delete"), 200)
+        self.assertEqual(self.subscribe("bob", "delete"), 400)
+        self.assertEqual(self.get_counters(), (0, 0, 0))
+
+    def test_subscribe_to_missing_user(self):
+        self.assertEqual(self.subscribe("nobody", "add"), 404)
+        self.assertEqual(self.get_counters(), (0, 0, 0))
+
+    def test_is_subscription_is_loaded_in_one_query_per_page(self):
+        self.subscribe("bob", "add")
+        users = [self.bob] + [self.create_user(f"user{i}") for i in range(5)]
+        expected = [True] + [False] * 5
+        for user, query_count, values in [
+            (AnonymousUser(), 0, [False] * 6),
+            (self.alice, 1, expected),
+            (self.bob, 1, [False] * 6),
+        ]:
+            serializer = UserListSerializer(
+                users, many=True, context={"request": mock.Mock(user=user)}
+            )
+            with self.assertNumQueries(query_count):
+                data = serializer.data
+            self.assertEqual([item["is_subscription"] for item in data], values)
+        response = self.client.get("/api/accounts/user-list/?filter=all&limit=100")
+        self.assertEqual(
+            {
+                user["username"]: user["is_subscription"]
+                for user in response.json()["results"]
+            },
+            {user.username: value for user, value in zip(users, expected)},
+        )
+
+
+class UserListTest(RedisTestCase):
+    """Список пользователей по рейтингу и количеству постов"""
+
+    def setUp(self):
+        super().setUp()
+        self.alice = self.create_user("alice")
+        self.bob = self.create_user("bob")
+        self.carol = self.create_user("carol")
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def get_page(self, query: str) -> tuple:
+        response = self.client.get(f"/api/accounts/user-list/?{query}")
+        self.assertEqual(response.status_code, 200, response.content)
+        return (
+            response.json()["count"],
+            [user["username"] for user in response.json()["results"]],
+        )
+
+    def test_users_created_without_registration_are_rated(self):
+        self.client.post("/api/accounts/profile/carol/subscribe/", {"action": "add"})
+        self.assertEqual(
+            self.get_page("filter=all&order=rating"), (2, ["carol", "bob"])
+        )
+        self.assertEqual(
+            self.get_page("filter=subscriptions&order=rating"), (1, ["carol"])
+        )
+
+    def test_subscription_list_is_reset_on_subscribe(self):
+        self.client.post("/api/accounts/profile/bob/subscribe/", {"action": "add"})
+        self.assertEqual(
+            self.get_page("filter=subscriptions&order=rating"), (1, ["bob"])
+        )
+        self.client.post("/api/accounts/profile/carol/subscribe/", {"action": "add"})
+        self.client.post("/api/accounts/profile/carol/subscribe/", {"action": "add"})
+        self.client.post("/api/accounts/profile/bob/subscribe/", {"action": "delete"})
+        self.assertEqual(
+            self.get_page("filter=subscriptions&order=rating"), (1, ["carol"])
+        )
+        self.assertEqual(
+            self.get_page("filter=subscribers&order=rating&username=carol"),
+            (1, ["alice"]),
+        )
+
+    def test_order_by_article_count(self):
+        CustomUser.objects.filter(id=self.carol.id).update(article_count=2)
+        CustomUser.objects.filter(id=self.bob.id).update(article_count=1)
+        self.assertEqual(
+            self.get_page("filter=all&order=article_count"), (2, ["carol", "bob"])
+        )
+
+    def test_page_ratings_are_read_in_one_round_trip(self):
+        for query in ("filter=all&order=rating", "filter=all&order=article_count"):
+            with self.record_round_trips() as round_trips:
+                self.assertEqual(len(self.get_page(query)[1]), 2)
+            self.assertEqual(
+                [commands for commands in round_trips if "ZMSCORE" in commands],
+                [["ZMSCORE"]],
+            )
+
+    def test_deleted_user_is_removed_from_rating(self):
+        bob_id = self.bob.id
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bob.delete()
+        self.assertIsNone(self.redis.zscore("user_rating", bob_id))
+        self.assertEqual(self.get_page("filter=all&order=rating"), (1, ["carol"]))
+
+
+class RedisBreakerTest(RedisTestCase):
+    """Выключатель, запасные значения чтений и очередь повтора записей"""
+
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+
+    @redis_service.redis_read(default="default", stale=True)
+    def read(self, key: str):
+        self.calls.append(("read", key))
+        return self.redis.get(key)
+
+    @redis_service.redis_write()
+    def write(self, value: int) -> None:
+        self.calls.append(("write", value))
+        if value < 0:
+            raise ValueError(value)
+        self.redis.rpush("values", value)
+
+    def get_values(self) -> list:
+        return [int(value) for value in self.redis.lrange("values", 0, -1)]
+
+    def test_breaker_opens_after_failure_threshold(self):
+        self.set_redis_available(False)
+        for _ in range(redis_service.REDIS_BREAKER.failure_threshold):
+            self.assertEqual(self.read("key"), "default")
+        self.assertFalse(redis_service.REDIS_BREAKER.is_available())
+        self.calls.clear()
+        self.assertEqual(self.read("key"), "default")
+        self.assertEqual(self.calls, [])
+        self.set_redis_available(True)
+        self.assertIsNone(self.read("key"))
+        self.assertTrue(redis_service.REDIS_BREAKER.is_available())
+
+    def test_stale_value_is_returned_while_redis_is_unavailable(self):
+        self.redis.set("key", "value")
+        self.assertEqual(self.read("key"), b"value")
+        self.open_breaker()
+        self.assertEqual(self.read("key"), b"value")
+        self.assertEqual(self.read("other"), "default")
+
+    def test_writes_are_replayed_in_order_after_recovery(self):
+        self.open_breaker()
+        for value in (1, -1, 2):
+            self.write(value)
+        self.assertEqual(len(redis_service.REDIS_RETRY_QUEUE), 3)
+        self.set_redis_available(True)
+        with self.assertLogs("account_logger", "ERROR") as logs:
+            self.read("key")
+        self.assertEqual(self.get_values(), [1, 2])
+        self.assertEqual(len(redis_service.REDIS_RETRY_QUEUE), 0)
+        self.assertIn("replay failed, write lost", logs.output[0])
+
+    def test_replay_stops_while_redis_is_unavailable(self):
+        self.open_breaker()
+        self.write(1)
+        self.write(2)
+        redis_service.REDIS_RETRY_QUEUE.replay()
+        self.assertEqual(len(redis_service.REDIS_RETRY_QUEUE), 2)
+        self.set_redis_available(True)
+        redis_service.REDIS_RETRY_QUEUE.replay()
+        self.assertEqual(self.get_values(), [1, 2])
+
+    def test_replay_in_background(self):
+        retry_queue = redis_service.RedisRetryQueue(max_size=2)
+        for value in (1, 2, 3):
+            retry_queue.put(self.write, (value,), {})
+        retry_queue.replay_in_background()
+        for thread in threading.enumerate():
+            if thread.name == "redis-retry-queue":
+                thread.join()
+        # при переполнении теряются самые старые записи
+        self.assertEqual(self.get_values(), [2, 3])
+        self.assertFalse(retry_queue._replaying)
+
+    def test_user_list_is_ordered_by_article_count(self):
+        client = APIClient()
+        client.force_authenticate(self.create_user("alice"))
+        bob = self.create_user("bob", article_count=1)
+        self.create_user("carol", article_count=2)
+        self.redis.zincrby("user_rating", 100, bob.id)
+        self.open_breaker()
+        response = client.get("/api/accounts/user-list/?filter=all&order=rating")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(
+            [user["username"] for user in response.json()["results"]], ["carol", "bob"]
+        )
+
+    def test_redis_errors_open_breaker_on_user_list(self):
+        client = APIClient()
+        client.force_authenticate(self.create_user("alice"))
+        self.create_user("bob", article_count=1)
+        self.create_user("carol", article_count=2)
+        # redis недоступен, но выключатель ещё не разомкнут
+        self.set_redis_available(False)
+        breaker = redis_service.REDIS_BREAKER
+        for _ in range(breaker.failure_threshold):
+            response = client.get("/api/accounts/user-list/?filter=all&order=rating")
+            self.assertEqual(response.status_code, 200, response.content)
+        self.assertFalse(breaker.is_available())
+        response = client.get("/api/accounts/user-list/?filter=all&order=rating")
+        self.assertEqual(
+            [user["username"] for user in response.json()["results"]], ["carol", "bob"]
+        )
+
+
+class AsyncRedisClientsTest(RedisTestCase):
+    """Клиент redis.asyncio и асинхронный список пользователей"""
+
+    def test_each_event_loop_has_own_client(self):
+        clients = redis_service.ASYNC_REDIS
+
+        async def get_clients():
+            await clients.ping()
+            return clients.get_client(), clients.get_client()
+
+        first, same = asyncio.run(get_clients())
+        second, _ = asyncio.run(get_clients())
+        self.assertIs(first, same)
+        self.assertIsNot(first, second)
+        # клиент закрытого loop удалён при создании нового
+        self.assertEqual(list(clients._clients.values()), [second])
+
+    @override_settings(REDIS_HIREDIS=False)
+    def test_python_parser_without_hiredis(self):
+        for client in (redis, redis.asyncio):
+            pool = redis_service._get_connection_pool(client)
+            parser = pool.connection_kwargs["parser_class"]
+            self.assertFalse(parser.__name__.lower().endswith("hiredisparser"))
+            # пул создаёт соединение с этим разборщиком ответов
+            pool.make_connection()
+
+    def test_async_user_list(self):
+        alice = self.create_user("alice")
+        bob = self.create_user("bob")
+        self.create_user("carol")
+        self.redis.zincrby("user_rating", 10, bob.id)
+        client = APIClient()
+        client.force_authenticate(alice)
+        client.post("/api/accounts/profile/carol/subscribe/", {"action": "add"})
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(alice)}")
+        for query in ("?filter=all&order=rating", "?filter=subscriptions&limit=1"):
+            response = client.get(f"/api/accounts/async/user-list/{query}")
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(
+                response.json(),
+                client.get(f"/api/accounts/user-list/{query}").json(),
+            )
+        response = client.get("/api/accounts/async/user-list/?filter=all")
+        self.assertEqual(
+            [
+                (user["username"], user["user_rating"], user["is_subscription"])
+                for user in response.json()["results"]
+            ],
+            [("carol", 10, True), ("bob", 10, False)],
+        )
+
+
+class UserCacheTest(RedisTestCase):
+    """Пользователь аутентификации JWT из кэша процесса и redis"""
+
+    def setUp(self):
+        super().setUp()
+        self.alice = self.create_user("alice")
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.alice)}"
+        )
+
+    def get_status(self) -> int:
+        return self.client.get("/api/accounts/user-list/").status_code
+
+    def deactivate_in_db(self) -> None:
+        """Изменение в обход сигналов, кэш о нём не знает"""
+        CustomUser.objects.filter(id=self.alice.id).update(is_active=False)
+
+    def test_cached_user_is_reset_on_change(self):
+        self.assertEqual(self.get_status(), 200)
+        self.deactivate_in_db()
+        self.assertEqual(self.get_status(), 200)
+        # копия из redis, LRU процесса пуст
+        USER_CACHE._local.clear()
+        self.assertEqual(self.get_status(), 200)
+        cached = self.redis.get(USER_CACHE.get_key(self.alice.id))
+        cached_user = pickle.loads(cached.partition(b":")[2])
+        self.assertNotIn("password", cached_user.__dict__)
+        self.alice.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.save()
+        self.assertEqual(self.get_status(), 401)
+
+    def test_user_is_loaded_from_db_without_redis(self):
+        self.open_breaker()
+        self.assertEqual(self.get_status(), 200)
+        self.deactivate_in_db()
+        USER_CACHE._local.clear()
+        self.assertEqual(self.get_status(), 401)
+
+
+class TokenBlacklistTest(RedisTestCase):
+    """Чёрный список refresh токенов в redis за фильтром Блума"""
+
+    def setUp(self):
+        super().setUp()
+        self.alice = self.create_user("alice")
+        self.client = APIClient()
+
+    def login(self) -> str:
+        response = self.client.post(
+            "/api/accounts/auth/token/login/",
+            {"username": "alice", "password": "password"},
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()["refresh"]
+
+    def refresh(self, refresh: str) -> int:
+        return self.client.post(
+            "/api/accounts/auth/token/refresh/", {"refresh": refresh}
+        ).status_code
+
+    def logout(self, refresh: str) -> int:
+        return self.client.post(
+            "/api/accounts/auth/token/logout/", {"refresh": refresh}
+        ).status_code
+
+    def test_logout_revokes_refresh_token(self):
+        refresh, other = self.login(), self.login()
+        self.assertEqual(self.refresh(refresh), 200)
+        self.assertEqual(self.logout(refresh), 200)
+        self.assertEqual(self.refresh(refresh), 401)
+        self.assertEqual(self.logout(refresh), 401)
+        self.assertEqual(self.refresh(other), 200)
+        self.assertFalse(OutstandingToken.objects.exists())
+        self.assertEqual(self.redis.zcard(TOKEN_BLACKLIST.log_key), 1)
+
+    def test_token_revoked_in_other_process_is_rejected(self):
+        refresh = self.login()
+        jti = RefreshToken(refresh)["jti"]
+        other_process = TokenBlacklist()
+        self.assertFalse(other_process.is_revoked(jti))
+        self.assertEqual(self.logout(refresh), 200)
+        other_process._next_sync = 0
+        self.assertTrue(other_process.is_revoked(jti))
+
+    def test_rebuilt_filter_is_sized_from_log(self):
+        now = time.time()
+        expired = now - TOKEN_BLACKLIST.get_max_lifetime() - 1
+        self.redis.zadd(
+            TOKEN_BLACKLIST.log_key,
+            {**{f"jti-{i}": now for i in range(10)}, "jti-expired": expired},
+        )
+        blacklist = TokenBlacklist(capacity=4, error_rate=0.01)
+        blacklist.sync()
+        self.assertEqual(self.redis.zcard(TOKEN_BLACKLIST.log_key), 10)
+        self.assertEqual(blacklist._bloom.capacity, 20)
+        self.assertTrue(all(f"jti-{i}" in blacklist._bloom for i in range(10)))
+        # фильтр не переполнен и дополняется, а не строится заново
+        bloom = blacklist._bloom
+        self.redis.zadd(TOKEN_BLACKLIST.log_key, {"jti-new": time.time()})
+        blacklist._next_sync = 0
+        blacklist.sync()
+        self.assertIs(blacklist._bloom, bloom)
+        self.assertIn("jti-new", bloom)
+
+    def test_tokens_without_redis(self):
+        refresh = self.login()
+        self.assertEqual(self.refresh(refresh), 200)
+        self.open_breaker()
+        # фильтр заполнен, токена в нём нет - redis не нужен
+        self.assertEqual(self.refresh(refresh), 200)
+        # фильтр не заполнен - токен считается отозванным
+        self.assertTrue(TokenBlacklist().is_revoked(RefreshToken(refresh)["jti"]))
+
+    def test_migrate_blacklisted_tokens(self):
+        now = timezone.now()
+        for jti, expires_at in (
+            ("jti-revoked", now + timedelta(hours=1)),
+            ("jti-expired", now - timedelta(hours=1)),
+        ):
+            token = OutstandingToken.objects.create(
+                jti=jti, token=jti, expires_at=expires_at
+            )
+            BlacklistedToken.objects.create(token=token)
+        OutstandingToken.objects.create(
+            jti="jti-active", token="jti-active", expires_at=now + timedelta(hours=1)
+        )
+        out = io.StringIO()
+        call_command("migrate_token_blacklist", stdout=out)
+        self.assertIn("Перенесено в redis: 1, удалено из таблиц: 1", out.getvalue())
+        self.assertTrue(self.redis.exists(TOKEN_BLACKLIST.get_key("jti-revoked")))
+        self.assertFalse(self.redis.exists(TOKEN_BLACKLIST.get_key("jti-expired")))
+        self.assertEqual(
+            list(OutstandingToken.objects.order_by("id").values_list("jti", flat=True)),
+            ["jti-revoked", "jti-active"],
+        )
@@ -0,0 +1,33 @@
+from .services.token_blacklist_service import TOKEN_BLACKLIST
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+
+class RefreshToken(tokens.RefreshToken):
+    """
+    Refresh токен с чёрным списком в redis (TOKEN_BLACKLIST) вместо
+    таблиц приложения token_blacklist: выданные токены не записываются
+    в OutstandingToken, отозванные - в BlacklistedToken
+    """
+
+    def verify(self, *args, **kwargs) -> None:
+        self.check_blacklist()
+        super(tokens.BlacklistMixin, self).verify(*args, **kwargs)
+
+    def check_blacklist(self) -> None:
+        if TOKEN_BLACKLIST.is_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self) -> None:
+        TOKEN_BLACKLIST.revoke(
+            self.payload[api_settings.JTI_CLAIM], self.payload["exp"]
+        )
+
+    def outstand(self) -> None:
+        return None
+
+    @classmethod
+    def for_user(cls, user) -> "RefreshToken":
+        return super(tokens.BlacklistMixin, cls).for_user(user)
@@ -1,6 +1,7 @@
 from . import views
 from django.urls import path
 from rest_framework_simplejwt.views import (
+    TokenBlacklistView,
     TokenObtainPairView,
     TokenRefreshView,
 )
@@ -14,6 +15,7 @@ urlpatterns = [
     ),
     path("auth/token/login/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("auth/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
+    path("auth/token/logout/", TokenBlacklistView.as_view(), name="token_blacklist"),
     path(
         "password-reset/email/",
         views.PasswordResetEmailView.as_view(),
@@ -35,6 +37,11 @@ urlpatterns = [
         name="profile",
     ),
     path("user-list/", views.UserListView.as_view(), name="user_list"),
+    path(
+        "async/user-list/",
+        views.UserListAsyncView.as_view(),
+        name="user_list_async",
+    ),
     path(
         "profile/<str:username>/subscribe/",
         views.SubscriptionUserView.as_view(),
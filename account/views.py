@@ -10,15 +10,19 @@ from .services.auth_service import (
     send_confirm_password_reset_email,
     check_confirm_reset_data,
 )
-from .services.subscription_service import subscribe_user
+from .services.subscription_service import aget_subscribed_user_ids, subscribe_user
 from .services.users_range_service import (
+    USERS_RATING,
     get_filtered_and_sorted_user_list,
     get_user_object,
 )
+from .views_async import AsyncAPIView
+from asgiref.sync import sync_to_async
 from rest_framework import generics, status
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
+import asyncio
 
 
 class UserRegistrationView(generics.CreateAPIView):
@@ -45,6 +49,43 @@ class UserListView(generics.ListAPIView):
         return users
 
 
+class UserListAsyncView(AsyncAPIView):
+    """
+    Асинхронное отображение списка пользователей (ASGI).
+    Рейтинги пользователей страницы читаются из redis
+    одновременно с подписками на них из БД
+    """
+
+    permission_classes = UserListView.permission_classes
+
+    async def get(self, request):
+        limit, offset = self.get_limit_and_offset(request)
+        users = await sync_to_async(get_filtered_and_sorted_user_list)(
+            request.GET.get("username") or request.user.username,
+            request.GET.get("filter"),
+            request.GET.get("order"),
+        )
+        count, page = await self.get_page(users, limit, offset)
+        user_ids = [user.id for user in page]
+        user_ratings, subscription_ids = await asyncio.gather(
+            USERS_RATING.aget_rating_by_ids(user_ids),
+            aget_subscribed_user_ids(request.user, user_ids),
+        )
+        serializer = UserListSerializer(
+            page,
+            many=True,
+            context={
+                "request": request,
+                "user_ratings": user_ratings,
+                "subscription_ids": subscription_ids,
+                "subscription_checked_ids": set(user_ids),
+            },
+        )
+        return self.get_json_response(
+            self.get_paginated_data(request, count, limit, offset, serializer.data)
+        )
+
+
 class ProfileDetailUpdateView(generics.RetrieveUpdateAPIView):
     """Отображение и изменение информации о пользователе"""
 
@@ -0,0 +1,154 @@
+from .authentication import CachedJWTAuthentication
+from .services.rating_service import SortedRatingList
+from asgiref.sync import sync_to_async
+from collections import OrderedDict
+from django.contrib.auth.models import AnonymousUser
+from django.db.models.query import QuerySet
+from django.http import Http404, HttpResponse
+from django.views import View
+from rest_framework.exceptions import APIException, NotAuthenticated, PermissionDenied
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from typing import Optional, Union
+import asyncio
+
+
+class AsyncAPIView(View):
+    """
+    Базовое асинхронное представление для чтения (GET).
+    Аутентификация JWT и разрешения - те же, что у представлений DRF,
+    ошибки возвращаются в том же формате. Списки отдаются
+    limit/offset страницами в формате LimitOffsetPagination.
+    sync_view - синхронное представление, которому передаются запросы
+    с keyset пагинацией (?pagination=cursor)
+    """
+
+    http_method_names = ["get", "options"]
+    authentication = CachedJWTAuthentication()
+    permission_classes = ()
+    pagination_class = LimitOffsetPagination
+    sync_view = None
+
+    async def dispatch(self, request, *args, **kwargs):
+        if self.sync_view and request.GET.get("pagination") == "cursor":
+            return await sync_to_async(self.sync_view)(request, *args, **kwargs)
+        try:
+            request.user = await self.authenticate(request)
+            await self.initial(request, *args, **kwargs)
+            self.check_permissions(request)
+            return await super().dispatch(request, *args, **kwargs)
+        except Http404 as e:
+            return self.get_json_response({"detail": str(e) or "Not found."}, 404)
+        except APIException as e:
+            response = self.get_json_response(
+                e.detail if isinstance(e.detail, dict) else {"detail": e.detail},
+                e.status_code,
+            )
+            if e.status_code == 401:
+                response["WWW-Authenticate"] = self.authentication.authenticate_header(
+                    request
+                )
+            return response
+
+    async def authenticate(self, request):
+        """Пользователь по токену из заголовка Authorization"""
+        header = self.authentication.get_header(request)
+        if header is None:
+            return AnonymousUser()
+        raw_token = self.authentication.get_raw_token(header)
+        if raw_token is None:
+            return AnonymousUser()
+        validated_token = self.authentication.get_validated_token(raw_token)
+        return await sync_to_async(self.authentication.get_user)(validated_token)
+
+    async def initial(self, request, *args, **kwargs) -> None:
+        """Загрузка объектов, нужных для проверки разрешений"""
+
+    def check_permissions(self, request) -> None:
+        for permission in self.permission_classes:
+            permission = permission()
+            if not permission.has_permission(request, self):
+                self.permission_denied(request, getattr(permission, "message", None))
+
+    def check_object_permissions(self, request, obj) -> None:
+        for permission in self.permission_classes:
+            permission = permission()
+            if not permission.has_object_permission(request, self, obj):
+                self.permission_denied(request, getattr(permission, "message", None))
+
+    @staticmethod
+    def get_json_response(data, status: int = 200) -> HttpResponse:
+        return HttpResponse(
+            JSONRenderer().render(data), content_type="application/json", status=status
+        )
+
+    @staticmethod
+    def permission_denied(request, message: Optional[str] = None) -> None:
+        if not request.user.is_authenticated:
+            raise NotAuthenticated()
+        raise PermissionDenied(detail=message)
+
+    def get_limit_and_offset(self, request) -> tuple:
+        paginator = self.pagination_class
+        limit = _get_positive_int(
+            request.GET.get(paginator.limit_query_param), paginator.default_limit
+        )
+        if paginator.max_limit:
+            limit = min(limit, paginator.max_limit)
+        offset = _get_positive_int(request.GET.get(paginator.offset_query_param), 0)
+        return limit or paginator.default_limit, offset
+
+    @staticmethod
+    async def get_page(
+        objects: Union[QuerySet, SortedRatingList], limit: int, offset: int
+    ) -> tuple:
+        """
+        (количество объектов, объекты страницы). Для qs количество
+        и страница запрашиваются одновременно
+        """
+        if isinstance(objects, SortedRatingList):
+            return await objects.aget_page(offset, limit)
+
+        async def get_objects():
+            return [obj async for obj in objects[offset : offset + limit]]
+
+        return await asyncio.gather(objects.acount(), get_objects())
+
+    def get_paginated_data(
+        self, request, count: int, limit: int, offset: int, results: list
+    ) -> OrderedDict:
+        paginator = self.pagination_class
+        url = request.build_absolute_uri()
+        next_link = previous_link = None
+        if offset + limit < count:
+            next_link = replace_query_param(
+                replace_query_param(url, paginator.limit_query_param, limit),
+                paginator.offset_query_param,
+                offset + limit,
+            )
+        if offset > 0:
+            previous_link = replace_query_param(url, paginator.limit_query_param, limit)
+            if offset - limit <= 0:
+                previous_link = remove_query_param(
+                    previous_link, paginator.offset_query_param
+                )
+            else:
+                previous_link = replace_query_param(
+                    previous_link, paginator.offset_query_param, offset - limit
+                )
+        return OrderedDict(
+            [
+                ("count", count),
+                ("next", next_link),
+                ("previous", previous_link),
+                ("results", results),
+            ]
+        )
+
+
+def _get_positive_int(value: Optional[str], default: int) -> int:
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return default
@@ -15,6 +15,7 @@ class ContentInline(admin.StackedInline):
 @admin.register(Article)
 class ArticleAdmin(admin.ModelAdmin):
     prepopulated_fields = {"slug": ("title",)}
+    readonly_fields = ["text_preview", "users_like_count", "comment_count"]
     inlines = [ContentInline]
 
 
@@ -0,0 +1,141 @@
+from account.services.users_range_service import get_user_object
+from blog.models import Article
+from collections import Counter
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient
+from rest_framework_simplejwt.tokens import AccessToken
+import asyncio
+import statistics
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает синхронные и асинхронные представления чтения: "
+        "запросы выполняются одновременно в одном event loop, как в одном "
+        "воркере ASGI-сервера, синхронные представления при этом "
+        "обрабатываются по одному в потоке"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=200,
+            help="Количество запросов к каждому представлению",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=50,
+            help="Количество одновременных запросов",
+        )
+        parser.add_argument(
+            "--username",
+            help="Пользователь, от имени которого выполняются запросы "
+            "(по умолчанию анонимно, список пользователей не проверяется)",
+        )
+        parser.add_argument(
+            "--host", default="localhost", help="Имя сервера в запросах"
+        )
+
+    def handle(self, *args, **options):
+        headers = {}
+        if options["username"]:
+            user = get_user_object(options["username"])
+            headers["authorization"] = f"Bearer {AccessToken.for_user(user)}"
+        results = asyncio.run(
+            self._benchmark_all(
+                AsyncClient(server=(options["host"], "80")),
+                self._get_endpoints(bool(options["username"])),
+                headers,
+                options["requests"],
+                options["concurrency"],
+            )
+        )
+        self.stdout.write(
+            f"{'путь':<45} {'запр./с':>9} {'p50, мс':>9} {'p95, мс':>9}  статусы"
+        )
+        for path, result in results:
+            self.stdout.write(
+                f"{path:<45} {result['rps']:>9.1f} {result['p50']:>9.1f} "
+                f"{result['p95']:>9.1f}  {result['statuses']}"
+            )
+
+    @staticmethod
+    def _get_endpoints(authenticated: bool) -> list:
+        """Пары (синхронный путь, асинхронный путь)"""
+        endpoints = [
+            ("/api/blog/articles/", "/api/blog/async/articles/"),
+            (
+                "/api/blog/articles/?order=rating",
+                "/api/blog/async/articles/?order=rating",
+            ),
+        ]
+        article_id = (
+            Article.published_manager.order_by("-published")
+            .values_list("id", flat=True)
+            .first()
+        )
+        if article_id:
+            endpoints += [
+                (
+                    f"/api/blog/articles/{article_id}/",
+                    f"/api/blog/async/articles/{article_id}/",
+                ),
+                (
+                    f"/api/blog/articles/{article_id}/comments/",
+                    f"/api/blog/async/articles/{article_id}/comments/",
+                ),
+            ]
+        if authenticated:
+            endpoints.append(
+                ("/api/accounts/user-list/", "/api/accounts/async/user-list/")
+            )
+        return endpoints
+
+    async def _benchmark_all(
+        self,
+        client: AsyncClient,
+        endpoints: list,
+        headers: dict,
+        requests: int,
+        concurrency: int,
+    ) -> list:
+        results = []
+        for endpoint in endpoints:
+            for path in endpoint:
+                results.append(
+                    (
+                        path,
+                        await self._benchmark(
+                            client, path, headers, requests, concurrency
+                        ),
+                    )
+                )
+        return results
+
+    @staticmethod
+    async def _benchmark(
+        client: AsyncClient, path: str, headers: dict, requests: int, concurrency: int
+    ) -> dict:
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, statuses = [], Counter()
+
+        async def send():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                latencies.append(time.perf_counter() - start)
+                statuses[response.status_code] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(send() for _ in range(requests)))
+        elapsed = time.perf_counter() - start
+        latencies.sort()
+        return {
+            "rps": requests / elapsed,
+            "p50": statistics.median(latencies) * 1000,
+            "p95": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+            "statuses": dict(statuses),
+        }
@@ -0,0 +1,13 @@
+from config.yasg import build_schema_files
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Собирает схему API (JSON и YAML, а также их gzip) в API_SCHEMA_DIR. "
+        "Запускается при деплое, /swagger.json отдаёт собранные файлы"
+    )
+
+    def handle(self, *args, **options):
+        for path in build_schema_files():
+            self.stdout.write(self.style.SUCCESS(f"Записан {path}"))
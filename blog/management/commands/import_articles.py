@@ -0,0 +1,51 @@
+from blog.services.article_import_service import import_articles
+from django.core.management.base import BaseCommand
+import sys
+
+
+class Command(BaseCommand):
+    help = (
+        "Импортирует посты с контентом и комментариями из файла jsonl или csv. "
+        "Файл читается построчно, посты сохраняются пачками, рейтинги "
+        "постов и авторов дополняются в redis после каждой пачки. "
+        "Уже импортированные посты пропускаются"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Путь к файлу, - для чтения из stdin")
+        parser.add_argument(
+            "--format",
+            choices=("jsonl", "csv"),
+            help="Формат файла (по умолчанию - по расширению, иначе jsonl)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Количество постов в одной пачке bulk_create",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or ("csv" if path.endswith(".csv") else "jsonl")
+        if path == "-":
+            imported, skipped, redis_synced = import_articles(
+                sys.stdin, file_format, options["batch_size"]
+            )
+        else:
+            with open(path, encoding="utf-8", newline="") as file:
+                imported, skipped, redis_synced = import_articles(
+                    file, file_format, options["batch_size"]
+                )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Импортировано постов: {imported}, пропущено записей: {skipped}"
+            )
+        )
+        if not redis_synced:
+            self.stdout.write(
+                self.style.WARNING(
+                    "Redis недоступен, рейтинги не обновлены: "
+                    "запустите manage.py rebuild_ratings"
+                )
+            )
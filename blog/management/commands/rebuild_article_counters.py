@@ -0,0 +1,18 @@
+from blog.services.article_counter_service import rebuild_article_counters
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счётчики лайков и комментариев статей по БД"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10000,
+            help="Количество id статей в одном UPDATE",
+        )
+
+    def handle(self, *args, **options):
+        updated = rebuild_article_counters(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Обновлено статей: {updated}"))
@@ -0,0 +1,28 @@
+from blog.services.rating_rebuild_service import (
+    rebuild_article_rating,
+    rebuild_user_rating,
+)
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает рейтинги статей и пользователей в redis по БД, "
+        "индексы статей по категориям и авторам строятся заново при чтении. "
+        "Изменения рейтинга во время пересчёта теряются"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=10000,
+            help="Количество объектов в одном запросе к БД и ZADD",
+        )
+
+    def handle(self, *args, **options):
+        articles = rebuild_article_rating(chunk_size=options["chunk_size"])
+        users = rebuild_user_rating(chunk_size=options["chunk_size"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Статей в рейтинге: {articles}, пользователей: {users}")
+        )
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0011_alter_content_options"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="article",
+            index=models.Index(
+                models.F("status"),
+                models.OrderBy(models.F("published"), descending=True, nulls_last=True),
+                models.OrderBy(models.F("id"), descending=True),
+                name="article_feed_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                fields=["article", "-created", "-id"], name="comment_feed_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:13
+
+from django.db import migrations, models
+
+
+PREVIEW_LENGTH = 300
+BATCH_SIZE = 1000
+
+
+def fill_text_preview(apps, schema_editor):
+    """Заполняет превью существующих статей по первому текстовому блоку"""
+    Article = apps.get_model("blog", "Article")
+    Content = apps.get_model("blog", "Content")
+    Text = apps.get_model("blog", "Text")
+
+    first_text_ids = {}
+    contents = (
+        Content.objects.filter(
+            content_type__app_label="blog", content_type__model="text"
+        )
+        .order_by("article_id", "id")
+        .values_list("article_id", "object_id")
+    )
+    for article_id, object_id in contents.iterator():
+        first_text_ids.setdefault(article_id, object_id)
+
+    items = list(first_text_ids.items())
+    for start in range(0, len(items), BATCH_SIZE):
+        batch = items[start : start + BATCH_SIZE]
+        texts = Text.objects.in_bulk([object_id for _, object_id in batch])
+        articles = Article.objects.in_bulk([article_id for article_id, _ in batch])
+        for article_id, object_id in batch:
+            if object_id in texts and article_id in articles:
+                articles[article_id].text_preview = texts[object_id].text[
+                    :PREVIEW_LENGTH
+                ]
+        Article.objects.bulk_update(articles.values(), ["text_preview"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0012_article_comment_feed_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="article",
+            name="text_preview",
+            field=models.CharField(
+                blank=True, max_length=300, verbose_name="Текстовое превью"
+            ),
+        ),
+        migrations.RunPython(fill_text_preview, migrations.RunPython.noop),
+    ]
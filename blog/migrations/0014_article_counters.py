@@ -0,0 +1,54 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:14
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    """Заполняет счётчики лайков и комментариев существующих статей"""
+    Article = apps.get_model("blog", "Article")
+    Comment = apps.get_model("blog", "Comment")
+    likes = (
+        Article.users_like.through.objects.filter(article_id=OuterRef("pk"))
+        .order_by()
+        .values("article_id")
+        .annotate(count=Count("*"))
+        .values("count")
+    )
+    comments = (
+        Comment.objects.filter(article_id=OuterRef("pk"))
+        .order_by()
+        .values("article_id")
+        .annotate(count=Count("*"))
+        .values("count")
+    )
+    Article.objects.update(
+        users_like_count=Coalesce(Subquery(likes), 0),
+        comment_count=Coalesce(Subquery(comments), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0013_article_text_preview"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="article",
+            name="comment_count",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Количество комментариев"
+            ),
+        ),
+        migrations.AddField(
+            model_name="article",
+            name="users_like_count",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Количество лайков"
+            ),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
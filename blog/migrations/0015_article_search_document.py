@@ -0,0 +1,53 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:16
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# заголовок - вес A, текстовые блоки в порядке добавления - вес B
+FILL_SEARCH_DOCUMENT_SQL = """
+UPDATE blog_article AS article
+SET search_document =
+    setweight(to_tsvector('russian', article.title), 'A')
+    || setweight(to_tsvector('english', article.title), 'A')
+    || setweight(to_tsvector('russian', coalesce(texts.body, '')), 'B')
+    || setweight(to_tsvector('english', coalesce(texts.body, '')), 'B')
+FROM blog_article AS source
+LEFT JOIN (
+    SELECT content.article_id, string_agg(text.text, ' ' ORDER BY content.id) AS body
+    FROM blog_content AS content
+    JOIN django_content_type AS content_type
+        ON content_type.id = content.content_type_id
+        AND content_type.app_label = 'blog'
+        AND content_type.model = 'text'
+    JOIN blog_text AS text ON text.id = content.object_id
+    GROUP BY content.article_id
+) AS texts ON texts.article_id = source.id
+WHERE article.id = source.id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0014_article_counters"),
+        ("contenttypes", "0002_remove_content_type_name"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="article",
+            name="search_document",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="article",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_document"], name="article_search_idx"
+            ),
+        ),
+        migrations.RunSQL(FILL_SEARCH_DOCUMENT_SQL, migrations.RunSQL.noop),
+    ]
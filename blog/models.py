@@ -2,7 +2,10 @@ from .services.article_rating_service import ArticlesRating, ArticleViewCounter
 from .services.utils import slugify
 from account.models import CustomUser
 from django.db import models
+from django.db.models import F
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.conf import settings
 from django.urls import reverse
@@ -53,15 +56,39 @@ class Article(models.Model):
     updated = models.DateTimeField(auto_now_add=True)
     published = models.DateTimeField(null=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="draft")
+    text_preview = models.CharField(
+        max_length=settings.ARTICLE_TEXT_PREVIEW_LENGTH,
+        blank=True,
+        verbose_name="Текстовое превью",
+    )
     users_like = models.ManyToManyField(
         CustomUser,
         related_name="articles_like",
         verbose_name="Понравилось пользователям",
         blank=True,
     )
+    # счётчики, чтобы не считать лайки и комментарии при каждом выводе списка
+    users_like_count = models.PositiveIntegerField(
+        default=0, verbose_name="Количество лайков"
+    )
+    comment_count = models.PositiveIntegerField(
+        default=0, verbose_name="Количество комментариев"
+    )
+    # заголовок и текстовые блоки статьи для полнотекстового поиска
+    search_document = SearchVectorField(null=True, editable=False)
 
     class Meta:
         ordering = ["-published"]
+        indexes = [
+            # keyset пагинация ленты по (published, id)
+            models.Index(
+                F("status"),
+                F("published").desc(nulls_last=True),
+                F("id").desc(),
+                name="article_feed_idx",
+            ),
+            GinIndex(fields=["search_document"], name="article_search_idx"),
+        ]
         verbose_name = "Пост"
         verbose_name_plural = "Посты"
 
@@ -165,6 +192,12 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ("-created",)
+        indexes = [
+            # keyset пагинация комментариев по (created, id)
+            models.Index(
+                fields=["article", "-created", "-id"], name="comment_feed_idx"
+            ),
+        ]
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
 
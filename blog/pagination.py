@@ -0,0 +1,245 @@
+from collections import OrderedDict
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import F, Q
+from django.db.models.query import QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+from typing import Optional
+import base64
+import binascii
+import json
+import math
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) пагинация. Следующая страница выбирается условием по
+    ключу сортировки последнего элемента предыдущей страницы, а не OFFSET,
+    поэтому время выборки не зависит от глубины страницы.
+    Курсор - непрозрачная для клиента строка со значениями ключа.
+
+    Вместо qs можно передать объект с методом
+    get_keyset_page(position, limit) -> (page, next_position),
+    который сам выбирает страницу по ключу (например, рейтинг из redis)
+    """
+
+    ordering = ("-id",)
+    cursor_query_param = "cursor"
+    limit_query_param = "limit"
+    default_limit = api_settings.PAGE_SIZE
+    max_limit = 100
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        model = queryset.model if isinstance(queryset, QuerySet) else None
+        position = self.decode_cursor(request, model)
+        if model:
+            page, self.next_position = self._get_queryset_page(queryset, position)
+        else:
+            page, self.next_position = queryset.get_keyset_page(position, self.limit)
+        return page
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict([("next", self.get_next_link()), ("results", data)])
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_limit(self, request) -> int:
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+            if limit > 0:
+                return min(limit, self.max_limit)
+        except (KeyError, ValueError):
+            pass
+        return self.default_limit
+
+    def get_next_link(self) -> Optional[str]:
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.next_position)
+        )
+
+    @staticmethod
+    def encode_cursor(position: list) -> str:
+        return base64.urlsafe_b64encode(
+            json.dumps(position, default=str).encode()
+        ).decode()
+
+    def decode_cursor(self, request, model=None) -> Optional[list]:
+        """Значения ключа из курсора, None - первая страница"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        except (TypeError, ValueError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        if model is None:
+            return self._get_score_position(position)
+        values = []
+        for name, value in zip(self._get_field_names(), position):
+            model_field = self._get_model_field(model, name)
+            if model_field and value is not None:
+                try:
+                    value = model_field.to_python(value)
+                except (ValidationError, TypeError, ValueError):
+                    raise NotFound(self.invalid_cursor_message)
+            values.append(value)
+        return values
+
+    def _get_score_position(self, position: list) -> list:
+        """
+        Позиция (score, id) для объектов, которые сами выбирают страницу
+        по ключу (get_keyset_page): конечное число и целый id
+        """
+        if len(position) != 2:
+            raise NotFound(self.invalid_cursor_message)
+        score, object_id = position
+        if (
+            isinstance(score, bool)
+            or not isinstance(score, (int, float))
+            or not math.isfinite(score)
+            or isinstance(object_id, bool)
+            or not isinstance(object_id, int)
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        return [float(score), object_id]
+
+    def _get_queryset_page(self, queryset: QuerySet, position: Optional[list]):
+        """Выборка страницы qs после позиции position"""
+        queryset = queryset.order_by(*self._get_order_expressions(queryset.model))
+        if position is not None:
+            queryset = queryset.filter(self._get_position_filter(queryset, position))
+        page = list(queryset[: self.limit + 1])
+        if len(page) <= self.limit:
+            return page, None
+        page = page[: self.limit]
+        next_position = [getattr(page[-1], name) for name in self._get_field_names()]
+        return page, next_position
+
+    def _get_field_names(self) -> list:
+        return [field.lstrip("-") for field in self.ordering]
+
+    def _get_order_expressions(self, model) -> list:
+        """NULL всегда в конце, чтобы порядок не зависел от СУБД"""
+        expressions = []
+        for field in self.ordering:
+            name = field.lstrip("-")
+            model_field = self._get_model_field(model, name)
+            nulls_last = True if model_field and model_field.null else None
+            if field.startswith("-"):
+                expressions.append(F(name).desc(nulls_last=nulls_last))
+            else:
+                expressions.append(F(name).asc(nulls_last=nulls_last))
+        return expressions
+
+    def _get_position_filter(self, queryset: QuerySet, position: list) -> Q:
+        """
+        Условие "после позиции" для составного ключа:
+        (f1 после v1) or (f1 = v1 and f2 после v2) or ...
+        """
+        position_filter = Q(pk__in=[])
+        equal = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip("-")
+            if value is not None:
+                lookup = "lt" if field.startswith("-") else "gt"
+                after = Q(**{f"{name}__{lookup}": value})
+                model_field = self._get_model_field(queryset.model, name)
+                if model_field and model_field.null:
+                    after |= Q(**{f"{name}__isnull": True})
+                position_filter |= equal & after
+                equal &= Q(**{name: value})
+            else:
+                equal &= Q(**{f"{name}__isnull": True})
+        return position_filter
+
+    @staticmethod
+    def _get_model_field(model, name: str):
+        """Поле модели или None для аннотаций"""
+        try:
+            return model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+
+
+class LimitOffsetOrKeysetPagination(LimitOffsetPagination):
+    """
+    По умолчанию limit/offset пагинация,
+    keyset пагинация включается параметром ?pagination=cursor
+    """
+
+    pagination_query_param = "pagination"
+    keyset_pagination_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset_paginator = None
+        if request.query_params.get(self.pagination_query_param) == "cursor":
+            self.keyset_paginator = self.keyset_pagination_class()
+            return self.keyset_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset_paginator:
+            return self.keyset_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [
+            {
+                "name": self.pagination_query_param,
+                "required": False,
+                "in": "query",
+                "description": "cursor - keyset пагинация",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": KeysetPagination.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Курсор следующей страницы",
+                "schema": {"type": "string"},
+            },
+        ]
+
+
+class ArticleKeysetPagination(KeysetPagination):
+    ordering = ("-published", "-id")
+
+
+class ArticlePagination(LimitOffsetOrKeysetPagination):
+    keyset_pagination_class = ArticleKeysetPagination
+
+
+class ArticleSearchKeysetPagination(KeysetPagination):
+    ordering = ("-rank", "-id")
+
+
+class ArticleSearchPagination(LimitOffsetOrKeysetPagination):
+    keyset_pagination_class = ArticleSearchKeysetPagination
+
+
+class CommentKeysetPagination(KeysetPagination):
+    ordering = ("-created", "-id")
+
+
+class CommentPagination(LimitOffsetOrKeysetPagination):
+    keyset_pagination_class = CommentKeysetPagination
@@ -1,9 +1,12 @@
 from .models import Article, Category, Comment, Content, Text, Image, Video
 from .services.article_content_service import (
-    get_text_preview_for_article,
     create_content,
+    update_text_fields_for_content_object,
 )
-from account.serializers import UserDetailUpdateSerializer
+from .services.article_like_service import get_liked_article_ids
+from .services.article_rating_service import get_articles_rating_and_views
+from account.serializers import BatchListSerializer, UserDetailUpdateSerializer
+from drf_yasg.utils import swagger_serializer_method
 from rest_framework import serializers
 
 
@@ -50,6 +53,11 @@ class ContentObjectBaseSerializer(serializers.ModelSerializer):
         create_content(article=article, content_object=instance)
         return instance
 
+    def update(self, instance, validated_data):
+        instance = super().update(instance, validated_data)
+        update_text_fields_for_content_object(instance)
+        return instance
+
 
 class TextSerializer(ContentObjectBaseSerializer):
     class Meta:
@@ -70,12 +78,12 @@ class VideoSerializer(ContentObjectBaseSerializer):
 
 
 class ArticleBaseSerializer(serializers.ModelSerializer):
-    view_count = serializers.IntegerField(source="get_article_views", read_only=True)
-    users_like_count = serializers.IntegerField(
-        source="users_like.count", read_only=True
-    )
-    rating = serializers.IntegerField(source="get_article_rating", read_only=True)
-    comment_count = serializers.IntegerField(source="comments.count", read_only=True)
+    view_count = serializers.SerializerMethodField(read_only=True)
+    unique_view_count = serializers.SerializerMethodField(read_only=True)
+    users_like_count = serializers.IntegerField(read_only=True)
+    rating = serializers.SerializerMethodField(read_only=True)
+    liked_by_me = serializers.SerializerMethodField(read_only=True)
+    comment_count = serializers.IntegerField(read_only=True)
     category = serializers.SlugRelatedField(
         slug_field="title", queryset=Category.objects.all()
     )
@@ -89,24 +97,73 @@ class ArticleBaseSerializer(serializers.ModelSerializer):
             "preview_image",
             "published",
             "view_count",
+            "unique_view_count",
             "users_like_count",
             "rating",
+            "liked_by_me",
             "comment_count",
         ]
         read_only_fields = ["id", "published"]
+        list_serializer_class = BatchListSerializer
+
+    def preload_page(self, articles: list) -> None:
+        """
+        Рейтинг и просмотры всех статей страницы одним запросом к redis,
+        лайки пользователя - одним запросом к БД. Данные, уже переданные
+        в контексте (асинхронными представлениями), не запрашиваются
+        """
+        article_stats = self.context.setdefault("article_stats", {})
+        article_stats.update(
+            get_articles_rating_and_views(
+                [article.id for article in articles if article.id not in article_stats]
+            )
+        )
+        liked_checked_ids = self.context.setdefault("liked_checked_ids", set())
+        article_ids = [
+            article.id for article in articles if article.id not in liked_checked_ids
+        ]
+        self.context.setdefault("liked_article_ids", set()).update(
+            get_liked_article_ids(self._get_user(), article_ids)
+        )
+        liked_checked_ids.update(article_ids)
+
+    def _get_user(self):
+        request = self.context.get("request")
+        return getattr(request, "user", None)
+
+    def _get_article_stats(self, article) -> dict:
+        article_stats = self.context.setdefault("article_stats", {})
+        if article.id not in article_stats:
+            article_stats.update(get_articles_rating_and_views([article.id]))
+        return article_stats[article.id]
+
+    @swagger_serializer_method(serializer_or_field=serializers.IntegerField)
+    def get_view_count(self, article):
+        return self._get_article_stats(article)["view_count"]
+
+    @swagger_serializer_method(serializer_or_field=serializers.IntegerField)
+    def get_unique_view_count(self, article):
+        return self._get_article_stats(article)["unique_view_count"]
+
+    @swagger_serializer_method(serializer_or_field=serializers.IntegerField)
+    def get_rating(self, article):
+        return self._get_article_stats(article)["rating"]
+
+    @swagger_serializer_method(serializer_or_field=serializers.BooleanField)
+    def get_liked_by_me(self, article):
+        if article.id not in self.context.get("liked_checked_ids", ()):
+            return bool(get_liked_article_ids(self._get_user(), [article.id]))
+        return article.id in self.context["liked_article_ids"]
 
 
 class ArticleListSerializer(ArticleBaseSerializer):
-    text_preview = serializers.SerializerMethodField("get_text_preview", read_only=True)
+    text_preview = serializers.CharField(read_only=True)
     author = serializers.SlugRelatedField(slug_field="username", read_only=True)
     url = serializers.CharField(source="get_absolute_url", read_only=True)
 
     class Meta(ArticleBaseSerializer.Meta):
         fields = ArticleBaseSerializer.Meta.fields + ["text_preview", "author", "url"]
 
-    def get_text_preview(self, article):
-        return get_text_preview_for_article(article)
-
 
 class ArticleDetailSerializer(ArticleBaseSerializer):
     author = UserDetailUpdateSerializer(read_only=True)
@@ -0,0 +1,273 @@
+from .article_like_service import aget_liked_article_ids, get_liked_article_ids
+from .article_rating_service import (
+    aget_articles_rating_and_views,
+    get_articles_rating_and_views,
+)
+from ..models import Article, Comment
+from account.models import Subscription
+from account.services.rating_service import REDIS, UsersRating
+from account.services.redis_service import ASYNC_REDIS, redis_read, redis_write
+from account.services.subscription_service import aget_subscribed_user_ids
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+from typing import Awaitable, Callable, Iterable, Optional
+import asyncio
+import hashlib
+import json
+import logging.config
+
+
+logging.config.dictConfig(settings.LOGGING)
+LOGGER = logging.getLogger("blog_logger")
+
+
+class ArticleListCache:
+    """
+    Кэш отрендеренных страниц списка постов для анонимных пользователей.
+    Вместе со страницей хранится версия списка на момент её построения,
+    любое изменение постов увеличивает версию, и старые страницы
+    перестают отдаваться. Версия и страница читаются одним MGET
+    """
+
+    version_key = "article_list:version"
+    timeout = settings.ARTICLE_LIST_CACHE_TIMEOUT
+    # параметры, от которых зависит страница списка
+    query_params = (
+        "category",
+        "cursor",
+        "filter",
+        "limit",
+        "offset",
+        "order",
+        "pagination",
+        "username",
+    )
+
+    def get_key(self, url: str, query_params: dict) -> Optional[str]:
+        """
+        Ключ страницы по нормализованным параметрам запроса.
+        None - запрос с посторонними параметрами не кэшируется
+        """
+        if set(query_params) - set(self.query_params):
+            return None
+        params = "&".join(
+            f"{name}={query_params[name]}"
+            for name in sorted(query_params)
+            if query_params[name]
+        )
+        digest = hashlib.md5(f"{url}?{params}".encode()).hexdigest()
+        return f"article_list:page:{digest}"
+
+    @redis_read(default=(None, None))
+    def get(self, key: str) -> tuple:
+        """
+        Возвращает (страница или None, текущая версия списка),
+        версия None - redis недоступен
+        """
+        version, page = REDIS.mget(self.version_key, key)
+        return _get_page_content(page, version or b"0")
+
+    @redis_read(default=(None, None))
+    async def aget(self, key: str) -> tuple:
+        version, page = await ASYNC_REDIS.mget(self.version_key, key)
+        return _get_page_content(page, version or b"0")
+
+    @redis_write(retry=False)
+    def set(self, key: str, content: bytes, version: Optional[bytes]) -> None:
+        """Сохраняет страницу с версией, прочитанной до её построения"""
+        if version is None:
+            return
+        REDIS.set(key, version + b":" + content, ex=self.timeout)
+
+    @redis_write(retry=False)
+    async def aset(self, key: str, content: bytes, version: Optional[bytes]) -> None:
+        if version is None:
+            return
+        await ASYNC_REDIS.set(key, version + b":" + content, ex=self.timeout)
+
+    @redis_write()
+    def invalidate(self) -> None:
+        REDIS.incr(self.version_key)
+
+
+class ArticleDetailCache:
+    """
+    Кэш статической части страницы поста: поля поста, контент,
+    комментарии и карточка автора. Страница хранится с версиями поста
+    и автора на момент построения, версии и страница читаются одним MGET
+    """
+
+    timeout = settings.ARTICLE_DETAIL_CACHE_TIMEOUT
+
+    @staticmethod
+    def get_key(article_id: int) -> str:
+        return f"article_detail:{article_id}"
+
+    @staticmethod
+    def get_article_version_key(article_id: int) -> str:
+        return f"article_detail:{article_id}:version"
+
+    @staticmethod
+    def get_author_version_key(author_id: int) -> str:
+        return f"article_detail:author:{author_id}:version"
+
+    @redis_read(default=(None, None))
+    def get(self, article_id: int, author_id: int) -> tuple:
+        """
+        Возвращает (страница или None, текущие версии поста и автора),
+        версия None - redis недоступен
+        """
+        return self._get_versioned_page(
+            *REDIS.mget(
+                self.get_article_version_key(article_id),
+                self.get_author_version_key(author_id),
+                self.get_key(article_id),
+            )
+        )
+
+    @redis_read(default=(None, None))
+    async def aget(self, article_id: int, author_id: int) -> tuple:
+        return self._get_versioned_page(
+            *await ASYNC_REDIS.mget(
+                self.get_article_version_key(article_id),
+                self.get_author_version_key(author_id),
+                self.get_key(article_id),
+            )
+        )
+
+    @staticmethod
+    def _get_versioned_page(
+        article_version: Optional[bytes],
+        author_version: Optional[bytes],
+        page: Optional[bytes],
+    ) -> tuple:
+        version = (article_version or b"0") + b"." + (author_version or b"0")
+        return _get_page_content(page, version)
+
+    @redis_write(retry=False)
+    def set(self, article_id: int, content: bytes, version: Optional[bytes]) -> None:
+        if version is None:
+            return
+        REDIS.set(self.get_key(article_id), version + b":" + content, ex=self.timeout)
+
+    @redis_write(retry=False)
+    async def aset(
+        self, article_id: int, content: bytes, version: Optional[bytes]
+    ) -> None:
+        if version is None:
+            return
+        await ASYNC_REDIS.set(
+            self.get_key(article_id), version + b":" + content, ex=self.timeout
+        )
+
+    @redis_write()
+    def invalidate(
+        self, article_ids: Iterable[int] = (), author_ids: Iterable[int] = ()
+    ) -> None:
+        pipe = REDIS.pipeline(transaction=False)
+        for article_id in article_ids:
+            pipe.incr(self.get_article_version_key(article_id))
+        for author_id in author_ids:
+            pipe.incr(self.get_author_version_key(author_id))
+        pipe.execute()
+
+
+def _get_page_content(page: Optional[bytes], version: bytes) -> tuple:
+    """(страница или None, если её версия устарела, текущая версия)"""
+    if page:
+        page_version, _, content = page.partition(b":")
+        if page_version == version:
+            return content, version
+    return None, version
+
+
+ARTICLE_LIST_CACHE = ArticleListCache()
+ARTICLE_DETAIL_CACHE = ArticleDetailCache()
+USERS_RATING = UsersRating()
+
+
+def get_article_detail_data(article: Article, user, build: Callable[[], dict]) -> dict:
+    """
+    Страница поста. Статическая часть берётся из кэша или строится
+    функцией build, поверх неё подставляются поля, зависящие от запроса:
+    просмотры, рейтинг и лайк пользователя, рейтинг автора и подписка на автора
+    """
+    content, version = ARTICLE_DETAIL_CACHE.get(article.id, article.author_id)
+    if content is None:
+        data = build()
+        ARTICLE_DETAIL_CACHE.set(article.id, JSONRenderer().render(data), version)
+    else:
+        data = json.loads(content)
+    data.update(get_articles_rating_and_views([article.id])[article.id])
+    data["liked_by_me"] = bool(get_liked_article_ids(user, [article.id]))
+    data["author"]["user_rating"] = USERS_RATING.get_rating_by_id(article.author_id)
+    data["author"]["is_subscription"] = (
+        user.is_authenticated
+        and Subscription.objects.filter(
+            from_user_id=user.id, to_user_id=article.author_id
+        ).exists()
+    )
+    return data
+
+
+async def aget_article_detail_data(
+    article: Article, user, build: Callable[[], Awaitable[dict]]
+) -> dict:
+    """
+    Асинхронная версия get_article_detail_data: кэш страницы, просмотры
+    и рейтинги читаются из redis одновременно с лайком и подпиской из БД
+    """
+    (
+        (content, version),
+        article_stats,
+        liked_ids,
+        author_rating,
+        subscribed_ids,
+    ) = await asyncio.gather(
+        ARTICLE_DETAIL_CACHE.aget(article.id, article.author_id),
+        aget_articles_rating_and_views([article.id]),
+        aget_liked_article_ids(user, [article.id]),
+        USERS_RATING.aget_rating_by_id(article.author_id),
+        aget_subscribed_user_ids(user, [article.author_id]),
+    )
+    if content is None:
+        data = await build()
+        await ARTICLE_DETAIL_CACHE.aset(
+            article.id, JSONRenderer().render(data), version
+        )
+    else:
+        data = json.loads(content)
+    data.update(article_stats[article.id])
+    data["liked_by_me"] = article.id in liked_ids
+    data["author"]["user_rating"] = author_rating
+    data["author"]["is_subscription"] = article.author_id in subscribed_ids
+    return data
+
+
+def invalidate_article_cache(article_id: Optional[int] = None) -> None:
+    """
+    Сбрасывает кэш списка постов и, если передан article_id,
+    кэш страницы поста
+    """
+    ARTICLE_LIST_CACHE.invalidate()
+    if article_id is not None:
+        ARTICLE_DETAIL_CACHE.invalidate(article_ids=[article_id])
+
+
+def invalidate_author_cache(*author_ids: int) -> None:
+    """Сбрасывает кэш страниц постов авторов (карточка автора)"""
+    ARTICLE_DETAIL_CACHE.invalidate(author_ids=author_ids)
+
+
+def invalidate_commenter_cache(user_id: int) -> None:
+    """
+    Сбрасывает кэш страниц постов, которые комментировал пользователь
+    (имя автора комментария выводится на странице поста)
+    """
+    article_ids = list(
+        Comment.objects.filter(author_id=user_id)
+        .values_list("article_id", flat=True)
+        .distinct()
+    )
+    if article_ids:
+        ARTICLE_DETAIL_CACHE.invalidate(article_ids=article_ids)
@@ -1,38 +1,77 @@
 from ..models import Article, Content, Text, Image, Video
 from .article_range_service import get_article_object
-from .article_rating_service import ArticlesRating, ArticleViewCounter
+from .article_rating_service import (
+    ArticlesRating,
+    ArticleViewBuffer,
+    ArticleViewCounter,
+    ArticlesIndex,
+)
+from .article_timeline_service import fan_out_article, remove_article_from_timelines
 from account.services.rating_service import UsersRating
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.search import SearchVector
+from django.db.models import F, Value
 from django.http import Http404
 from django.utils import timezone
-from typing import Union
+from typing import Optional, Union
+import hashlib
 import logging.config
 
 
 USERS_RATING = UsersRating()
 ARTICLES_RATING = ArticlesRating()
+ARTICLES_INDEX = ArticlesIndex()
+ARTICLE_VIEW_COUNTER = ArticleViewCounter()
+ARTICLE_VIEW_BUFFER = ArticleViewBuffer(ARTICLE_VIEW_COUNTER)
 
 logging.config.dictConfig(settings.LOGGING)
 LOGGER = logging.getLogger("blog_logger")
 
 
-def get_text_preview_for_article(article: Article) -> str:
-    """Функция возвращает текстовое превью статьи или пустую строку"""
-    try:
-        preview_content = article.contents.filter(content_type__model="text").first()
-        return preview_content.content_object.text
-    except AttributeError:
-        LOGGER.warning(f"article {article.id}, text not found")
-        return ""
+def update_article_text_fields(article_id: int) -> None:
+    """
+    Пересчитывает поля статьи, зависящие от заголовка и текстовых блоков:
+    текстовое превью (начало первого блока) и поисковый документ
+    """
+    text_ids = list(
+        Content.objects.filter(article_id=article_id, content_type__model="text")
+        .order_by("id")
+        .values_list("object_id", flat=True)
+    )
+    texts = Text.objects.in_bulk(text_ids)
+    texts = [texts[text_id].text for text_id in text_ids if text_id in texts]
+    Article.objects.filter(id=article_id).update(
+        text_preview=(texts[0] if texts else "")[
+            : settings.ARTICLE_TEXT_PREVIEW_LENGTH
+        ],
+        search_document=_get_search_vector(" ".join(texts)),
+    )
+
+
+def update_text_fields_for_content_object(
+    content_object: Union[Text, Image, Video]
+) -> None:
+    """Обновляет превью и поисковый документ статей с изменённым текстом"""
+    if not isinstance(content_object, Text):
+        return
+    article_ids = Content.objects.filter(
+        content_type=ContentType.objects.get_for_model(Text),
+        object_id=content_object.id,
+    ).values_list("article_id", flat=True)
+    for article_id in article_ids:
+        update_article_text_fields(article_id)
 
 
 def delete_article_content_by_id(content_id: int) -> None:
     """Функция удаляет контент и его содержание"""
     try:
         content = Content.objects.get(id=content_id)
+        is_text = isinstance(content.content_object, Text)
         content.content_object.delete()
         content.delete()
+        if is_text:
+            update_article_text_fields(content.article_id)
     except Content.DoesNotExist:
         LOGGER.error(f"content {content_id} not found")
         raise Http404(f"Контент {content_id} не найден")
@@ -55,6 +94,8 @@ def get_content_object_by_model_name_and_id(
 def create_content(article: Article, content_object: Union[Text, Image, Video]) -> None:
     try:
         Content.objects.create(article=article, content_object=content_object)
+        if isinstance(content_object, Text):
+            update_article_text_fields(article.id)
     except Exception as e:
         LOGGER.error(f"create content error", e)
 
@@ -68,11 +109,20 @@ def delete_all_article_content(article_id: int) -> None:
         USERS_RATING.incr_or_decr_rating_by_id(
             action="delete_article", object_id=article.author.id
         )
+        ARTICLES_INDEX.remove_article(
+            article_id, category_id=article.category_id, author_id=article.author_id
+        )
+        remove_article_from_timelines(article)
     ARTICLES_RATING.clear_rating_by_id(object_id=article_id)
+    ARTICLE_VIEW_COUNTER.clear(article_id)
 
 
 def publish_article(article: Article) -> bool:
-    """Меняет статус статьи на "опубликовано", добавляет рейтинг пользователю"""
+    """
+    Меняет статус статьи на "опубликовано", добавляет рейтинг пользователю,
+    заводит рейтинг статьи, добавляет её в индексы категории и автора
+    и рассылает по лентам подписчиков
+    """
     if article.status == "draft":
         article.status = "published"
         article.published = timezone.now()
@@ -80,14 +130,75 @@ def publish_article(article: Article) -> bool:
         USERS_RATING.incr_or_decr_rating_by_id(
             action="create_article", object_id=article.author.id
         )
+        ARTICLES_RATING.incr_or_decr_rating_by_id(action="init", object_id=article.id)
+        ARTICLES_RATING.set_category(article.id, article.category_id)
+        ARTICLES_INDEX.add_article(
+            article.id,
+            category_id=article.category_id,
+            author_id=article.author_id,
+            published=article.published,
+        )
+        fan_out_article(article)
         return True
     return False
 
 
-def change_article_views(article_id: int) -> None:
-    """Увеличивает количество просмотров и рейтинг статьи на 1"""
-    ArticleViewCounter().incr_view_count(article_id)
-    ARTICLES_RATING.incr_or_decr_rating_by_id(action="view", object_id=article_id)
+def update_article_index(article: Article, old_category_id: int) -> None:
+    """Переносит опубликованную статью в индекс и рейтинг новой категории"""
+    if article.status == "published" and article.category_id != old_category_id:
+        ARTICLES_RATING.set_category(article.id, article.category_id)
+        ARTICLES_INDEX.remove_article(
+            article.id, category_id=old_category_id, author_id=article.author_id
+        )
+        ARTICLES_INDEX.add_article(
+            article.id,
+            category_id=article.category_id,
+            author_id=article.author_id,
+            published=article.published,
+        )
+
+
+def change_article_views(article_id: int, viewer_id: Optional[str] = None) -> None:
+    """
+    Увеличивает количество просмотров и рейтинг статьи на 1
+    и добавляет зрителя в уникальные зрители статьи.
+    В режиме ARTICLE_VIEW_COUNTER_MODE = "buffered" просмотры
+    записываются в redis пачками (см. ArticleViewBuffer)
+    """
+    if settings.ARTICLE_VIEW_COUNTER_MODE == "buffered":
+        ARTICLE_VIEW_BUFFER.add(article_id, viewer_id)
+    else:
+        ARTICLE_VIEW_COUNTER.add_views(
+            {article_id: 1}, {article_id: {viewer_id}} if viewer_id else None
+        )
+
+
+def get_viewer_id(request) -> str:
+    """
+    Идентификатор зрителя: id пользователя или, для анонимов,
+    хэш IP-адреса и User-Agent
+    """
+    if request.user.is_authenticated:
+        return f"user:{request.user.id}"
+    fingerprint = "|".join(
+        (request.META.get("REMOTE_ADDR", ""), request.META.get("HTTP_USER_AGENT", ""))
+    )
+    return f"anon:{hashlib.sha1(fingerprint.encode()).hexdigest()}"
+
+
+def _get_search_vector(text: str, title: Optional[str] = None) -> SearchVector:
+    """
+    Поисковый вектор статьи: заголовок с весом A и текст с весом B
+    в каждой из конфигураций ARTICLE_SEARCH_CONFIGS.
+    Без title заголовок берётся из поля статьи (для UPDATE)
+    """
+    title = F("title") if title is None else Value(title)
+    vector = None
+    for config in settings.ARTICLE_SEARCH_CONFIGS:
+        for value, weight in ((title, "A"), (Value(text), "B")):
+            part = SearchVector(value, config=config, weight=weight)
+            vector = part if vector is None else vector + part
+    return vector
 
 
 def _get_model_by_name(model_name: str) -> Union[Text, Image, Video, None]:
@@ -0,0 +1,54 @@
+from ..models import Article, Comment
+from django.conf import settings
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import logging.config
+
+
+logging.config.dictConfig(settings.LOGGING)
+LOGGER = logging.getLogger("blog_logger")
+
+ARTICLE_COUNTERS = ("users_like_count", "comment_count")
+
+
+def change_article_counter(article_id: int, counter: str, delta: int) -> None:
+    """
+    Атомарно изменяет счётчик статьи (users_like_count/comment_count)
+    на delta одним UPDATE без чтения строки
+    """
+    if counter not in ARTICLE_COUNTERS:
+        LOGGER.error(f"unknown article counter {counter}")
+        raise ValueError(f"unknown article counter {counter}")
+    Article.objects.filter(id=article_id).update(**{counter: F(counter) + delta})
+
+
+def rebuild_article_counters(batch_size: int = 10000) -> int:
+    """
+    Пересчитывает счётчики лайков и комментариев агрегатами в БД.
+    Статьи обновляются диапазонами id по batch_size, чтобы не держать
+    блокировку всей таблицы. Возвращает количество обновлённых статей
+    """
+    likes = (
+        Article.users_like.through.objects.filter(article_id=OuterRef("pk"))
+        .order_by()
+        .values("article_id")
+        .annotate(count=Count("*"))
+        .values("count")
+    )
+    comments = (
+        Comment.objects.filter(article_id=OuterRef("pk"))
+        .order_by()
+        .values("article_id")
+        .annotate(count=Count("*"))
+        .values("count")
+    )
+    updated = 0
+    last_id = Article.objects.order_by("-id").values_list("id", flat=True).first()
+    for start_id in range(0, (last_id or 0) + 1, batch_size):
+        updated += Article.objects.filter(
+            id__gte=start_id, id__lt=start_id + batch_size
+        ).update(
+            users_like_count=Coalesce(Subquery(likes), 0),
+            comment_count=Coalesce(Subquery(comments), 0),
+        )
+    return updated
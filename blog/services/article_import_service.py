@@ -0,0 +1,377 @@
+from ..models import Article, Category, Comment, Content, Image, Text, Video
+from .article_cache_service import invalidate_article_cache, invalidate_author_cache
+from .article_content_service import _get_search_vector
+from .article_rating_service import ArticlesIndex, ArticlesRating
+from .article_timeline_service import fan_out_articles
+from .utils import slugify
+from account.models import CustomUser
+from account.services.rating_service import UsersRating
+from account.services.redis_service import redis_write
+from account.services.user_counter_service import change_user_counter
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import reset_queries, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from typing import Iterable, Iterator, Optional
+import csv
+import json
+import logging.config
+import sys
+
+
+logging.config.dictConfig(settings.LOGGING)
+LOGGER = logging.getLogger("blog_logger")
+
+ARTICLES_RATING = ArticlesRating()
+ARTICLES_INDEX = ArticlesIndex()
+USERS_RATING = UsersRating()
+
+# тип блока контента: (модель, поле со значением блока)
+CONTENT_MODELS = {
+    "text": (Text, "text"),
+    "image": (Image, "image"),
+    "video": (Video, "url"),
+}
+
+
+class ArticleImportError(Exception):
+    pass
+
+
+def import_articles(
+    lines: Iterable[str], file_format: str = "jsonl", batch_size: int = 1000
+) -> tuple:
+    """
+    Потоковый импорт постов с контентом и комментариями.
+    Записи читаются по одной и сохраняются пачками по batch_size постов
+    (bulk_create, одна транзакция на пачку), после коммита пачки
+    рейтинги, индексы и ленты подписок в redis дополняются pipeline'ами.
+    Формат записи - см. _parse_record. Записи с ошибками, неизвестными
+    авторами или категориями и уже импортированные посты (см. _import_batch)
+    пропускаются, поэтому прерванный импорт можно запустить заново.
+    Возвращает (количество импортированных постов, пропущенных записей,
+    обновлён ли redis). Если redis обновить не удалось, посты сохранены
+    в БД, а рейтинги пересчитываются manage.py rebuild_ratings
+    """
+    categories = dict(Category.objects.values_list("title", "id"))
+    imported = skipped = 0
+    redis_synced = True
+    batch = []
+    for number, record in enumerate(_read_records(lines, file_format), start=1):
+        try:
+            batch.append(_parse_record(record))
+        except (ArticleImportError, ValueError, TypeError) as e:
+            LOGGER.error(f"import record {number} skipped: {e}")
+            skipped += 1
+            continue
+        if len(batch) == batch_size:
+            batch_imported, batch_synced = _import_batch(batch, categories)
+            imported, skipped = (
+                imported + batch_imported,
+                skipped + len(batch) - batch_imported,
+            )
+            redis_synced = redis_synced and batch_synced
+            batch = []
+    if batch:
+        batch_imported, batch_synced = _import_batch(batch, categories)
+        imported, skipped = (
+            imported + batch_imported,
+            skipped + len(batch) - batch_imported,
+        )
+        redis_synced = redis_synced and batch_synced
+    return imported, skipped, redis_synced
+
+
+def _read_records(lines: Iterable[str], file_format: str) -> Iterator:
+    """
+    Записи файла: строки JSON (jsonl) или строки csv с колонками
+    author, category, title, status, published, preview_image,
+    contents и comments (contents и comments - списки в JSON)
+    """
+    if file_format == "csv":
+        # текст поста может не поместиться в стандартный предел поля csv
+        csv.field_size_limit(sys.maxsize)
+        yield from csv.DictReader(lines)
+    elif file_format == "jsonl":
+        for line in lines:
+            if line.strip():
+                yield line
+    else:
+        raise ArticleImportError(f"unknown format {file_format}")
+
+
+def _parse_record(record) -> dict:
+    """
+    Проверяет и нормализует запись поста:
+        author, category (название), title - обязательные;
+        status - "draft" или "published" (по умолчанию);
+        published - дата публикации в ISO 8601 (по умолчанию - сейчас);
+        preview_image - путь к изображению в MEDIA_ROOT;
+        contents - блоки [{"type": "text", "text": ...},
+            {"type": "image", "image": путь}, {"type": "video", "url": ...}];
+        comments - [{"author": ..., "body": ..., "created": ISO 8601}]
+    """
+    if isinstance(record, str):
+        record = json.loads(record)
+    contents = _parse_json_list(record.get("contents"))
+    comments = _parse_json_list(record.get("comments"))
+    for field in ("author", "category", "title"):
+        if not record.get(field):
+            raise ArticleImportError(f"{field} is required")
+    status = record.get("status") or "published"
+    if status not in dict(Article.STATUS_CHOICES):
+        raise ArticleImportError(f"unknown status {status}")
+    blocks = []
+    for content in contents:
+        if content.get("type") not in CONTENT_MODELS:
+            raise ArticleImportError(f"unknown content type {content.get('type')}")
+        field = CONTENT_MODELS[content["type"]][1]
+        if not content.get(field):
+            raise ArticleImportError(f"{content['type']} content without {field}")
+        blocks.append((content["type"], content[field]))
+    for comment in comments:
+        if not comment.get("author") or not comment.get("body"):
+            raise ArticleImportError("comment author and body are required")
+    return {
+        "author": record["author"],
+        "category": record["category"],
+        "title": record["title"][: Article._meta.get_field("title").max_length],
+        "status": status,
+        "published": (
+            _parse_date(record.get("published")) or timezone.now()
+            if status == "published"
+            else None
+        ),
+        "preview_image": record.get("preview_image") or "",
+        "contents": blocks,
+        "comments": [
+            (
+                comment["author"],
+                comment["body"],
+                _parse_date(comment.get("created")),
+            )
+            for comment in comments
+        ],
+    }
+
+
+def _parse_json_list(value) -> list:
+    """Список из записи jsonl или колонки csv с JSON"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = json.loads(value)
+    if not isinstance(value, list):
+        raise ArticleImportError("contents and comments must be lists")
+    return value
+
+
+def _parse_date(value: Optional[str]):
+    if not value:
+        return None
+    date = parse_datetime(value)
+    if date is None:
+        raise ArticleImportError(f"invalid date {value}")
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+def _import_batch(records: list, categories: dict) -> tuple:
+    """
+    Сохраняет пачку постов, возвращает (количество сохранённых,
+    обновлён ли redis). Авторы и уже импортированные посты ищутся
+    одним запросом на пачку. Пост считается уже импортированным,
+    если у автора есть пост с тем же slug заголовка
+    """
+    usernames = {record["author"] for record in records} | {
+        author for record in records for author, _, _ in record["comments"]
+    }
+    user_ids = dict(
+        CustomUser.objects.filter(username__in=usernames).values_list("username", "id")
+    )
+    existing = _get_existing_articles(records, user_ids)
+    valid_records = []
+    for record in records:
+        unknown_users = {record["author"]} | {
+            author for author, _, _ in record["comments"]
+        }
+        unknown_users -= user_ids.keys()
+        if unknown_users:
+            LOGGER.error(
+                f"import article {record['title']} skipped: "
+                f"unknown users {', '.join(sorted(unknown_users))}"
+            )
+        elif record["category"] not in categories:
+            LOGGER.error(
+                f"import article {record['title']} skipped: "
+                f"unknown category {record['category']}"
+            )
+        elif (user_ids[record["author"]], _get_slug(record)) in existing:
+            LOGGER.warning(
+                f"import article {record['title']} skipped: already imported"
+            )
+        else:
+            existing.add((user_ids[record["author"]], _get_slug(record)))
+            valid_records.append(record)
+    if not valid_records:
+        return 0, True
+    with transaction.atomic():
+        articles = _create_articles(valid_records, categories, user_ids)
+        _create_contents(valid_records, articles)
+        _create_comments(valid_records, articles, user_ids)
+        for author_id, count in Counter(
+            article.author_id for article in articles
+        ).items():
+            change_user_counter(author_id, "article_count", count)
+    redis_synced = bool(
+        _add_to_redis(
+            [article for article in articles if article.status == "published"]
+        )
+    )
+    invalidate_article_cache()
+    invalidate_author_cache(*{article.author_id for article in articles})
+    # при DEBUG = True запросы копятся в памяти процесса
+    reset_queries()
+    return len(articles), redis_synced
+
+
+def _get_slug(record: dict) -> str:
+    return slugify(record["title"])[: Article._meta.get_field("slug").max_length]
+
+
+def _get_existing_articles(records: list, user_ids: dict) -> set:
+    """Пары (author_id, slug) постов пачки, которые уже есть в БД"""
+    pairs = {
+        (user_ids[record["author"]], _get_slug(record))
+        for record in records
+        if record["author"] in user_ids
+    }
+    if not pairs:
+        return set()
+    return {
+        pair
+        for pair in Article.objects.filter(
+            author_id__in={author_id for author_id, _ in pairs},
+            slug__in={slug for _, slug in pairs},
+        ).values_list("author_id", "slug")
+        if pair in pairs
+    }
+
+
+def _create_articles(records: list, categories: dict, user_ids: dict) -> list:
+    articles = []
+    for record in records:
+        texts = [
+            value
+            for content_type, value in record["contents"]
+            if content_type == "text"
+        ]
+        text = " ".join(texts)
+        articles.append(
+            Article(
+                category_id=categories[record["category"]],
+                author_id=user_ids[record["author"]],
+                title=record["title"],
+                slug=_get_slug(record),
+                preview_image=record["preview_image"],
+                published=record["published"],
+                status=record["status"],
+                text_preview=(texts[0] if texts else "")[
+                    : settings.ARTICLE_TEXT_PREVIEW_LENGTH
+                ],
+                comment_count=len(record["comments"]),
+                search_document=_get_search_vector(text, record["title"]),
+            )
+        )
+    return Article.objects.bulk_create(articles)
+
+
+def _create_contents(records: list, articles: list) -> None:
+    """
+    Объекты контента - одним bulk_create на модель,
+    связи Content - одним bulk_create в порядке блоков
+    """
+    content_objects = defaultdict(list)
+    blocks = []
+    for record, article in zip(records, articles):
+        for content_type, value in record["contents"]:
+            model, field = CONTENT_MODELS[content_type]
+            content_object = model(**{field: value})
+            content_objects[model].append(content_object)
+            blocks.append((article, content_object))
+    for model, objects in content_objects.items():
+        model.objects.bulk_create(objects)
+    content_types = ContentType.objects.get_for_models(*content_objects)
+    Content.objects.bulk_create(
+        Content(
+            article=article,
+            content_type=content_types[type(content_object)],
+            object_id=content_object.id,
+        )
+        for article, content_object in blocks
+    )
+
+
+def _create_comments(records: list, articles: list, user_ids: dict) -> None:
+    """
+    Комментарии - одним bulk_create. Поле created заполняется
+    при вставке (auto_now_add), даты из файла записываются после
+    """
+    comments, dates = [], []
+    for record, article in zip(records, articles):
+        for author, body, created in record["comments"]:
+            comments.append(
+                Comment(article=article, author_id=user_ids[author], body=body)
+            )
+            dates.append(created)
+    Comment.objects.bulk_create(comments)
+    dated_comments = []
+    for comment, created in zip(comments, dates):
+        if created is not None:
+            comment.created = created
+            dated_comments.append(comment)
+    if dated_comments:
+        Comment.objects.bulk_update(dated_comments, ["created"])
+
+
+@redis_write(retry=False)
+def _add_to_redis(articles: list) -> bool:
+    """
+    Рейтинги постов и авторов, индексы категорий и авторов
+    и ленты подписок для опубликованных постов пачки.
+    Возвращает True, если redis обновлён, и None, если redis недоступен
+    """
+    if not articles:
+        return True
+    weights = settings.ARTICLE_RATING_BY_ACTION
+    ARTICLES_RATING.add_articles(
+        (
+            article.id,
+            article.category_id,
+            weights["init"] + article.comment_count * weights["add_comment"],
+        )
+        for article in articles
+    )
+    for field in ("category", "author"):
+        ARTICLES_INDEX.fill(
+            field,
+            (
+                (article.id, getattr(article, f"{field}_id"), article.published)
+                for article in articles
+            ),
+        )
+    articles_by_author = defaultdict(list)
+    for article in articles:
+        articles_by_author[article.author_id].append((article.id, article.published))
+    USERS_RATING.incr_ratings(
+        {
+            author_id: len(rows) * settings.USER_RATING_BY_ACTION["create_article"]
+            for author_id, rows in articles_by_author.items()
+        }
+    )
+    for author_id, rows in articles_by_author.items():
+        fan_out_articles(author_id, rows)
+    return True
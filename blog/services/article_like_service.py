@@ -1,7 +1,9 @@
 from ..models import Article
 from .article_rating_service import ArticlesRating
-from .article_range_service import get_article_object
+from .article_counter_service import change_article_counter
 from django.conf import settings
+from django.db import transaction
+from typing import Optional
 import logging.config
 
 
@@ -9,26 +11,66 @@ logging.config.dictConfig(settings.LOGGING)
 LOGGER = logging.getLogger("blog_logger")
 
 RATING = ArticlesRating()
+ARTICLE_LIKE = Article.users_like.through
 
 
-def like_or_unlike_article(user, article_id: int, action: str) -> bool:
+def like_or_unlike_article(user, article_id: int, action: str) -> Optional[dict]:
     """
     Функция ставит или убирает лайк статье
     в зависимости от значения 'action' (like/unlike)
     и вызывает функцию изменения рейтинга.
-    Возвращает True, в случае успеха.
+    Лайк проверяется и меняется одной строкой связи (уникальный индекс),
+    поэтому повторные и одновременные запросы не меняют счётчик
+    и рейтинг дважды.
+    Возвращает состояние лайка или None, если статья не найдена
     """
-    try:
-        article = get_article_object(int(article_id))
+    article_id = int(article_id)
+    if not Article.objects.filter(id=article_id).exists():
+        LOGGER.error(f"like/unlike error, article {article_id} not found")
+        return None
+    like = ARTICLE_LIKE.objects.filter(article_id=article_id, customuser_id=user.id)
+    with transaction.atomic():
         if action == "like":
-            if user not in article.users_like.all():
-                article.users_like.add(user)
-                RATING.incr_or_decr_rating_by_id(action="like", object_id=article_id)
+            _, changed = ARTICLE_LIKE.objects.get_or_create(
+                article_id=article_id, customuser_id=user.id
+            )
         else:
-            if user in article.users_like.all():
-                article.users_like.remove(user)
-                RATING.incr_or_decr_rating_by_id(action="unlike", object_id=article_id)
-        return True
-    except Article.DoesNotExist:
-        LOGGER.error(f"like/unlike error, article {article_id} not found")
-        return False
+            changed = bool(like.delete()[0])
+        if changed:
+            change_article_counter(
+                article_id, "users_like_count", 1 if action == "like" else -1
+            )
+    if changed:
+        RATING.incr_or_decr_rating_by_id(
+            action="like" if action == "like" else "unlike", object_id=article_id
+        )
+    return {
+        "liked": action == "like",
+        "changed": changed,
+        "users_like_count": Article.objects.filter(id=article_id)
+        .values_list("users_like_count", flat=True)
+        .first(),
+    }
+
+
+def get_liked_article_ids(user, article_ids: list) -> set:
+    """id статей из article_ids, которые лайкнул пользователь, одним запросом"""
+    if not user or not user.is_authenticated or not article_ids:
+        return set()
+    return set(
+        ARTICLE_LIKE.objects.filter(
+            customuser_id=user.id, article_id__in=article_ids
+        ).values_list("article_id", flat=True)
+    )
+
+
+async def aget_liked_article_ids(user, article_ids: list) -> set:
+    """Асинхронная версия get_liked_article_ids"""
+    if not user or not user.is_authenticated or not article_ids:
+        return set()
+    return {
+        article_id
+        async for article_id in ARTICLE_LIKE.objects.filter(
+            customuser_id=user.id, article_id__in=article_ids
+        ).values_list("article_id", flat=True)
+    }
@@ -1,15 +1,53 @@
-from ..models import Article
-from .article_rating_service import ArticlesRating
+from ..models import Article, Category, Comment, Content
+from .article_rating_service import (
+    ArticlesRating,
+    ArticlesIndex,
+    ArticlesTimeline,
+    ArticlesTrending,
+)
+from account.models import CustomUser, Subscription
+from account.services.rating_service import SortedRatingList
+from account.services.redis_service import REDIS_BREAKER
 from account.services.users_range_service import get_filtered_user_list
 from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, FloatField, Prefetch
+from django.db.models.functions import Cast
 from django.db.models.query import QuerySet
 from django.http import Http404
+from typing import Optional, Union
 import logging.config
+import redis
 
 
 logging.config.dictConfig(settings.LOGGING)
 LOGGER = logging.getLogger("blog_logger")
 
+ARTICLES_RATING = ArticlesRating()
+ARTICLES_TRENDING = ArticlesTrending()
+ARTICLES_INDEX = ArticlesIndex()
+ARTICLES_TIMELINE = ArticlesTimeline()
+
+
+class SortedArticleList(SortedRatingList):
+    """
+    Ленивый список опубликованных постов, упорядоченный по убыванию
+    score sorted set'а в redis (рейтинг или дата публикации в ленте)
+    """
+
+    rating = ArticlesRating()
+
+    def _get_objects_by_ids(self, article_ids: list) -> list:
+        """Посты из БД в порядке article_ids"""
+        articles = (
+            Article.published_manager.select_related("category", "author")
+            .defer("search_document")
+            .in_bulk(article_ids)
+        )
+        return [
+            articles[article_id] for article_id in article_ids if article_id in articles
+        ]
+
 
 def get_article_object(article_id: int) -> Article:
     """Получаем пост по id"""
@@ -21,18 +59,110 @@ def get_article_object(article_id: int) -> Article:
     return article
 
 
+async def aget_article_object(article_id: int) -> Article:
+    """Асинхронно получаем пост по id вместе с автором"""
+    article = (
+        await Article.objects.select_related("author")
+        .defer("search_document")
+        .filter(id=article_id)
+        .afirst()
+    )
+    if article is None:
+        LOGGER.error(f"article {article_id} not found")
+        raise Http404(f"Пост {article_id} не найден")
+    return article
+
+
+def get_article_detail_object(article_id: int) -> Article:
+    """
+    Получаем пост по id вместе со всем, что выводится на странице поста.
+    Объекты контента (GenericForeignKey) загружаются одним запросом
+    на каждый тип контента, поэтому количество запросов не зависит
+    от количества блоков в статье
+    """
+    contents = Content.objects.select_related("content_type").prefetch_related(
+        "content_object"
+    )
+    try:
+        article = (
+            Article.objects.select_related("category", "author")
+            .defer("search_document")
+            .prefetch_related(
+                Prefetch("contents", queryset=contents),
+                Prefetch("comments", queryset=Comment.objects.select_related("author")),
+            )
+            .get(id=article_id)
+        )
+    except Article.DoesNotExist:
+        LOGGER.error(f"article {article_id} not found")
+        raise Http404(f"Пост {article_id} не найден")
+    return article
+
+
 def get_filtered_and_sorted_article_list(
     username: str,
     category_slug: str = None,
     filter_by: str = "all",
     order_by: str = "date",
-) -> QuerySet[Article]:
-    """Вызывает функции фильтрации и сортировки постов"""
+) -> Union[QuerySet[Article], SortedArticleList]:
+    """
+    Вызывает функции фильтрации и сортировки постов.
+    Сортировка по рейтингу и популярности выполняется в redis,
+    черновики рейтинга не имеют и сортируются по дате.
+    Лента подписок по дате читается из redis.
+    Если redis недоступен или при чтении из него произошла ошибка,
+    посты выбираются из БД и сортируются по дате
+    """
+    redis_available = REDIS_BREAKER.is_available()
+    try:
+        if (
+            redis_available
+            and order_by in ("rating", "trending")
+            and not (username and filter_by == "draft")
+        ):
+            if order_by == "trending":
+                ARTICLES_TRENDING.refresh()
+                return _get_order_by_rating(
+                    username, category_slug, filter_by, ARTICLES_TRENDING
+                )
+            return _get_order_by_rating(username, category_slug, filter_by)
+        if redis_available and username and filter_by == "subscriptions":
+            return _get_subscriptions_timeline(username, category_slug)
+    except redis.RedisError as e:
+        LOGGER.error(f"article list redis error: {e}")
+        REDIS_BREAKER.record_failure(e)
     articles = _get_filtered_article_list(username, category_slug, filter_by)
     articles = _get_sorted_article_list(articles, order_by)
     return articles
 
 
+def search_articles(query: str, category_slug: str = None) -> QuerySet[Article]:
+    """
+    Полнотекстовый поиск по заголовкам и тексту опубликованных постов.
+    Запрос разбирается в каждой из конфигураций ARTICLE_SEARCH_CONFIGS,
+    посты сортируются по релевантности (аннотация rank).
+    ts_rank возвращает float4, а курсор keyset пагинации хранит rank
+    как float8, поэтому rank приводится к float8 и в сортировке,
+    и в условии курсора сравниваются одни и те же значения
+    """
+    articles = _get_article_list_by_category(category_slug)
+    if not query:
+        return articles.none()
+    search_query = None
+    for config in settings.ARTICLE_SEARCH_CONFIGS:
+        config_query = SearchQuery(query, config=config, search_type="websearch")
+        search_query = (
+            config_query if search_query is None else search_query | config_query
+        )
+    return (
+        articles.filter(search_document=search_query)
+        .annotate(
+            rank=Cast(SearchRank(F("search_document"), search_query), FloatField())
+        )
+        .order_by("-rank", "-id")
+    )
+
+
 def _get_filtered_article_list(
     username: str, category_slug: str, filter_by: str
 ) -> QuerySet[Article]:
@@ -65,44 +195,158 @@ def _get_article_list_by_category(category_slug: str) -> QuerySet[Article]:
     Возвращает qs постов по категории.
     Если категория не задана, возвращает все посты
     """
+    articles = Article.published_manager.select_related("category", "author").defer(
+        "search_document"
+    )
     if category_slug:
-        return Article.published_manager.prefetch_related(
-            "users_like", "comments"
-        ).filter(category__slug=category_slug)
-    return Article.published_manager.prefetch_related("users_like", "comments").all()
+        return articles.filter(category__slug=category_slug)
+    return articles
 
 
 def _get_sorted_article_list(article_list: QuerySet[Article], order_by: str):
     """
     Получаем отсортированный qs постов
     Значения order_by:
-        'rating' - сортировать по рейтингу;
+        'rating', 'trending' - для черновиков сортировать по date;
         'date' - сортировать по date.
     """
-    if order_by in settings.ARTICLE_ORDER_LIST:
-        if order_by == "rating":
-            return _get_order_by_rating(article_list)
-        return _get_order_by_date(article_list)
-    LOGGER.error(f"unknown order {order_by}")
+    if order_by not in settings.ARTICLE_ORDER_LIST:
+        LOGGER.error(f"unknown order {order_by}")
     return _get_order_by_date(article_list)
 
 
-def _get_order_by_rating(article_list: QuerySet[Article]) -> list:
-    """Возвращает список постов, отсортированный по рейтингу"""
-    article_list = list(article_list)
-    rating = ArticlesRating()
-    articles_sorted_by_rating_ids = [
-        int(article_id) for article_id in rating.get_range_list_by_rating()
-    ]
-    try:
-        article_list.sort(
-            key=lambda article: articles_sorted_by_rating_ids.index(article.id)
+def _get_order_by_rating(
+    username: str,
+    category_slug: str,
+    filter_by: str,
+    rating: Union[ArticlesRating, ArticlesTrending] = ARTICLES_RATING,
+) -> SortedArticleList:
+    """
+    Возвращает список постов, отсортированный по рейтингу
+    (или по рейтингу популярности, rating=ARTICLES_TRENDING).
+    Фильтры те же, что в _get_filtered_article_list, но применяются
+    в redis пересечением рейтинга с индексами категорий и авторов.
+    По категории рейтинг читается из собственного рейтинга категории
+    """
+    intersect_keys, union_keys, rating_key = [], None, rating.redis_key
+    if category_slug:
+        category_id = _get_category_id(category_slug)
+        if category_id is None:
+            return SortedArticleList(None)
+        if rating is ARTICLES_RATING:
+            rating_key = get_category_rating_key(category_id)
+        else:
+            intersect_keys += get_article_index_keys("category", [category_id])
+    if username:
+        if filter_by == "subscriptions":
+            author_ids = list(
+                Subscription.objects.filter(from_user__username=username).values_list(
+                    "to_user_id", flat=True
+                )
+            )
+            if not author_ids:
+                return SortedArticleList(None)
+            union_keys = get_article_index_keys("author", author_ids)
+        elif filter_by != "all":
+            if filter_by not in settings.ARTICLE_FILTER_LIST:
+                LOGGER.error(f"unknown filter {filter_by}")
+            author_id = _get_user_id(username)
+            if author_id is None:
+                return SortedArticleList(None)
+            intersect_keys += get_article_index_keys("author", [author_id])
+    if not intersect_keys and not union_keys:
+        return SortedArticleList(rating_key)
+    return SortedArticleList(
+        rating.get_filtered_rating_key(intersect_keys, union_keys, rating_key)
+    )
+
+
+def _get_subscriptions_timeline(username: str, category_slug: str) -> SortedArticleList:
+    """
+    Возвращает ленту подписок пользователя, отсортированную по дате.
+    Посты авторов с большим количеством подписчиков по лентам
+    не рассылаются и подмешиваются из индексов авторов при чтении
+    """
+    user_id = _get_user_id(username)
+    if user_id is None:
+        return SortedArticleList(None)
+    category_key = None
+    if category_slug:
+        category_id = _get_category_id(category_slug)
+        if category_id is None:
+            return SortedArticleList(None)
+        category_key = get_article_index_keys("category", [category_id])[0]
+    if not ARTICLES_TIMELINE.exists(user_id):
+        following = Subscription.objects.filter(from_user_id=user_id).values(
+            "to_user_id"
         )
-    except ValueError:
-        LOGGER.error(
-            f"Rating sort error of article list {article_list}. Some articles have not rating"
+        ARTICLES_TIMELINE.fill(
+            user_id,
+            Article.published_manager.filter(author_id__in=following)
+            .order_by("-published")
+            .values_list("id", "published")[: ARTICLES_TIMELINE.max_length],
         )
-    return article_list
+    author_keys = []
+    celebrity_ids = ARTICLES_TIMELINE.get_celebrities()
+    if celebrity_ids:
+        followed_celebrity_ids = list(
+            Subscription.objects.filter(
+                from_user_id=user_id, to_user_id__in=celebrity_ids
+            ).values_list("to_user_id", flat=True)
+        )
+        if followed_celebrity_ids:
+            author_keys = get_article_index_keys("author", followed_celebrity_ids)
+    return SortedArticleList(
+        ARTICLES_TIMELINE.get_feed_key(user_id, author_keys, category_key)
+    )
+
+
+def get_article_index_keys(field: str, values: list) -> list:
+    """
+    Возвращает ключи индексов постов (field - 'category' или 'author').
+    Не построенные по БД индексы строятся и отмечаются построенными.
+    Посты, опубликованные во время построения, добавляются в индекс
+    публикацией, поэтому отметка ставится после заполнения
+    """
+    missing_values = ARTICLES_INDEX.get_missing_values(field, values)
+    if missing_values:
+        ARTICLES_INDEX.fill(
+            field,
+            Article.published_manager.filter(**{f"{field}_id__in": missing_values})
+            .values_list("id", f"{field}_id", "published")
+            .iterator(),
+        )
+        ARTICLES_INDEX.mark_filled(field, missing_values)
+    return [ARTICLES_INDEX.get_key(field, value) for value in values]
+
+
+def get_category_rating_key(category_id: int) -> str:
+    """
+    Возвращает ключ рейтинга категории.
+    Незаполненный рейтинг категории заполняется по БД
+    """
+    if not ARTICLES_RATING.is_category_filled(category_id):
+        ARTICLES_RATING.fill_category(
+            category_id,
+            Article.published_manager.filter(category_id=category_id)
+            .values_list("id", flat=True)
+            .iterator(),
+        )
+    return ARTICLES_RATING.get_category_key(category_id)
+
+
+def _get_category_id(category_slug: str) -> Optional[int]:
+    return (
+        Category.objects.filter(slug=category_slug).values_list("id", flat=True).first()
+    )
+
+
+def _get_user_id(username: str) -> Optional[int]:
+    return (
+        CustomUser.objects.filter(username=username)
+        .values_list("id", flat=True)
+        .first()
+    )
 
 
 def _get_order_by_date(article_list: QuerySet[Article]) -> QuerySet[Article]:
@@ -1,29 +1,779 @@
 from account.services.rating_service import RatingBase, REDIS
+from account.services.redis_service import ASYNC_REDIS, redis_read, redis_write
 from django.conf import settings
+from collections import Counter
+from datetime import datetime
+from typing import Iterable, Optional
+import atexit
+import hashlib
+import logging.config
+import os
+import threading
+import time
+
+
+logging.config.dictConfig(settings.LOGGING)
+LOGGER = logging.getLogger("blog_logger")
+
+
+class ArticlesTrending(RatingBase):
+    """
+    Рейтинг популярности постов с затуханием.
+    Изменения рейтинга складываются в часовые sorted set'ы
+    (article_trending:{час}), которые живут window_hours часов.
+    Рейтинг популярности - ZUNIONSTORE часовых set'ов с весом,
+    убывающим вдвое каждые half_life_hours часов; он пересобирается
+    не чаще раза в cache_timeout секунд
+    """
+
+    rating_by_action = settings.ARTICLE_RATING_BY_ACTION
+    redis_key = "article_trending"
+    window_hours = settings.TRENDING_WINDOW_HOURS
+    half_life_hours = settings.TRENDING_HALF_LIFE_HOURS
+    cache_timeout = settings.TRENDING_CACHE_TIMEOUT
+
+    @staticmethod
+    def _get_hour() -> int:
+        return int(time.time() // 3600)
+
+    def get_bucket_key(self, hour: Optional[int] = None) -> str:
+        return f"{self.redis_key}:{self._get_hour() if hour is None else hour}"
+
+    @property
+    def bucket_timeout(self) -> int:
+        return self.window_hours * 3600
+
+    @redis_write()
+    def remove_article(self, article_id: int) -> None:
+        """Удаление поста из всех часовых set'ов и рейтинга популярности"""
+        hour = self._get_hour()
+        pipe = REDIS.pipeline(transaction=False)
+        for age in range(self.window_hours):
+            pipe.zrem(self.get_bucket_key(hour - age), article_id)
+        pipe.zrem(self.redis_key, article_id)
+        pipe.execute()
+
+    def refresh(self) -> None:
+        """
+        Пересборка рейтинга популярности. Ключ живёт два cache_timeout,
+        поэтому не исчезает во время чтения страниц после пересборки
+        """
+        if REDIS.ttl(self.redis_key) > self.cache_timeout:
+            return
+        hour = self._get_hour()
+        weights = {
+            self.get_bucket_key(hour - age): 0.5 ** (age / self.half_life_hours)
+            for age in range(self.window_hours)
+        }
+        pipe = REDIS.pipeline()
+        pipe.zunionstore(self.redis_key, weights)
+        pipe.expire(self.redis_key, self.cache_timeout * 2)
+        pipe.execute()
+
+
+# общая часть lua-скриптов изменения рейтинга поста:
+# KEYS[1] - рейтинг, KEYS[2] - hash пост -> категория,
+# KEYS[3] - текущий часовой set популярности;
+# ARGV[3] - время жизни часового set'а, ARGV[4] - категория поста,
+# прочитанная из hash до вызова ("" - поста нет в рейтингах категорий).
+# Рейтинг категории (category_key, передаётся в KEYS) меняется,
+# только если пост всё ещё в этой категории
+_INCR_ARTICLE_RATING_LUA = """
+local function incr_rating(article_id, amount, only_existing, category_key)
+    if only_existing == "1" and not redis.call("ZSCORE", KEYS[1], article_id) then
+        return 0
+    end
+    redis.call("ZINCRBY", KEYS[1], amount, article_id)
+    if category_key and redis.call("HGET", KEYS[2], article_id) == ARGV[4] then
+        redis.call("ZADD", category_key, "XX", "INCR", amount, article_id)
+    end
+    if tonumber(amount) ~= 0 then
+        redis.call("ZINCRBY", KEYS[3], amount, article_id)
+        redis.call("EXPIRE", KEYS[3], ARGV[3])
+    end
+    return 1
+end
+"""
 
 
 class ArticlesRating(RatingBase):
-    """Класс для подсчёта рейтинга постов"""
+    """
+    Класс для подсчёта рейтинга постов.
+    В рейтинг пост попадает при публикации.
+    Кроме общего рейтинга ведутся рейтинги категорий
+    (article_rating:category:{id}) и рейтинг популярности (ArticlesTrending),
+    все они меняются одним lua-скриптом. Рейтинг категории заполняется
+    из общего при первом чтении (fill_category), после этого
+    публикация, удаление и перенос поста поддерживают его сами
+    """
 
     rating_by_action = settings.ARTICLE_RATING_BY_ACTION
     redis_key = "article_rating"
+    categories_key = "article_rating:categories"
+    filled_categories_key = "article_rating:categories:filled"
+    category_key_prefix = "article_rating:category:"
+    trending = ArticlesTrending()
+
+    # KEYS[4] - рейтинг категории поста, если она известна
+    _incr_rating = REDIS.register_script(
+        _INCR_ARTICLE_RATING_LUA
+        + "return incr_rating(ARGV[1], ARGV[2], ARGV[5], KEYS[4])"
+    )
+    # добавляет зрителей (KEYS[4]) в HyperLogLog и увеличивает рейтинг поста
+    # на количество новых уникальных зрителей, KEYS[5] - рейтинг категории
+    _add_unique_views = REDIS.register_script(
+        _INCR_ARTICLE_RATING_LUA
+        + """
+        local before = redis.call("PFCOUNT", KEYS[4])
+        redis.call("PFADD", KEYS[4], unpack(ARGV, 6))
+        local added = redis.call("PFCOUNT", KEYS[4]) - before
+        if added > 0 then
+            incr_rating(ARGV[1], added * tonumber(ARGV[2]), "1", KEYS[5])
+        end
+        return added
+        """
+    )
+    # KEYS[3] - заполненные рейтинги категорий, за ними рейтинг прежней
+    # категории (если она есть) и рейтинг новой категории (если она есть);
+    # ARGV[2] - прежняя категория, прочитанная до вызова, ARGV[3] - новая
+    # категория ("" - пост удаляется из рейтингов категорий).
+    # Если категорию успели изменить, скрипт ничего не меняет и возвращает -1
+    _set_category = REDIS.register_script(
+        """
+        local old = redis.call("HGET", KEYS[2], ARGV[1]) or ""
+        if old ~= ARGV[2] then
+            return -1
+        end
+        local next_key = 4
+        if old ~= "" then
+            redis.call("ZREM", KEYS[next_key], ARGV[1])
+            next_key = next_key + 1
+        end
+        if ARGV[3] == "" then
+            redis.call("HDEL", KEYS[2], ARGV[1])
+            return 0
+        end
+        redis.call("HSET", KEYS[2], ARGV[1], ARGV[3])
+        local score = redis.call("ZSCORE", KEYS[1], ARGV[1])
+        if score and redis.call("SISMEMBER", KEYS[3], ARGV[3]) == 1 then
+            redis.call("ZADD", KEYS[next_key], score, ARGV[1])
+        end
+        return 1
+        """
+    )
+    _fill_category = REDIS.register_script(
+        """
+        for i = 2, #ARGV do
+            redis.call("HSET", KEYS[2], ARGV[i], ARGV[1])
+            local score = redis.call("ZSCORE", KEYS[1], ARGV[i])
+            if score then
+                redis.call("ZADD", KEYS[3], score, ARGV[i])
+            end
+        end
+        """
+    )
+
+    def _get_incr_keys_and_args(
+        self, article_id: int, amount: float, category_id: Optional[int]
+    ) -> tuple:
+        keys = [self.redis_key, self.categories_key, self.trending.get_bucket_key()]
+        args = [article_id, amount, self.trending.bucket_timeout, category_id or ""]
+        return keys, args
+
+    def _get_category_keys(self, *category_ids: Optional[int]) -> list:
+        """Ключи рейтингов известных категорий для KEYS скриптов"""
+        return [
+            self.get_category_key(category_id)
+            for category_id in category_ids
+            if category_id
+        ]
+
+    def get_categories(self, article_ids: list) -> list:
+        """Категории постов в рейтингах категорий (None - поста там нет)"""
+        return [
+            int(category_id) if category_id else None
+            for category_id in REDIS.hmget(self.categories_key, article_ids)
+        ]
+
+    @redis_write()
+    def incr_or_decr_rating_by_id(self, action: str, object_id: int) -> None:
+        """Изменение рейтинга поста, его категории и популярности"""
+        if action not in self.rating_by_action:
+            return super().incr_or_decr_rating_by_id(action, object_id)
+        category_id = self.get_categories([object_id])[0]
+        keys, args = self._get_incr_keys_and_args(
+            object_id, self.rating_by_action[action], category_id
+        )
+        self._incr_rating(
+            keys=keys + self._get_category_keys(category_id), args=args + [0]
+        )
+
+    def incr_rating_in_pipeline(
+        self, pipe, article_id: int, amount: float, category_id: Optional[int]
+    ) -> None:
+        """
+        Изменение рейтинга поста, который есть в рейтинге.
+        category_id - категория поста из get_categories
+        """
+        keys, args = self._get_incr_keys_and_args(article_id, amount, category_id)
+        self._incr_rating(
+            keys=keys + self._get_category_keys(category_id),
+            args=args + [1],
+            client=pipe,
+        )
+
+    def add_unique_views_in_pipeline(
+        self,
+        pipe,
+        article_id: int,
+        amount: float,
+        viewers_key: str,
+        viewers: list,
+        category_id: Optional[int],
+    ) -> None:
+        """Рейтинг amount за каждого нового уникального зрителя"""
+        keys, args = self._get_incr_keys_and_args(article_id, amount, category_id)
+        self._add_unique_views(
+            keys=keys + [viewers_key] + self._get_category_keys(category_id),
+            args=args + [1] + viewers,
+            client=pipe,
+        )
+
+    def _get_set_category_keys_and_args(
+        self,
+        article_id: int,
+        old_category_id: Optional[int],
+        category_id: Optional[int],
+    ) -> dict:
+        return {
+            "keys": [self.redis_key, self.categories_key, self.filled_categories_key]
+            + self._get_category_keys(old_category_id, category_id),
+            "args": [article_id, old_category_id or "", category_id or ""],
+        }
+
+    def add_articles(self, rows: Iterable[tuple]) -> None:
+        """
+        Добавление постов (article_id, category_id, рейтинг) в общий
+        рейтинг и рейтинги категорий одним pipeline, без рейтинга
+        популярности (импорт постов)
+        """
+        pipe = REDIS.pipeline(transaction=False)
+        for article_id, category_id, rating in rows:
+            pipe.zadd(self.redis_key, {article_id: rating})
+            self._set_category(
+                **self._get_set_category_keys_and_args(article_id, None, category_id),
+                client=pipe,
+            )
+        pipe.execute()
+
+    def get_category_key(self, category_id: int) -> str:
+        return f"{self.category_key_prefix}{category_id}"
+
+    def is_category_filled(self, category_id: int) -> bool:
+        return bool(REDIS.sismember(self.filled_categories_key, category_id))
+
+    def fill_category(
+        self, category_id: int, article_ids: Iterable[int], chunk_size: int = 1000
+    ) -> None:
+        """
+        Заполнение рейтинга категории из общего рейтинга.
+        Категория отмечается заполненной до чтения постов, чтобы посты,
+        опубликованные во время заполнения, попали в её рейтинг
+        """
+        REDIS.sadd(self.filled_categories_key, category_id)
+        keys = [self.redis_key, self.categories_key, self.get_category_key(category_id)]
+        chunk = []
+        for article_id in article_ids:
+            chunk.append(article_id)
+            if len(chunk) == chunk_size:
+                self._fill_category(keys=keys, args=[category_id] + chunk)
+                chunk = []
+        if chunk:
+            self._fill_category(keys=keys, args=[category_id] + chunk)
+
+    @redis_write()
+    def set_category(self, article_id: int, category_id: Optional[int]) -> None:
+        """
+        Перенос поста в рейтинг категории category_id,
+        None - удаление поста из рейтингов категорий.
+        Если категорию поста изменили между чтением и переносом,
+        перенос повторяется с новой прежней категорией
+        """
+        while True:
+            old_category_id = self.get_categories([article_id])[0]
+            moved = self._set_category(
+                **self._get_set_category_keys_and_args(
+                    article_id, old_category_id, category_id
+                )
+            )
+            if moved != -1:
+                return
+
+    def clear_rating_by_id(self, object_id: int) -> None:
+        self.set_category(object_id, None)
+        super().clear_rating_by_id(object_id)
+        self.trending.remove_article(object_id)
+
+    def _get_derived_keys(self) -> list:
+        """Рейтинги категорий заполнятся из нового рейтинга при чтении"""
+        return [
+            self.categories_key,
+            self.filled_categories_key,
+            *REDIS.scan_iter(match=f"{self.category_key_prefix}*", count=1000),
+        ]
+
+
+class ArticlesIndex:
+    """
+    Индексы опубликованных постов по категориям и авторам.
+    Индекс - sorted set из id постов с датой публикации в качестве score,
+    используется для фильтрации рейтинга на стороне redis.
+    Публикация добавляет пост в индекс, даже если индекс ещё не построен,
+    поэтому построенные по БД индексы отмечаются в множестве
+    article_index:filled:{поле}, а не определяются по наличию ключа
+    """
+
+    fields = ("category", "author")
+
+    @staticmethod
+    def get_key(field: str, value: int) -> str:
+        """Получение ключа индекса, например article_category:1"""
+        return f"article_{field}:{value}"
+
+    @staticmethod
+    def get_filled_key(field: str) -> str:
+        return f"article_index:filled:{field}"
+
+    @staticmethod
+    def _get_score(published: Optional[datetime]) -> float:
+        return published.timestamp() if published else 0
+
+    @redis_write()
+    def add_article(
+        self, article_id: int, category_id: int, author_id: int, published: datetime
+    ) -> None:
+        """Добавление поста в индексы категории и автора"""
+        score = self._get_score(published)
+        pipe = REDIS.pipeline()
+        pipe.zadd(self.get_key("category", category_id), {article_id: score})
+        pipe.zadd(self.get_key("author", author_id), {article_id: score})
+        pipe.execute()
+
+    @redis_write()
+    def remove_article(self, article_id: int, category_id: int, author_id: int) -> None:
+        """Удаление поста из индексов категории и автора"""
+        pipe = REDIS.pipeline()
+        pipe.zrem(self.get_key("category", category_id), article_id)
+        pipe.zrem(self.get_key("author", author_id), article_id)
+        pipe.execute()
+
+    def get_missing_values(self, field: str, values: list) -> list:
+        """Значения поля, для которых индекс ещё не построен по БД"""
+        if not values:
+            return []
+        filled = REDIS.smismember(self.get_filled_key(field), values)
+        return [value for value, is_filled in zip(values, filled) if not is_filled]
+
+    def mark_filled(self, field: str, values: list) -> None:
+        """Отмечает индексы значений поля построенными по БД"""
+        REDIS.sadd(self.get_filled_key(field), *values)
+
+    def clear(self) -> None:
+        """
+        Удаление всех индексов и отметок о построении,
+        индексы строятся заново по БД при чтении.
+        Отметки удаляются после индексов: иначе индекс, построенный
+        при чтении во время удаления, был бы удалён, а отметка осталась
+        """
+        for field in self.fields:
+            keys = []
+            for key in REDIS.scan_iter(match=self.get_key(field, "*"), count=1000):
+                keys.append(key)
+                if len(keys) == 1000:
+                    REDIS.delete(*keys)
+                    keys = []
+            if keys:
+                REDIS.delete(*keys)
+            REDIS.delete(self.get_filled_key(field))
+
+    def fill(self, field: str, rows: Iterable[tuple], chunk_size: int = 1000) -> None:
+        """
+        Заполнение индексов поля из строк (article_id, value, published).
+        Запись идёт пачками по chunk_size строк
+        """
+        pipe = REDIS.pipeline(transaction=False)
+        for number, (article_id, value, published) in enumerate(rows, start=1):
+            pipe.zadd(
+                self.get_key(field, value), {article_id: self._get_score(published)}
+            )
+            if number % chunk_size == 0:
+                pipe.execute()
+        pipe.execute()
+
+
+class ArticlesTimeline:
+    """
+    Ленты подписок пользователей (fan-out on write).
+    Лента - sorted set из id постов с датой публикации в качестве score,
+    в ней хранятся только max_length последних постов.
+    Отсутствующая лента строится из БД при первом чтении, поэтому
+    новые посты добавляются только в уже построенные ленты.
+    Пустой sorted set в redis не хранится, поэтому построенная
+    пустая лента отмечается ключом timeline:{id}:empty
+    """
+
+    max_length = settings.TIMELINE_MAX_LENGTH
+    timeout = settings.TIMELINE_TIMEOUT
+    feed_cache_timeout = settings.RATING_FILTER_CACHE_TIMEOUT
+    celebrities_key = "timeline:celebrities"
+
+    # KEYS[2] - отметка пустой ленты, ARGV[2] - время жизни ленты
+    _add_if_exists = REDIS.register_script(
+        """
+        local created = false
+        if redis.call("EXISTS", KEYS[1]) == 0 then
+            if redis.call("DEL", KEYS[2]) == 0 then
+                return 0
+            end
+            created = true
+        end
+        for i = 3, #ARGV, 2 do
+            redis.call("ZADD", KEYS[1], ARGV[i], ARGV[i + 1])
+        end
+        redis.call("ZREMRANGEBYRANK", KEYS[1], 0, -tonumber(ARGV[1]) - 1)
+        if created then
+            redis.call("EXPIRE", KEYS[1], ARGV[2])
+        end
+        return 1
+        """
+    )
+
+    @staticmethod
+    def get_key(user_id: int) -> str:
+        return f"timeline:{user_id}"
+
+    @staticmethod
+    def get_empty_key(user_id: int) -> str:
+        return f"timeline:{user_id}:empty"
+
+    @redis_read(default=False)
+    def exists(self, user_id: int) -> bool:
+        return bool(REDIS.exists(self.get_key(user_id), self.get_empty_key(user_id)))
+
+    def fill(self, user_id: int, rows: Iterable[tuple]) -> None:
+        """Построение ленты из строк (article_id, published)"""
+        key, empty_key = self.get_key(user_id), self.get_empty_key(user_id)
+        mapping = {
+            article_id: ArticlesIndex._get_score(published)
+            for article_id, published in rows
+        }
+        pipe = REDIS.pipeline()
+        pipe.delete(key, empty_key)
+        if mapping:
+            pipe.zadd(key, mapping)
+            pipe.zremrangebyrank(key, 0, -self.max_length - 1)
+            pipe.expire(key, self.timeout)
+        else:
+            pipe.set(empty_key, 1, ex=self.timeout)
+        pipe.execute()
+
+    @redis_write()
+    def add_articles(self, user_ids: list, rows: Iterable[tuple]) -> None:
+        """Добавление постов (article_id, published) в построенные ленты"""
+        args = [self.max_length, self.timeout]
+        for article_id, published in rows:
+            args += [ArticlesIndex._get_score(published), article_id]
+        if len(args) == 2:
+            return
+        pipe = REDIS.pipeline(transaction=False)
+        for user_id in user_ids:
+            self._add_if_exists(
+                keys=[self.get_key(user_id), self.get_empty_key(user_id)],
+                args=args,
+                client=pipe,
+            )
+        pipe.execute()
+
+    @redis_write()
+    def remove_article(self, user_ids: list, article_id: int) -> None:
+        """Удаление поста из лент"""
+        pipe = REDIS.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.zrem(self.get_key(user_id), article_id)
+        pipe.execute()
+
+    @redis_write()
+    def remove_index(self, user_id: int, index_key: str) -> None:
+        """Удаление из ленты всех постов индекса (например, постов автора)"""
+        key = self.get_key(user_id)
+        pipe = REDIS.pipeline()
+        pipe.zdiffstore(key, [key, index_key])
+        pipe.expire(key, self.timeout)
+        pipe.execute()
+
+    def get_feed_key(
+        self, user_id: int, author_keys: list, category_key: Optional[str] = None
+    ) -> str:
+        """
+        Ключ ленты для чтения. К ленте подмешиваются индексы авторов,
+        посты которых не рассылаются (author_keys), и она фильтруется
+        по индексу категории. Результат хранится feed_cache_timeout секунд
+        """
+        key = self.get_key(user_id)
+        pipe = REDIS.pipeline(transaction=False)
+        pipe.expire(key, self.timeout)
+        pipe.expire(self.get_empty_key(user_id), self.timeout)
+        pipe.execute()
+        if not author_keys and not category_key:
+            return key
+        digest = hashlib.md5(
+            "|".join(sorted(author_keys) + [str(category_key)]).encode()
+        ).hexdigest()
+        name = f"{key}:feed:{digest}"
+        if REDIS.exists(name):
+            return name
+        source = key
+        pipe = REDIS.pipeline()
+        if author_keys:
+            pipe.zunionstore(name, [key] + author_keys, aggregate="MAX")
+            source = name
+        if category_key:
+            pipe.zinterstore(name, {source: 1, category_key: 0})
+        pipe.expire(name, self.feed_cache_timeout)
+        pipe.execute()
+        return name
+
+    @redis_write()
+    def add_celebrity(self, author_id: int) -> None:
+        REDIS.sadd(self.celebrities_key, author_id)
+
+    @redis_write()
+    def remove_celebrity(self, author_id: int) -> bool:
+        """True - посты автора до этого не рассылались по лентам"""
+        return bool(REDIS.srem(self.celebrities_key, author_id))
+
+    def get_celebrities(self) -> list:
+        """Авторы, посты которых не рассылаются по лентам"""
+        return [int(author_id) for author_id in REDIS.smembers(self.celebrities_key)]
 
 
 class ArticleViewCounter:
-    """Класс для подсчёта количества постов"""
+    """
+    Класс для подсчёта количества просмотров постов.
+    Кроме всех просмотров считаются уникальные зрители поста
+    (HyperLogLog, ~12 КБ на пост)
+    """
 
     @staticmethod
     def _get_article_key(article_id: int) -> str:
         """Получение ключа по id поста"""
         return f"article:{article_id}:id"
 
+    @staticmethod
+    def _get_viewers_key(article_id: int) -> str:
+        return f"article:{article_id}:viewers"
+
+    @redis_write()
     def incr_view_count(self, article_id: int) -> None:
         """Увеличение количества просмотров на 1"""
         REDIS.incr(self._get_article_key(article_id))
 
+    @redis_read(default=0, stale=True)
     def get_article_view_count(self, article_id: int) -> int:
         """Получение количества просмотров поста"""
         view_count = REDIS.get(self._get_article_key(article_id))
         if not view_count:
             return 0
         return int(view_count)
+
+    @redis_write()
+    def add_views(self, views: dict, viewers: Optional[dict] = None) -> None:
+        """
+        Добавление просмотров {article_id: количество}, зрителей
+        {article_id: множество id зрителей} и рейтинга за просмотры
+        одним pipeline. При ARTICLE_RATING_BY_UNIQUE_VIEWS рейтинг
+        растёт только за новых уникальных зрителей.
+        Рейтинг меняется только у постов, которые есть в рейтинге,
+        поэтому запоздавшие просмотры не возвращают в рейтинг удалённый пост
+        """
+        if not views:
+            return
+        viewers = viewers or {}
+        rating = ArticlesRating()
+        rating_by_view = rating.rating_by_action["view"]
+        categories = dict(zip(views, rating.get_categories(list(views))))
+        pipe = REDIS.pipeline(transaction=False)
+        for article_id, count in views.items():
+            pipe.incrby(self._get_article_key(article_id), count)
+            article_viewers = list(viewers.get(article_id, ()))
+            if settings.ARTICLE_RATING_BY_UNIQUE_VIEWS:
+                if article_viewers:
+                    rating.add_unique_views_in_pipeline(
+                        pipe,
+                        article_id,
+                        rating_by_view,
+                        self._get_viewers_key(article_id),
+                        article_viewers,
+                        categories[article_id],
+                    )
+                continue
+            if article_viewers:
+                pipe.pfadd(self._get_viewers_key(article_id), *article_viewers)
+            rating.incr_rating_in_pipeline(
+                pipe, article_id, count * rating_by_view, categories[article_id]
+            )
+        pipe.execute()
+
+    @redis_read(fallback=lambda self, article_ids, unique=False: [0] * len(article_ids))
+    def get_view_counts(self, article_ids: list, unique: bool = False) -> list:
+        """
+        Количество просмотров (или уникальных зрителей)
+        постов article_ids одним pipeline
+        """
+        if unique:
+            pipe = REDIS.pipeline(transaction=False)
+            for article_id in article_ids:
+                pipe.pfcount(self._get_viewers_key(article_id))
+            return pipe.execute()
+        return [
+            int(view_count or 0)
+            for view_count in REDIS.mget(
+                [self._get_article_key(article_id) for article_id in article_ids]
+            )
+        ]
+
+    @redis_write()
+    def clear(self, article_id: int) -> None:
+        """Удаление счётчиков просмотров поста"""
+        REDIS.delete(
+            self._get_article_key(article_id), self._get_viewers_key(article_id)
+        )
+
+
+class ArticleViewBuffer:
+    """
+    Write-behind буфер просмотров. Просмотры копятся в памяти процесса
+    и записываются в redis одним pipeline, когда их набирается
+    flush_threshold или с прошлой записи прошло flush_interval секунд.
+    Остаток записывается при завершении процесса
+    """
+
+    flush_interval = settings.ARTICLE_VIEW_FLUSH_INTERVAL
+    flush_threshold = settings.ARTICLE_VIEW_FLUSH_THRESHOLD
+
+    def __init__(self, counter: ArticleViewCounter):
+        self.counter = counter
+        self._views = Counter()
+        self._viewers = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        atexit.register(self.flush)
+
+    def add(self, article_id: int, viewer_id: Optional[str] = None) -> None:
+        self._start_flusher()
+        with self._lock:
+            self._views[article_id] += 1
+            if viewer_id:
+                self._viewers.setdefault(article_id, set()).add(viewer_id)
+            self._size += 1
+            is_full = self._size >= self.flush_threshold
+        if is_full:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            views, viewers = self._views, self._viewers
+            self._views, self._viewers, self._size = Counter(), {}, 0
+        try:
+            self.counter.add_views(views, viewers)
+        except Exception as e:
+            LOGGER.error(f"flush article views error: {e}")
+            with self._lock:
+                self._views.update(views)
+                for article_id, article_viewers in viewers.items():
+                    self._viewers.setdefault(article_id, set()).update(article_viewers)
+                self._size += sum(views.values())
+
+    def _start_flusher(self) -> None:
+        """
+        Поток периодической записи запускается в каждом процессе
+        при первом просмотре (после fork воркера)
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._views, self._viewers, self._size = Counter(), {}, 0
+        threading.Thread(target=self._flush_periodically, daemon=True).start()
+
+    def _flush_periodically(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+
+def _get_zero_rating_and_views(article_ids: list) -> dict:
+    return {
+        article_id: {"rating": 0, "view_count": 0, "unique_view_count": 0}
+        for article_id in article_ids
+    }
+
+
+def get_articles_rating_and_views(article_ids: list) -> dict:
+    """
+    Рейтинг, количество просмотров и уникальных зрителей постов
+    за одно обращение к redis (pipeline из ZMSCORE, MGET и PFCOUNT):
+    {id: {"rating": int, "view_count": int, "unique_view_count": int}}.
+    Если redis недоступен, значения нулевые.
+    Пустой список в redis не запрашивается и не закрывает выключатель
+    """
+    if not article_ids:
+        return {}
+    return _get_articles_rating_and_views(article_ids)
+
+
+@redis_read(fallback=_get_zero_rating_and_views)
+def _get_articles_rating_and_views(article_ids: list) -> dict:
+    pipe = REDIS.pipeline(transaction=False)
+    _add_rating_and_views_commands(pipe, article_ids)
+    return _get_rating_and_views(article_ids, pipe.execute())
+
+
+async def aget_articles_rating_and_views(article_ids: list) -> dict:
+    """Асинхронная версия get_articles_rating_and_views"""
+    if not article_ids:
+        return {}
+    return await _aget_articles_rating_and_views(article_ids)
+
+
+@redis_read(fallback=_get_zero_rating_and_views)
+async def _aget_articles_rating_and_views(article_ids: list) -> dict:
+    pipe = ASYNC_REDIS.pipeline(transaction=False)
+    _add_rating_and_views_commands(pipe, article_ids)
+    return _get_rating_and_views(article_ids, await pipe.execute())
+
+
+def _add_rating_and_views_commands(pipe, article_ids: list) -> None:
+    pipe.zmscore(ArticlesRating.redis_key, article_ids)
+    pipe.mget(
+        [ArticleViewCounter._get_article_key(article_id) for article_id in article_ids]
+    )
+    for article_id in article_ids:
+        pipe.pfcount(ArticleViewCounter._get_viewers_key(article_id))
+
+
+def _get_rating_and_views(article_ids: list, results: list) -> dict:
+    ratings, view_counts, *unique_view_counts = results
+    return {
+        article_id: {
+            "rating": int(rating or 0),
+            "view_count": int(view_count or 0),
+            "unique_view_count": unique_view_count,
+        }
+        for article_id, rating, view_count, unique_view_count in zip(
+            article_ids, ratings, view_counts, unique_view_counts
+        )
+    }
@@ -0,0 +1,94 @@
+from ..models import Article
+from .article_range_service import get_article_index_keys
+from .article_rating_service import ArticlesTimeline
+from account.models import CustomUser, Subscription
+from django.conf import settings
+import logging.config
+
+
+logging.config.dictConfig(settings.LOGGING)
+LOGGER = logging.getLogger("blog_logger")
+
+TIMELINE = ArticlesTimeline()
+
+
+def fan_out_article(article: Article) -> None:
+    """Рассылает опубликованный пост по лентам подписчиков автора"""
+    fan_out_articles(article.author_id, [(article.id, article.published)])
+
+
+def fan_out_articles(author_id: int, rows: list) -> None:
+    """
+    Рассылает опубликованные посты автора (article_id, published)
+    по лентам подписчиков пачками по TIMELINE_FANOUT_BATCH_SIZE.
+    Посты авторов с большим количеством подписчиков не рассылаются,
+    а подмешиваются при чтении. Когда подписчиков становится меньше,
+    по лентам рассылаются и последние посты автора, опубликованные
+    без рассылки
+    """
+    if _is_celebrity(author_id):
+        TIMELINE.add_celebrity(author_id)
+        return
+    if TIMELINE.remove_celebrity(author_id):
+        rows = (
+            Article.published_manager.filter(author_id=author_id)
+            .order_by("-published")
+            .values_list("id", "published")[: TIMELINE.max_length]
+        )
+    subscribers = Subscription.objects.filter(to_user_id=author_id)
+    for user_ids in _get_subscriber_id_batches(subscribers):
+        TIMELINE.add_articles(user_ids, rows)
+
+
+def remove_article_from_timelines(article: Article) -> None:
+    """
+    Удаляет пост из лент подписчиков автора. Ленты обходятся
+    и для авторов с большим количеством подписчиков: пост мог быть
+    разослан, пока подписчиков было меньше
+    """
+    subscribers = Subscription.objects.filter(to_user_id=article.author_id)
+    for user_ids in _get_subscriber_id_batches(subscribers):
+        TIMELINE.remove_article(user_ids, article.id)
+
+
+def add_author_to_timeline(user_id: int, author_id: int) -> None:
+    """Добавляет в ленту пользователя последние посты нового автора"""
+    if not TIMELINE.exists(user_id):
+        return
+    TIMELINE.add_articles(
+        [user_id],
+        Article.published_manager.filter(author_id=author_id)
+        .order_by("-published")
+        .values_list("id", "published")[: TIMELINE.max_length],
+    )
+
+
+def remove_author_from_timeline(user_id: int, author_id: int) -> None:
+    """Удаляет из ленты пользователя посты автора, от которого он отписался"""
+    if not TIMELINE.exists(user_id):
+        return
+    TIMELINE.remove_index(user_id, get_article_index_keys("author", [author_id])[0])
+
+
+def _is_celebrity(author_id: int) -> bool:
+    """Посты автора не рассылаются по лентам подписчиков"""
+    subscriber_count = (
+        CustomUser.objects.filter(id=author_id)
+        .values_list("subscriber_count", flat=True)
+        .first()
+    )
+    return (subscriber_count or 0) > settings.TIMELINE_FANOUT_MAX_SUBSCRIBERS
+
+
+def _get_subscriber_id_batches(subscribers):
+    batch_size = settings.TIMELINE_FANOUT_BATCH_SIZE
+    batch = []
+    for user_id in subscribers.values_list("from_user_id", flat=True).iterator(
+        chunk_size=batch_size
+    ):
+        batch.append(user_id)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,89 @@
+from ..models import Article, Comment
+from .article_rating_service import ArticlesIndex, ArticlesRating, ArticleViewCounter
+from account.models import CustomUser, Subscription
+from account.services.rating_service import UsersRating
+from django.conf import settings
+from django.db.models import Count
+from django.db.models.query import QuerySet
+from typing import Iterator
+import logging.config
+
+
+logging.config.dictConfig(settings.LOGGING)
+LOGGER = logging.getLogger("blog_logger")
+
+
+def rebuild_article_rating(chunk_size: int = 10000) -> int:
+    """
+    Пересчитывает рейтинг опубликованных постов: просмотры из redis,
+    лайки и комментарии - агрегатами в БД по chunk_size постов.
+    Индексы категорий и авторов удаляются и строятся заново по БД
+    при чтении. Возвращает количество постов в рейтинге
+    """
+    weights = settings.ARTICLE_RATING_BY_ACTION
+    view_counter = ArticleViewCounter()
+
+    def get_ratings():
+        for article_ids in _get_id_chunks(Article.published_manager.all(), chunk_size):
+            likes = _count_by(
+                Article.users_like.through.objects, "article_id", article_ids
+            )
+            comments = _count_by(Comment.objects, "article_id", article_ids)
+            view_counts = view_counter.get_view_counts(
+                article_ids, unique=settings.ARTICLE_RATING_BY_UNIQUE_VIEWS
+            )
+            for article_id, view_count in zip(article_ids, view_counts):
+                yield article_id, (
+                    view_count * weights["view"]
+                    + likes.get(article_id, 0) * weights["like"]
+                    + comments.get(article_id, 0) * weights["add_comment"]
+                )
+
+    count = ArticlesRating().rebuild(get_ratings(), chunk_size)
+    ArticlesIndex().clear()
+    return count
+
+
+def rebuild_user_rating(chunk_size: int = 10000) -> int:
+    """
+    Пересчитывает рейтинг пользователей по количеству подписчиков
+    и опубликованных постов. Возвращает количество пользователей в рейтинге
+    """
+    weights = settings.USER_RATING_BY_ACTION
+
+    def get_ratings():
+        for user_ids in _get_id_chunks(CustomUser.objects.all(), chunk_size):
+            subscribers = _count_by(Subscription.objects, "to_user_id", user_ids)
+            articles = _count_by(Article.published_manager, "author_id", user_ids)
+            for user_id in user_ids:
+                yield user_id, (
+                    subscribers.get(user_id, 0) * weights["add_subscriber"]
+                    + articles.get(user_id, 0) * weights["create_article"]
+                )
+
+    return UsersRating().rebuild(get_ratings(), chunk_size)
+
+
+def _get_id_chunks(queryset: QuerySet, chunk_size: int) -> Iterator[list]:
+    """id объектов qs списками по chunk_size"""
+    chunk = []
+    for object_id in (
+        queryset.order_by("id").values_list("id", flat=True).iterator(chunk_size)
+    ):
+        chunk.append(object_id)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _count_by(manager, field: str, values: list) -> dict:
+    """Количество строк по значениям поля field: {value: count}"""
+    return dict(
+        manager.filter(**{f"{field}__in": values})
+        .order_by()
+        .values(field)
+        .annotate(count=Count("*"))
+        .values_list(field, "count")
+    )
@@ -0,0 +1,47 @@
+from .services.article_cache_service import (
+    invalidate_article_cache,
+    invalidate_author_cache,
+    invalidate_commenter_cache,
+)
+from .services.article_timeline_service import (
+    add_author_to_timeline,
+    remove_author_from_timeline,
+)
+from account.models import CustomUser
+from account.signals import subscription_changed
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+
+@receiver(subscription_changed)
+def update_timeline_on_subscription_changed(
+    sender, from_user_id, to_user_id, action, **kwargs
+):
+    """Поддерживает ленту подписок в актуальном состоянии"""
+    if action == "add":
+        add_author_to_timeline(from_user_id, to_user_id)
+    else:
+        remove_author_from_timeline(from_user_id, to_user_id)
+
+
+@receiver(subscription_changed)
+def invalidate_author_cache_on_subscription_changed(
+    sender, from_user_id, to_user_id, **kwargs
+):
+    """Количество подписок и подписчиков выводится в карточке автора"""
+    invalidate_author_cache(from_user_id, to_user_id)
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_author_cache_on_profile_changed(
+    sender, instance, created, update_fields=None, **kwargs
+):
+    """
+    Имя и профиль автора выводятся в списке и на странице поста,
+    имя автора комментария - на странице поста
+    """
+    if not created:
+        invalidate_article_cache()
+        invalidate_author_cache(instance.id)
+        if update_fields is None or "username" in update_fields:
+            invalidate_commenter_cache(instance.id)
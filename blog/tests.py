@@ -1,3 +1,1208 @@
-from django.test import TestCase
+from .models import Article, Category, Comment, Content, Image, Text, Video
+from .pagination import KeysetPagination
+from .services.article_content_service import ARTICLE_VIEW_BUFFER, publish_article
+from .services.article_import_service import import_articles
+from .services.article_rating_service import (
+    ArticlesIndex,
+    ArticlesRating,
+    ArticlesTimeline,
+    ArticlesTrending,
+)
+from account.services import redis_service
+from account.services.user_counter_service import change_user_counter
+from account.tests import RedisTestCase
+from collections import Counter
+from config import yasg
+from django.apps import apps
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from unittest import mock, skipUnless
+import gzip
+import importlib
+import io
+import json
+import pathlib
+import tempfile
 
-# Create your tests here.
+
+class BlogTestCase(RedisTestCase):
+    """Автор, категории и клиенты API для тестов постов"""
+
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_user("author")
+        self.reader = self.create_user("reader")
+        self.category = Category.objects.create(title="Наука", slug="nauka")
+        self.other_category = Category.objects.create(title="Спорт", slug="sport")
+        self.anonymous_client = APIClient()
+        self.author_client = APIClient()
+        self.author_client.force_authenticate(self.author)
+        self.reader_client = APIClient()
+        self.reader_client.force_authenticate(self.reader)
+
+    def create_article(
+        self, title: str, category: Category = None, author=None, publish: bool = True
+    ) -> Article:
+        article = Article.objects.create(
+            title=title,
+            category=category or self.category,
+            author=author or self.author,
+        )
+        change_user_counter(article.author_id, "article_count", 1)
+        if publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                publish_article(article)
+        return article
+
+    def add_text(self, article: Article, text: str) -> Content:
+        """Текстовый блок поста через API"""
+        response = self.author_client.post(
+            f"/api/blog/articles/{article.id}/contents/text/", {"text": text}
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        return Content.objects.get(article=article, object_id=response.json()["id"])
+
+    def walk(self, client: APIClient, url: str) -> list:
+        """id объектов всех страниц, по ссылкам next"""
+        ids = []
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            ids += [item["id"] for item in response.json()["results"]]
+            url = response.json()["next"]
+        return ids
+
+
+class KeysetPaginationTest(BlogTestCase):
+    """Keyset пагинация постов и комментариев (?pagination=cursor)"""
+
+    def test_article_pages_follow_date_and_id_order(self):
+        articles = [self.create_article(f"Пост {i}") for i in range(7)]
+        same_date = timezone.now()
+        Article.objects.filter(id__in=[a.id for a in articles[2:5]]).update(
+            published=same_date
+        )
+        self.create_article("Черновик", publish=False)
+        expected = list(
+            Article.published_manager.order_by("-published", "-id").values_list(
+                "id", flat=True
+            )
+        )
+        ids = self.walk(
+            self.reader_client,
+            "/api/blog/articles/?filter=all&pagination=cursor&limit=2",
+        )
+        self.assertEqual(ids, expected)
+
+    def test_rating_pages_with_equal_ratings(self):
+        articles = [self.create_article(f"Пост {i}") for i in range(7)]
+        for article in articles[:2]:
+            self.reader_client.post(
+                f"/api/blog/articles/{article.id}/like-unlike/", {"action": "like"}
+            )
+        expected = [
+            int(article_id)
+            for article_id in self.redis.zrevrange("article_rating", 0, -1)
+        ]
+        ids = self.walk(
+            self.reader_client,
+            "/api/blog/articles/?filter=all&order=rating&pagination=cursor&limit=3",
+        )
+        self.assertEqual(ids, expected)
+        self.assertEqual(sorted(ids), sorted(article.id for article in articles))
+
+    def test_rating_cursor_after_rating_change(self):
+        for i in range(6):
+            self.create_article(f"Пост {i}")
+        expected = [
+            int(article_id)
+            for article_id in self.redis.zrevrange("article_rating", 0, -1)
+        ]
+        response = self.reader_client.get(
+            "/api/blog/articles/?filter=all&order=rating&pagination=cursor&limit=3"
+        )
+        first_page = [item["id"] for item in response.json()["results"]]
+        self.reader_client.post(
+            f"/api/blog/articles/{first_page[-1]}/like-unlike/", {"action": "like"}
+        )
+        ids = first_page + self.walk(self.reader_client, response.json()["next"])
+        self.assertEqual(ids, expected)
+
+    def test_comment_pages_with_equal_dates(self):
+        article = self.create_article("Пост")
+        comments = Comment.objects.bulk_create(
+            Comment(article=article, author=self.reader, body=f"Комментарий {i}")
+            for i in range(5)
+        )
+        Comment.objects.filter(id__in=[c.id for c in comments[1:4]]).update(
+            created=timezone.now()
+        )
+        expected = list(
+            article.comments.order_by("-created", "-id").values_list("id", flat=True)
+        )
+        ids = self.walk(
+            self.reader_client,
+            f"/api/blog/articles/{article.id}/comments/?pagination=cursor&limit=2",
+        )
+        self.assertEqual(ids, expected)
+
+    def test_invalid_cursor(self):
+        self.create_article("Пост")
+        for query in ("", "&order=rating"):
+            for position in ('["x", 1]', '[1, "1"]', "[NaN, 1]", "[1, 1.5]"):
+                cursor = KeysetPagination.encode_cursor(json.loads(position))
+                response = self.reader_client.get(
+                    f"/api/blog/articles/?pagination=cursor&cursor={cursor}{query}"
+                )
+                self.assertEqual(response.status_code, 404, (query, position))
+            for cursor in ("not-base64!", "WzFd"):
+                response = self.reader_client.get(
+                    f"/api/blog/articles/?pagination=cursor&cursor={cursor}{query}"
+                )
+                self.assertEqual(response.status_code, 404, (query, cursor))
+        self.assertTrue(redis_service.REDIS_BREAKER.is_available())
+        self.assertEqual(redis_service.REDIS_BREAKER._failures, 0)
+
+
+class RatingFeedTest(BlogTestCase):
+    """Список постов по рейтингу из redis и индексы категорий и авторов"""
+
+    def get_page(self, query: str) -> tuple:
+        response = self.reader_client.get(f"/api/blog/articles/?{query}")
+        self.assertEqual(response.status_code, 200, response.content)
+        return (
+            response.json()["count"],
+            [article["id"] for article in response.json()["results"]],
+        )
+
+    def test_order_by_rating(self):
+        first, second, third = [self.create_article(f"Пост {i}") for i in range(3)]
+        self.create_article("Черновик", publish=False)
+        self.reader_client.post(
+            f"/api/blog/articles/{second.id}/comments/", {"body": "Комментарий"}
+        )
+        self.reader_client.post(
+            f"/api/blog/articles/{third.id}/like-unlike/", {"action": "like"}
+        )
+        self.assertEqual(
+            self.get_page("filter=all&order=rating"),
+            (3, [second.id, third.id, first.id]),
+        )
+
+    def test_page_stats_are_read_in_one_round_trip(self):
+        articles = [self.create_article(f"Пост {i}") for i in range(3)]
+        for query in ("filter=all&order=rating", "filter=all&order=date"):
+            with self.record_round_trips() as round_trips:
+                self.assertEqual(self.get_page(query)[0], 3)
+            self.assertEqual(
+                [commands for commands in round_trips if "ZMSCORE" in commands],
+                [["ZMSCORE", "MGET"] + ["PFCOUNT"] * len(articles)],
+            )
+
+    def test_filter_by_category_and_author(self):
+        other_author = self.create_user("other")
+        self.create_article("Наука")
+        sport = self.create_article("Спорт", category=self.other_category)
+        other = self.create_article("Другой автор", author=other_author)
+        self.assertEqual(
+            self.get_page("filter=all&order=rating&category=sport"), (1, [sport.id])
+        )
+        self.assertEqual(
+            self.get_page("filter=publish&order=rating&username=other"),
+            (1, [other.id]),
+        )
+
+    def test_lost_index_is_built_from_db(self):
+        articles = [self.create_article(f"Пост {i}") for i in range(2)]
+        self.redis.delete(
+            f"article_author:{self.author.id}", "article_index:filled:author"
+        )
+        # публикация создаёт индекс заново, но только с новым постом
+        articles.append(self.create_article("Новый пост"))
+        count, ids = self.get_page("filter=publish&order=rating&username=author")
+        self.assertEqual(count, 3)
+        self.assertEqual(sorted(ids), sorted(article.id for article in articles))
+        self.assertTrue(
+            self.redis.sismember("article_index:filled:author", self.author.id)
+        )
+
+    def test_empty_index_is_marked_filled(self):
+        self.assertEqual(
+            self.get_page("filter=publish&order=rating&username=reader"), (0, [])
+        )
+        self.assertTrue(
+            self.redis.sismember("article_index:filled:author", self.reader.id)
+        )
+
+
+class ArticleCounterTest(BlogTestCase):
+    """Счётчики лайков и комментариев в строке поста"""
+
+    def get_counters(self, article: Article) -> tuple:
+        article.refresh_from_db()
+        return article.users_like_count, article.comment_count
+
+    def test_comments_change_counter(self):
+        article = self.create_article("Пост")
+        url = f"/api/blog/articles/{article.id}/comments/"
+        for body in ("Первый", "Второй"):
+            self.reader_client.post(url, {"body": body})
+        self.assertEqual(self.get_counters(article), (0, 2))
+        comment = article.comments.first()
+        response = self.reader_client.delete(f"{url}{comment.id}/")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get_counters(article), (0, 1))
+        response = self.anonymous_client.get("/api/blog/articles/")
+        self.assertEqual(response.json()["results"][0]["comment_count"], 1)
+
+    def test_rebuild_fixes_counter_drift(self):
+        article = self.create_article("Пост")
+        self.reader_client.post(
+            f"/api/blog/articles/{article.id}/like-unlike/", {"action": "like"}
+        )
+        self.reader_client.post(
+            f"/api/blog/articles/{article.id}/comments/", {"body": "Комментарий"}
+        )
+        Article.objects.filter(id=article.id).update(
+            users_like_count=7, comment_count=0
+        )
+        call_command("rebuild_article_counters", stdout=io.StringIO())
+        self.assertEqual(self.get_counters(article), (1, 1))
+
+
+class ArticleTextPreviewTest(BlogTestCase):
+    """Превью поста - начало первого текстового блока"""
+
+    def get_preview(self, article: Article) -> str:
+        return Article.objects.values_list("text_preview", flat=True).get(id=article.id)
+
+    def test_preview_follows_first_text_block(self):
+        article = self.create_article("Пост")
+        long_text = "а" * (settings.ARTICLE_TEXT_PREVIEW_LENGTH + 100)
+        first = self.add_text(article, long_text)
+        self.assertEqual(
+            self.get_preview(article),
+            long_text[: settings.ARTICLE_TEXT_PREVIEW_LENGTH],
+        )
+        second = self.add_text(article, "Второй блок")
+        self.assertEqual(
+            self.get_preview(article),
+            long_text[: settings.ARTICLE_TEXT_PREVIEW_LENGTH],
+        )
+        response = self.author_client.put(
+            f"/api/blog/articles/{article.id}/contents/text/{first.object_id}/",
+            {"text": "Первый блок"},
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.get_preview(article), "Первый блок")
+        for content, preview in ((first, "Второй блок"), (second, "")):
+            response = self.author_client.delete(
+                f"/api/blog/articles/{article.id}/contents/{content.id}/delete/"
+            )
+            self.assertEqual(response.status_code, 204)
+            self.assertEqual(self.get_preview(article), preview)
+
+    def test_migration_fills_preview(self):
+        fill_text_preview = importlib.import_module(
+            "blog.migrations.0013_article_text_preview"
+        ).fill_text_preview
+        article = self.create_article("Пост")
+        self.add_text(article, "Первый блок")
+        self.add_text(article, "Второй блок")
+        empty = self.create_article("Без текста")
+        Article.objects.update(text_preview="")
+        fill_text_preview(apps, None)
+        self.assertEqual(self.get_preview(article), "Первый блок")
+        self.assertEqual(self.get_preview(empty), "")
+
+
+class ArticleDetailQueryTest(BlogTestCase):
+    """Количество запросов страницы поста не зависит от количества блоков"""
+
+    def create_article_with_blocks(self, models: list) -> Article:
+        article = self.create_article("Пост")
+        for number, model in enumerate(models):
+            if model is Text:
+                content_object = Text.objects.create(text=f"Текст {number}")
+            elif model is Image:
+                content_object = Image.objects.create(image=f"articles/{number}.jpg")
+            else:
+                content_object = Video.objects.create(url=f"https://x.com/{number}")
+            Content.objects.create(article=article, content_object=content_object)
+        return article
+
+    def get_query_count(self, article: Article) -> int:
+        with CaptureQueriesContext(connection) as queries:
+            response = self.anonymous_client.get(f"/api/blog/articles/{article.id}/")
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_block_count(self):
+        self.get_query_count(self.create_article_with_blocks([Text, Image, Video]))
+        for small, large in [
+            ([Text], [Text] * 20),
+            ([Text, Image, Video], [Text, Image, Video, Image] * 5),
+        ]:
+            query_count = self.get_query_count(self.create_article_with_blocks(small))
+            article = self.create_article_with_blocks(large)
+            with self.assertNumQueries(query_count):
+                response = self.anonymous_client.get(
+                    f"/api/blog/articles/{article.id}/"
+                )
+            self.assertEqual(len(response.json()["contents"]), 20)
+
+
+@skipUnless(connection.vendor == "postgresql", "полнотекстовый поиск PostgreSQL")
+class ArticleSearchTest(BlogTestCase):
+    """Полнотекстовый поиск постов по заголовку и текстовым блокам"""
+
+    def search(self, query: str) -> list:
+        response = self.anonymous_client.get(f"/api/blog/articles/search/?{query}")
+        self.assertEqual(response.status_code, 200, response.content)
+        return [article["id"] for article in response.json()["results"]]
+
+    def test_title_is_more_relevant_than_text(self):
+        in_text = self.create_article("Пост")
+        self.add_text(in_text, "Марсоход прислал новые снимки")
+        in_title = self.create_article("Марсоход")
+        self.add_text(in_title, "Новые снимки")
+        draft = self.create_article("Марсоход", publish=False)
+        self.add_text(draft, "Черновик")
+        self.create_article("Другой пост")
+        self.assertEqual(self.search("q=марсоход"), [in_title.id, in_text.id])
+        self.assertEqual(self.search("q="), [])
+
+    def test_category_filter(self):
+        science = self.create_article("Марсоход")
+        self.add_text(science, "Текст")
+        sport = self.create_article("Марсоход", category=self.other_category)
+        self.add_text(sport, "Текст")
+        self.assertEqual(self.search("q=марсоход&category=sport"), [sport.id])
+        self.assertEqual(self.search("q=марсоход&category=nauka"), [science.id])
+
+    def test_cursor_pages_follow_rank_and_id_order(self):
+        articles = [self.create_article(f"Марсоход {i}") for i in range(3)]
+        articles += [self.create_article(f"Пост {i}") for i in range(3)]
+        for article in articles:
+            self.add_text(article, "Марсоход")
+        expected = self.search("q=марсоход&limit=100")
+        self.assertEqual(
+            expected,
+            [article.id for article in articles[2::-1] + articles[:2:-1]],
+        )
+        self.assertEqual(
+            self.walk(
+                self.anonymous_client,
+                "/api/blog/articles/search/?q=марсоход&pagination=cursor&limit=2",
+            ),
+            expected,
+        )
+
+    def test_search_document_follows_text_blocks(self):
+        article = self.create_article("Пост")
+        self.assertEqual(self.search("q=марсоход"), [])
+        content = self.add_text(article, "Марсоход")
+        self.assertEqual(self.search("q=марсоход"), [article.id])
+        response = self.author_client.put(
+            f"/api/blog/articles/{article.id}/contents/text/{content.object_id}/",
+            {"text": "Луноход"},
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.search("q=марсоход"), [])
+        self.assertEqual(self.search("q=луноход"), [article.id])
+        response = self.author_client.delete(
+            f"/api/blog/articles/{article.id}/contents/{content.id}/delete/"
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.search("q=луноход"), [])
+        self.assertEqual(self.search("q=пост"), [article.id])
+
+
+class LikeTest(BlogTestCase):
+    """Повторные лайки и снятие лайка не меняют счётчик и рейтинг дважды"""
+
+    def like(self, article: Article, action: str) -> dict:
+        response = self.reader_client.post(
+            f"/api/blog/articles/{article.id}/like-unlike/", {"action": action}
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+    def test_repeated_like_and_unlike(self):
+        article = self.create_article("Пост")
+        like = settings.ARTICLE_RATING_BY_ACTION["like"]
+        self.assertEqual(
+            self.like(article, "like"),
+            {"liked": True, "changed": True, "users_like_count": 1},
+        )
+        self.assertEqual(
+            self.like(article, "like"),
+            {"liked": True, "changed": False, "users_like_count": 1},
+        )
+        self.assertEqual(self.redis.zscore("article_rating", article.id), like)
+        self.like(article, "unlike")
+        self.assertEqual(
+            self.like(article, "unlike"),
+            {"liked": False, "changed": False, "users_like_count": 0},
+        )
+        self.assertEqual(self.redis.zscore("article_rating", article.id), 0)
+        self.assertFalse(article.users_like.exists())
+
+    def test_like_of_missing_article(self):
+        response = self.reader_client.post(
+            "/api/blog/articles/100000/like-unlike/", {"action": "like"}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class TimelineTest(BlogTestCase):
+    """Лента подписок (?filter=subscriptions) из redis"""
+
+    def get_feed(self, query: str = "") -> list:
+        response = self.reader_client.get(
+            f"/api/blog/articles/?filter=subscriptions{query}"
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return [article["id"] for article in response.json()["results"]]
+
+    def subscribe(self, username: str, action: str = "add") -> None:
+        response = self.reader_client.post(
+            f"/api/accounts/profile/{username}/subscribe/", {"action": action}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_feed_follows_subscriptions_and_posts(self):
+        other_author = self.create_user("other")
+        first = self.create_article("Первый")
+        self.subscribe("author")
+        self.assertEqual(self.get_feed(), [first.id])
+        second = self.create_article("Второй", category=self.other_category)
+        self.assertEqual(self.get_feed(), [second.id, first.id])
+        self.assertEqual(self.get_feed("&category=sport"), [second.id])
+        other = self.create_article("Другой автор", author=other_author)
+        self.subscribe("other")
+        self.assertEqual(self.get_feed(), [other.id, second.id, first.id])
+        self.subscribe("author", "delete")
+        self.assertEqual(self.get_feed(), [other.id])
+        other_client = APIClient()
+        other_client.force_authenticate(other_author)
+        other_client.delete(f"/api/blog/articles/{other.id}/")
+        self.assertEqual(self.get_feed(), [])
+
+    def test_empty_feed_is_not_rebuilt(self):
+        self.assertEqual(self.get_feed(), [])
+        self.assertTrue(self.redis.exists(f"timeline:{self.reader.id}:empty"))
+        with mock.patch.object(ArticlesTimeline, "fill") as fill:
+            self.assertEqual(self.get_feed(), [])
+        fill.assert_not_called()
+        self.subscribe("author")
+        article = self.create_article("Пост")
+        self.assertFalse(self.redis.exists(f"timeline:{self.reader.id}:empty"))
+        self.assertEqual(self.get_feed(), [article.id])
+
+    @override_settings(TIMELINE_FANOUT_MAX_SUBSCRIBERS=0)
+    def test_celebrity_posts_are_merged_on_read(self):
+        self.subscribe("author")
+        self.assertEqual(self.get_feed(), [])
+        article = self.create_article("Пост")
+        self.assertIsNone(self.redis.zscore(f"timeline:{self.reader.id}", article.id))
+        self.assertEqual(self.get_feed(), [article.id])
+        self.author_client.delete(f"/api/blog/articles/{article.id}/")
+        self.assertEqual(self.get_feed(), [])
+
+    def test_celebrity_posts_are_fanned_out_when_subscribers_drop(self):
+        self.subscribe("author")
+        self.assertEqual(self.get_feed(), [])
+        with override_settings(TIMELINE_FANOUT_MAX_SUBSCRIBERS=0):
+            first = self.create_article("Первый")
+        self.assertIsNone(self.redis.zscore(f"timeline:{self.reader.id}", first.id))
+        second = self.create_article("Второй")
+        self.assertEqual(
+            [
+                int(article_id)
+                for article_id in self.redis.zrange(
+                    f"timeline:{self.reader.id}", 0, -1, desc=True
+                )
+            ],
+            [second.id, first.id],
+        )
+        self.assertEqual(self.get_feed(), [second.id, first.id])
+
+    def test_deleted_celebrity_post_is_removed_from_timelines(self):
+        self.subscribe("author")
+        self.assertEqual(self.get_feed(), [])
+        article = self.create_article("Пост")
+        self.assertIsNotNone(
+            self.redis.zscore(f"timeline:{self.reader.id}", article.id)
+        )
+        with override_settings(TIMELINE_FANOUT_MAX_SUBSCRIBERS=0):
+            self.author_client.delete(f"/api/blog/articles/{article.id}/")
+        self.assertIsNone(self.redis.zscore(f"timeline:{self.reader.id}", article.id))
+        self.assertEqual(self.get_feed(), [])
+
+
+class ArticleListCacheTest(BlogTestCase):
+    """Кэш страниц списка для анонимных пользователей сбрасывается при изменениях"""
+
+    def setUp(self):
+        super().setUp()
+        self.article = self.create_article("Пост")
+
+    def get_list(self, client: APIClient = None, query: str = "") -> list:
+        response = (client or self.anonymous_client).get(f"/api/blog/articles/{query}")
+        self.assertEqual(response.status_code, 200, response.content)
+        return [
+            (article["title"], article["comment_count"])
+            for article in response.json()["results"]
+        ]
+
+    def test_page_is_cached_until_comment(self):
+        self.assertEqual(self.get_list(), [("Пост", 0)])
+        # изменение в обход представлений, кэш о нём не знает
+        Article.objects.filter(id=self.article.id).update(title="Новое название")
+        self.assertEqual(self.get_list(), [("Пост", 0)])
+        self.assertEqual(
+            self.get_list(self.reader_client, "?filter=all"), [("Новое название", 0)]
+        )
+        self.reader_client.post(
+            f"/api/blog/articles/{self.article.id}/comments/", {"body": "Комментарий"}
+        )
+        self.assertEqual(self.get_list(), [("Новое название", 1)])
+
+    def test_page_is_reset_on_delete(self):
+        self.assertEqual(self.get_list(), [("Пост", 0)])
+        self.author_client.delete(f"/api/blog/articles/{self.article.id}/")
+        self.assertEqual(self.get_list(), [])
+
+    def test_request_with_unknown_params_is_not_cached(self):
+        self.get_list(query="?unknown=1")
+        self.assertEqual(self.redis.keys("article_list:page:*"), [])
+        self.get_list(query="?order=rating")
+        self.assertEqual(len(self.redis.keys("article_list:page:*")), 1)
+
+    def test_page_is_built_without_redis(self):
+        self.set_redis_available(False)
+        self.assertEqual(self.get_list(), [("Пост", 0)])
+        self.set_redis_available(True)
+        self.assertEqual(self.redis.keys("article_list:page:*"), [])
+
+
+class ArticleDetailCacheTest(BlogTestCase):
+    """Кэш страницы поста сбрасывается по версиям поста и автора"""
+
+    def setUp(self):
+        super().setUp()
+        self.article = self.create_article("Пост")
+        self.url = f"/api/blog/articles/{self.article.id}/"
+
+    def get_detail(self) -> dict:
+        response = self.anonymous_client.get(self.url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_page_is_cached_until_update(self):
+        self.assertEqual(self.get_detail()["view_count"], 1)
+        Article.objects.filter(id=self.article.id).update(title="Новое название")
+        data = self.get_detail()
+        self.assertEqual((data["title"], data["view_count"]), ("Пост", 2))
+        self.author_client.patch(self.url, {"title": "Новое название"})
+        self.assertEqual(self.get_detail()["title"], "Новое название")
+
+    def test_author_card_is_reset_on_subscribe_and_profile_change(self):
+        self.assertEqual(self.get_detail()["author"]["subscriber_count"], 0)
+        self.reader_client.post(
+            "/api/accounts/profile/author/subscribe/", {"action": "add"}
+        )
+        self.assertEqual(self.get_detail()["author"]["subscriber_count"], 1)
+        self.author.first_name = "Иван"
+        self.author.save()
+        self.assertEqual(self.get_detail()["author"]["first_name"], "Иван")
+
+    def test_comments_are_reset_on_commenter_rename(self):
+        self.reader_client.post(
+            f"/api/blog/articles/{self.article.id}/comments/", {"body": "Комментарий"}
+        )
+        self.assertEqual(self.get_detail()["comments"][0]["author"], "reader")
+        # вход пользователя не меняет имя и не сбрасывает страницы его комментариев
+        with mock.patch(
+            "blog.signals.invalidate_commenter_cache"
+        ) as invalidate_commenter_cache:
+            self.reader.save(update_fields=["last_login"])
+        invalidate_commenter_cache.assert_not_called()
+        self.reader.username = "new_reader"
+        self.reader.save()
+        self.assertEqual(self.get_detail()["comments"][0]["author"], "new_reader")
+
+    def test_page_is_built_without_redis(self):
+        self.set_redis_available(False)
+        self.assertEqual(self.get_detail()["title"], "Пост")
+        self.set_redis_available(True)
+        self.assertFalse(self.redis.exists(f"article_detail:{self.article.id}"))
+
+
+class ArticleViewTest(BlogTestCase):
+    """Просмотры поста: сразу в redis или через буфер процесса"""
+
+    def setUp(self):
+        super().setUp()
+        self.article = self.create_article("Пост")
+        self.url = f"/api/blog/articles/{self.article.id}/"
+        for patcher in (
+            mock.patch.object(ARTICLE_VIEW_BUFFER, "_start_flusher"),
+            mock.patch.object(ARTICLE_VIEW_BUFFER, "_views", Counter()),
+            mock.patch.object(ARTICLE_VIEW_BUFFER, "_viewers", {}),
+            mock.patch.object(ARTICLE_VIEW_BUFFER, "_size", 0),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def view(self, client: APIClient = None) -> dict:
+        response = (client or self.reader_client).get(self.url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_views_are_counted_exactly(self):
+        for view_count in range(1, 4):
+            self.assertEqual(self.view()["view_count"], view_count)
+        self.assertEqual(
+            self.redis.zscore("article_rating", self.article.id),
+            3 * settings.ARTICLE_RATING_BY_ACTION["view"],
+        )
+
+    @override_settings(ARTICLE_VIEW_COUNTER_MODE="buffered")
+    def test_buffered_views_are_flushed(self):
+        with mock.patch.object(ARTICLE_VIEW_BUFFER, "flush_threshold", 3):
+            self.view()
+            self.view()
+            self.assertIsNone(self.redis.get(f"article:{self.article.id}:id"))
+            self.view()
+            self.assertEqual(self.redis.get(f"article:{self.article.id}:id"), b"3")
+            self.view()
+            ARTICLE_VIEW_BUFFER.flush()
+        self.assertEqual(self.redis.get(f"article:{self.article.id}:id"), b"4")
+        self.assertEqual(
+            self.redis.zscore("article_rating", self.article.id),
+            4 * settings.ARTICLE_RATING_BY_ACTION["view"],
+        )
+
+    @override_settings(ARTICLE_VIEW_COUNTER_MODE="buffered")
+    def test_buffered_views_are_written_after_redis_outage(self):
+        self.set_redis_available(False)
+        self.view()
+        self.view()
+        ARTICLE_VIEW_BUFFER.flush()
+        self.set_redis_available(True)
+        # первое успешное обращение повторяет отложенную запись
+        self.assertEqual(self.view()["view_count"], 2)
+        ARTICLE_VIEW_BUFFER.flush()
+        self.assertEqual(self.redis.get(f"article:{self.article.id}:id"), b"3")
+
+
+class UniqueViewerTest(BlogTestCase):
+    """Уникальные зрители поста (HyperLogLog)"""
+
+    def setUp(self):
+        super().setUp()
+        self.article = self.create_article("Пост")
+        self.url = f"/api/blog/articles/{self.article.id}/"
+
+    def view_as_everyone(self) -> dict:
+        """Читатель и один аноним по два раза, второй аноним - один раз"""
+        for _ in range(2):
+            self.reader_client.get(self.url)
+            self.anonymous_client.get(self.url, REMOTE_ADDR="10.0.0.1")
+        response = self.anonymous_client.get(self.url, REMOTE_ADDR="10.0.0.2")
+        return response.json()
+
+    def test_unique_viewers_are_counted(self):
+        data = self.view_as_everyone()
+        self.assertEqual((data["view_count"], data["unique_view_count"]), (5, 3))
+        self.assertEqual(
+            self.redis.zscore("article_rating", self.article.id),
+            5 * settings.ARTICLE_RATING_BY_ACTION["view"],
+        )
+
+    @override_settings(ARTICLE_RATING_BY_UNIQUE_VIEWS=True)
+    def test_rating_grows_for_new_viewers_only(self):
+        # рейтинг категории строится при первом чтении
+        self.anonymous_client.get("/api/blog/articles/?order=rating&category=nauka")
+        data = self.view_as_everyone()
+        self.assertEqual((data["view_count"], data["unique_view_count"]), (5, 3))
+        rating = 3 * settings.ARTICLE_RATING_BY_ACTION["view"]
+        self.assertEqual(data["rating"], rating)
+        self.assertEqual(
+            self.redis.zscore(
+                ArticlesRating().get_category_key(self.category.id), self.article.id
+            ),
+            rating,
+        )
+
+    def test_list_shows_unique_viewers(self):
+        self.view_as_everyone()
+        response = self.anonymous_client.get("/api/blog/articles/")
+        self.assertEqual(response.json()["results"][0]["unique_view_count"], 3)
+
+
+class CategoryRatingTest(BlogTestCase):
+    """Рейтинги категорий меняются скриптами Lua вместе с общим рейтингом"""
+
+    def setUp(self):
+        super().setUp()
+        self.rating = ArticlesRating()
+        self.first, self.second = [self.create_article(f"Пост {i}") for i in range(2)]
+        self.sport = self.create_article("Спорт", category=self.other_category)
+
+    def get_page(self, category_slug: str) -> tuple:
+        response = self.reader_client.get(
+            f"/api/blog/articles/?filter=all&order=rating&category={category_slug}"
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return (
+            response.json()["count"],
+            [article["id"] for article in response.json()["results"]],
+        )
+
+    def get_category_rating(self, category: Category) -> dict:
+        return {
+            int(article_id): score
+            for article_id, score in self.redis.zrange(
+                self.rating.get_category_key(category.id), 0, -1, withscores=True
+            )
+        }
+
+    def like(self, article: Article) -> None:
+        self.reader_client.post(
+            f"/api/blog/articles/{article.id}/like-unlike/", {"action": "like"}
+        )
+
+    def test_category_rating_follows_global_rating(self):
+        like = settings.ARTICLE_RATING_BY_ACTION["like"]
+        self.like(self.first)
+        # рейтинг категории строится из общего при первом чтении
+        self.assertEqual(self.get_page("nauka"), (2, [self.first.id, self.second.id]))
+        self.like(self.second)
+        self.reader_client.post(
+            f"/api/blog/articles/{self.second.id}/comments/", {"body": "Комментарий"}
+        )
+        self.reader_client.get(f"/api/blog/articles/{self.second.id}/")
+        self.assertEqual(self.get_page("nauka"), (2, [self.second.id, self.first.id]))
+        self.assertEqual(
+            self.get_category_rating(self.category),
+            {
+                self.first.id: like,
+                self.second.id: self.redis.zscore("article_rating", self.second.id),
+            },
+        )
+        self.assertEqual(self.get_page("sport"), (1, [self.sport.id]))
+
+    def test_article_moves_between_categories(self):
+        self.like(self.first)
+        self.get_page("nauka")
+        self.get_page("sport")
+        self.author_client.patch(
+            f"/api/blog/articles/{self.first.id}/", {"category": "Спорт"}
+        )
+        self.assertEqual(self.get_page("nauka"), (1, [self.second.id]))
+        self.assertEqual(self.get_page("sport"), (2, [self.first.id, self.sport.id]))
+        self.assertEqual(
+            self.get_category_rating(self.other_category)[self.first.id],
+            self.redis.zscore("article_rating", self.first.id),
+        )
+        self.assertEqual(
+            self.redis.hget(self.rating.categories_key, self.first.id),
+            str(self.other_category.id).encode(),
+        )
+
+    def test_deleted_article_is_removed_from_category(self):
+        self.get_page("nauka")
+        self.author_client.delete(f"/api/blog/articles/{self.first.id}/")
+        self.assertEqual(self.get_page("nauka"), (1, [self.second.id]))
+        self.assertIsNone(self.redis.hget(self.rating.categories_key, self.first.id))
+
+
+class TrendingTest(BlogTestCase):
+    """Рейтинг популярности: изменения рейтинга затухают со временем"""
+
+    def test_recent_activity_outweighs_old(self):
+        old, recent, quiet = [self.create_article(f"Пост {i}") for i in range(3)]
+        hour = ArticlesTrending._get_hour()
+        with mock.patch.object(ArticlesTrending, "_get_hour", return_value=hour):
+            self.reader_client.post(
+                f"/api/blog/articles/{old.id}/like-unlike/", {"action": "like"}
+            )
+            self.reader_client.post(
+                f"/api/blog/articles/{old.id}/comments/", {"body": "Комментарий"}
+            )
+        later = hour + 2 * settings.TRENDING_HALF_LIFE_HOURS
+        with mock.patch.object(ArticlesTrending, "_get_hour", return_value=later):
+            self.reader_client.post(
+                f"/api/blog/articles/{recent.id}/like-unlike/", {"action": "like"}
+            )
+            trending = self.reader_client.get(
+                "/api/blog/articles/?filter=all&order=trending"
+            ).json()
+        rating = self.reader_client.get(
+            "/api/blog/articles/?filter=all&order=rating"
+        ).json()
+        self.assertEqual(
+            [article["id"] for article in trending["results"]], [recent.id, old.id]
+        )
+        self.assertEqual(
+            [article["id"] for article in rating["results"]],
+            [old.id, recent.id, quiet.id],
+        )
+
+
+class RebuildRatingsTest(BlogTestCase):
+    """manage.py rebuild_ratings пересчитывает рейтинги в redis по БД"""
+
+    def test_index_markers_are_deleted_after_indexes(self):
+        self.create_article("Пост")
+        for query in (
+            "filter=all&order=trending&category=nauka",
+            "filter=publish&order=rating&username=author",
+        ):
+            self.reader_client.get(f"/api/blog/articles/?{query}")
+        self.assertEqual(len(self.redis.keys("article_index:filled:*")), 2)
+        deleted = []
+        delete = redis_service.REDIS.delete
+
+        def record_delete(*names):
+            deleted.extend(
+                name.decode() if isinstance(name, bytes) else name for name in names
+            )
+            return delete(*names)
+
+        with mock.patch.object(redis_service.REDIS, "delete", record_delete):
+            ArticlesIndex().clear()
+        for field, value in (
+            ("category", self.category.id),
+            ("author", self.author.id),
+        ):
+            self.assertLess(
+                deleted.index(f"article_{field}:{value}"),
+                deleted.index(f"article_index:filled:{field}"),
+            )
+        self.assertEqual(self.redis.keys("article_index:*"), [])
+        self.assertEqual(self.redis.keys("article_category:*"), [])
+
+    def test_ratings_are_rebuilt_from_db(self):
+        weights = settings.ARTICLE_RATING_BY_ACTION
+        liked, commented = [self.create_article(f"Пост {i}") for i in range(2)]
+        draft = self.create_article("Черновик", publish=False)
+        self.reader_client.post(
+            f"/api/blog/articles/{liked.id}/like-unlike/", {"action": "like"}
+        )
+        self.reader_client.get(f"/api/blog/articles/{liked.id}/")
+        self.reader_client.post(
+            f"/api/blog/articles/{commented.id}/comments/", {"body": "Комментарий"}
+        )
+        self.reader_client.post(
+            "/api/accounts/profile/author/subscribe/", {"action": "add"}
+        )
+        self.reader_client.get(
+            "/api/blog/articles/?filter=all&order=rating&category=nauka"
+        )
+        # рейтинги разошлись с БД, в рейтинге черновик и удалённый пост
+        self.redis.zadd("article_rating", {liked.id: 100, draft.id: 0, 999: 1})
+        self.redis.delete("user_rating")
+        out = io.StringIO()
+        call_command("rebuild_ratings", chunk_size=1, stdout=out)
+        self.assertIn("Статей в рейтинге: 2, пользователей: 2", out.getvalue())
+        self.assertEqual(
+            dict(self.redis.zrange("article_rating", 0, -1, withscores=True)),
+            {
+                str(liked.id).encode(): weights["like"] + weights["view"],
+                str(commented.id).encode(): weights["add_comment"],
+            },
+        )
+        user_weights = settings.USER_RATING_BY_ACTION
+        self.assertEqual(
+            dict(self.redis.zrange("user_rating", 0, -1, withscores=True)),
+            {
+                str(self.author.id).encode(): 2 * user_weights["create_article"]
+                + user_weights["add_subscriber"],
+                str(self.reader.id).encode(): 0,
+            },
+        )
+        # рейтинг категории удалён и строится заново из нового рейтинга
+        self.assertFalse(
+            self.redis.exists(ArticlesRating().get_category_key(self.category.id))
+        )
+        response = self.reader_client.get(
+            "/api/blog/articles/?filter=all&order=rating&category=nauka"
+        )
+        self.assertEqual(
+            [
+                (article["id"], article["rating"])
+                for article in response.json()["results"]
+            ],
+            [
+                (commented.id, weights["add_comment"]),
+                (liked.id, weights["like"] + weights["view"]),
+            ],
+        )
+
+
+class RedisFallbackTest(BlogTestCase):
+    """Посты без redis: сортировка по дате из БД и повтор записей рейтинга"""
+
+    def test_rating_order_falls_back_to_date(self):
+        first, second = [self.create_article(f"Пост {i}") for i in range(2)]
+        self.reader_client.post(
+            f"/api/blog/articles/{first.id}/like-unlike/", {"action": "like"}
+        )
+        self.open_breaker()
+        response = self.reader_client.get("/api/blog/articles/?filter=all&order=rating")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(
+            [
+                (article["id"], article["rating"])
+                for article in response.json()["results"]
+            ],
+            [(second.id, 0), (first.id, 0)],
+        )
+
+    def test_redis_errors_open_breaker(self):
+        first, second = [self.create_article(f"Пост {i}") for i in range(2)]
+        # redis недоступен, но выключатель ещё не разомкнут
+        self.set_redis_available(False)
+        for query in [
+            "filter=all&order=rating&category=nauka",
+            "filter=subscriptions&order=date",
+            "filter=all&order=trending",
+            "filter=all&order=rating",
+        ]:
+            response = self.reader_client.get(f"/api/blog/articles/?{query}")
+            self.assertEqual(response.status_code, 200, response.content)
+        self.assertFalse(redis_service.REDIS_BREAKER.is_available())
+        response = self.reader_client.get("/api/blog/articles/?filter=all&order=rating")
+        self.assertEqual(
+            [article["id"] for article in response.json()["results"]],
+            [second.id, first.id],
+        )
+
+    def test_category_rating_falls_back_to_date_on_redis_error(self):
+        first, second = [self.create_article(f"Пост {i}") for i in range(2)]
+        self.set_redis_available(False)
+        response = self.reader_client.get(
+            "/api/blog/articles/?filter=all&order=rating&category=nauka"
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(
+            [article["id"] for article in response.json()["results"]],
+            [second.id, first.id],
+        )
+
+    def test_rating_changes_are_replayed_after_recovery(self):
+        article = self.create_article("Пост")
+        self.open_breaker()
+        response = self.reader_client.post(
+            f"/api/blog/articles/{article.id}/like-unlike/", {"action": "like"}
+        )
+        self.assertEqual(response.status_code, 201)
+        self.reader_client.post(
+            f"/api/blog/articles/{article.id}/comments/", {"body": "Комментарий"}
+        )
+        self.assertTrue(len(redis_service.REDIS_RETRY_QUEUE))
+        self.set_redis_available(True)
+        self.reader_client.get("/api/blog/articles/?filter=all&order=rating")
+        self.assertEqual(
+            self.redis.zscore("article_rating", article.id),
+            settings.ARTICLE_RATING_BY_ACTION["like"]
+            + settings.ARTICLE_RATING_BY_ACTION["add_comment"],
+        )
+
+
+class AsyncViewTest(BlogTestCase):
+    """Асинхронные представления отдают те же данные, что синхронные"""
+
+    def setUp(self):
+        super().setUp()
+        # асинхронные представления аутентифицируют только по токену
+        self.reader_client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.reader)}"
+        )
+        self.first, self.second = [self.create_article(f"Пост {i}") for i in range(2)]
+        self.reader_client.post(
+            f"/api/blog/articles/{self.first.id}/like-unlike/", {"action": "like"}
+        )
+        self.reader_client.post(
+            f"/api/blog/articles/{self.first.id}/comments/", {"body": "Комментарий"}
+        )
+
+    def get_json(self, client: APIClient, url: str) -> dict:
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_article_list(self):
+        for client in (self.anonymous_client, self.reader_client):
+            for query in ("?filter=all", "?filter=all&order=rating&limit=1"):
+                data = self.get_json(client, f"/api/blog/async/articles/{query}")
+                self.assertEqual(
+                    data["results"],
+                    self.get_json(client, f"/api/blog/articles/{query}")["results"],
+                )
+        data = self.get_json(self.reader_client, "/api/blog/async/articles/?filter=all")
+        self.assertEqual(
+            [(article["id"], article["liked_by_me"]) for article in data["results"]],
+            [(self.second.id, False), (self.first.id, True)],
+        )
+
+    def test_article_detail_and_comments(self):
+        data = self.get_json(
+            self.reader_client, f"/api/blog/async/articles/{self.first.id}/"
+        )
+        self.assertEqual((data["view_count"], data["liked_by_me"]), (1, True))
+        sync_data = self.get_json(
+            self.reader_client, f"/api/blog/articles/{self.first.id}/"
+        )
+        self.assertEqual(sync_data["view_count"], 2)
+        self.assertEqual(data["comments"], sync_data["comments"])
+        comments = self.get_json(
+            self.anonymous_client, f"/api/blog/async/articles/{self.first.id}/comments/"
+        )
+        self.assertEqual(
+            [comment["body"] for comment in comments["results"]], ["Комментарий"]
+        )
+
+
+class ArticleImportTest(BlogTestCase):
+    """Импорт постов пачками: БД, счётчики и redis"""
+
+    def get_records(self) -> list:
+        """Пост, черновик дважды, четыре записи с ошибками"""
+        article = {
+            "author": "author",
+            "category": "Наука",
+            "title": "Импортированный пост",
+            "published": "2024-01-02T10:00:00",
+            "contents": [{"type": "text", "text": "Текст поста"}],
+            "comments": [
+                {
+                    "author": "reader",
+                    "body": "Комментарий",
+                    "created": "2024-01-03T10:00:00",
+                }
+            ],
+        }
+        draft = {
+            "author": "author",
+            "category": "Спорт",
+            "title": "Черновик",
+            "status": "draft",
+        }
+        invalid = [
+            {"author": "nobody", "category": "Наука", "title": "Пост"},
+            {"author": "author", "category": "Нет такой", "title": "Пост"},
+            {"author": "author", "title": "Без категории"},
+        ]
+        return [
+            json.dumps(record, ensure_ascii=False)
+            for record in [article, draft, draft] + invalid
+        ] + ["{not json"]
+
+    def test_import_articles(self):
+        records = self.get_records()
+        self.assertEqual(import_articles(records, batch_size=2), (2, 5, True))
+        article = Article.objects.get(title="Импортированный пост")
+        self.assertEqual(article.comment_count, 1)
+        self.assertEqual(article.text_preview, "Текст поста")
+        self.assertEqual(
+            list(article.comments.values_list("body", flat=True)), ["Комментарий"]
+        )
+        self.assertEqual(Article.objects.get(title="Черновик").status, "draft")
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.article_count, 2)
+        self.assertEqual(
+            self.redis.zrange("article_rating", 0, -1), [str(article.id).encode()]
+        )
+        self.assertEqual(
+            self.redis.zscore("user_rating", self.author.id),
+            settings.USER_RATING_BY_ACTION["create_article"],
+        )
+        response = self.anonymous_client.get(
+            "/api/blog/articles/?order=rating&category=nauka"
+        )
+        self.assertEqual(
+            [item["id"] for item in response.json()["results"]], [article.id]
+        )
+
+    def test_rerun_skips_imported_articles(self):
+        records = self.get_records()
+        self.assertEqual(import_articles(records), (2, 5, True))
+        self.assertEqual(import_articles(records), (0, 7, True))
+        self.assertEqual(Article.objects.count(), 2)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.article_count, 2)
+
+    def test_import_without_redis(self):
+        self.open_breaker()
+        out = io.StringIO()
+        with mock.patch("sys.stdin", io.StringIO("\n".join(self.get_records()))):
+            call_command("import_articles", "-", stdout=out)
+        self.assertIn("Импортировано постов: 2, пропущено записей: 5", out.getvalue())
+        self.assertIn("manage.py rebuild_ratings", out.getvalue())
+        self.set_redis_available(True)
+        call_command("rebuild_ratings", stdout=io.StringIO())
+        self.assertEqual(
+            self.redis.zrange("article_rating", 0, -1),
+            [str(Article.objects.get(status="published").id).encode()],
+        )
+
+
+class SchemaTest(TestCase):
+    """Схема API из файлов build_schema: ETag и gzip"""
+
+    def setUp(self):
+        super().setUp()
+        schema_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(schema_dir.cleanup)
+        self.schema_dir = pathlib.Path(schema_dir.name)
+        schema_settings = override_settings(API_SCHEMA_DIR=self.schema_dir)
+        schema_settings.enable()
+        self.addCleanup(schema_settings.disable)
+        patcher = mock.patch.object(yasg, "_SCHEMA_DOCUMENTS", {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_build_schema(self):
+        call_command("build_schema", stdout=io.StringIO())
+        for schema_format in (".json", ".yaml"):
+            content = self.schema_dir.joinpath(f"swagger{schema_format}").read_bytes()
+            self.assertEqual(
+                gzip.decompress(
+                    self.schema_dir.joinpath(f"swagger{schema_format}.gz").read_bytes()
+                ),
+                content,
+            )
+        schema = json.loads(self.schema_dir.joinpath("swagger.json").read_bytes())
+        self.assertIn("/blog/articles/search/", schema["paths"])
+        self.assertNotIn("host", schema)
+
+    def test_prebuilt_schema_is_served_with_etag(self):
+        self.schema_dir.joinpath("swagger.json").write_bytes(b'{"paths": {}}')
+        response = self.client.get("/swagger.json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'{"paths": {}}')
+        self.assertEqual(response["Content-Type"], "application/json")
+        response = self.client.get("/swagger.json", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_schema_is_gzipped_for_clients_accepting_gzip(self):
+        call_command("build_schema", stdout=io.StringIO())
+        plain = self.client.get("/swagger.yaml")
+        compressed = self.client.get("/swagger.yaml", HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertFalse(plain.has_header("Content-Encoding"))
+        self.assertEqual(compressed["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertEqual(compressed["ETag"], plain["ETag"])
+        self.assertIn("Accept-Encoding", compressed["Vary"])
@@ -32,6 +32,21 @@ urlpatterns = [
         views.LikeUnlikeView.as_view(),
         name="like_or_unlike_article",
     ),
+    path(
+        "async/articles/",
+        views.ArticleListAsyncView.as_view(),
+        name="article_list_async",
+    ),
+    path(
+        "async/articles/<int:pk>/",
+        views.ArticleDetailAsyncView.as_view(),
+        name="article_detail_async",
+    ),
+    path(
+        "async/articles/<int:article_id>/comments/",
+        views.CommentListAsyncView.as_view(),
+        name="comment_list_async",
+    ),
 ]
 
 urlpatterns += router.urls
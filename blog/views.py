@@ -1,23 +1,44 @@
 from .models import Category
+from .pagination import ArticlePagination, ArticleSearchPagination, CommentPagination
 from .permissions import (
     IsDraftAuthor,
     IsPublishAuthorOrReadOnly,
     IsArticleContentAuthor,
     IsCommentAuthorOrReadOnly,
 )
+from .services.article_cache_service import (
+    ARTICLE_LIST_CACHE,
+    aget_article_detail_data,
+    get_article_detail_data,
+    invalidate_article_cache,
+    invalidate_author_cache,
+)
 from .services.article_content_service import (
     get_content_object_by_model_name_and_id,
     delete_article_content_by_id,
     publish_article,
     delete_all_article_content,
     change_article_views,
+    get_viewer_id,
+    update_article_index,
+    update_article_text_fields,
+)
+from .services.article_counter_service import change_article_counter
+from .services.article_like_service import (
+    aget_liked_article_ids,
+    like_or_unlike_article,
 )
-from .services.article_like_service import like_or_unlike_article
 from .services.article_range_service import (
+    aget_article_object,
     get_filtered_and_sorted_article_list,
     get_article_object,
+    get_article_detail_object,
+    search_articles,
+)
+from .services.article_rating_service import (
+    ArticlesRating,
+    aget_articles_rating_and_views,
 )
-from .services.article_rating_service import ArticlesRating
 from .serializers import (
     ArticleListSerializer,
     CategorySerializer,
@@ -28,11 +49,21 @@ from .serializers import (
     ImageSerializer,
     VideoSerializer,
 )
+from account.services.user_counter_service import change_user_counter
+from account.views_async import AsyncAPIView
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
 from rest_framework import generics, status, viewsets, mixins
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
+import asyncio
 import logging.config
 
 
@@ -59,11 +90,12 @@ class ArticleView(viewsets.ModelViewSet):
         IsDraftAuthor,
         IsAuthenticatedOrReadOnly,
     )
+    pagination_class = ArticlePagination
 
     def get_serializer_class(self):
         if self.action == "create":
             return ArticleCreateSerializer
-        elif self.action == "list":
+        elif self.action in ("list", "search"):
             return ArticleListSerializer
         else:
             return ArticleDetailSerializer
@@ -83,15 +115,84 @@ class ArticleView(viewsets.ModelViewSet):
         article = get_article_object(self.kwargs.get("pk"))
         self.check_object_permissions(self.request, article)
         if article.status != "draft":
-            change_article_views(article.id)
+            change_article_views(article.id, get_viewer_id(self.request))
         return article
 
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Статическая часть страницы поста берётся из кэша,
+        поля, зависящие от запроса, подставляются поверх неё
+        """
+        article = self.get_object()
+        data = get_article_detail_data(
+            article,
+            request.user,
+            lambda: self.get_serializer(get_article_detail_object(article.id)).data,
+        )
+        return Response(data)
+
+    def list(self, request, *args, **kwargs):
+        """
+        Анонимным пользователям страницы списка отдаются из кэша,
+        ключ - нормализованные параметры запроса
+        """
+        cache_key = None
+        if (
+            not request.user.is_authenticated
+            and request.accepted_renderer.format == "json"
+        ):
+            cache_key = ARTICLE_LIST_CACHE.get_key(
+                request.build_absolute_uri(request.path), request.query_params.dict()
+            )
+        if cache_key is None:
+            return super().list(request, *args, **kwargs)
+        content, version = ARTICLE_LIST_CACHE.get(cache_key)
+        if content is None:
+            response = super().list(request, *args, **kwargs)
+            content = JSONRenderer().render(response.data)
+            ARTICLE_LIST_CACHE.set(cache_key, content, version)
+        return HttpResponse(content, content_type="application/json")
+
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        with transaction.atomic():
+            article = serializer.save(author=self.request.user)
+            change_user_counter(article.author_id, "article_count", 1)
+        update_article_text_fields(article.id)
+        invalidate_author_cache(article.author_id)
+
+    def perform_update(self, serializer):
+        old_category_id = serializer.instance.category_id
+        old_title = serializer.instance.title
+        article = serializer.save()
+        update_article_index(article, old_category_id)
+        if article.title != old_title:
+            update_article_text_fields(article.id)
+        invalidate_article_cache(article.id)
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter("q", openapi.IN_QUERY, type=openapi.TYPE_STRING),
+            openapi.Parameter("category", openapi.IN_QUERY, type=openapi.TYPE_STRING),
+        ]
+    )
+    @action(detail=False, pagination_class=ArticleSearchPagination)
+    def search(self, request):
+        """Полнотекстовый поиск опубликованных статей по релевантности"""
+        articles = search_articles(
+            request.query_params.get("q", "").strip(),
+            request.query_params.get("category"),
+        )
+        page = self.paginate_queryset(articles)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     def perform_destroy(self, instance):
         delete_all_article_content(instance.id)
-        instance.delete()
+        with transaction.atomic():
+            instance.delete()
+            change_user_counter(instance.author_id, "article_count", -1)
+        invalidate_article_cache(instance.id)
+        invalidate_author_cache(instance.author_id)
 
 
 class CommentView(viewsets.ModelViewSet):
@@ -99,6 +200,7 @@ class CommentView(viewsets.ModelViewSet):
 
     serializer_class = CommentSerializer
     permission_classes = (IsCommentAuthorOrReadOnly, IsAuthenticatedOrReadOnly)
+    pagination_class = CommentPagination
     article = None
     rating = ArticlesRating()
 
@@ -116,13 +218,126 @@ class CommentView(viewsets.ModelViewSet):
         self.rating.incr_or_decr_rating_by_id(
             action="add_comment", object_id=self.article.id
         )
-        serializer.save(article=self.article, author=self.request.user)
+        with transaction.atomic():
+            serializer.save(article=self.article, author=self.request.user)
+            change_article_counter(self.article.id, "comment_count", 1)
+        invalidate_article_cache(self.article.id)
+
+    def perform_update(self, serializer):
+        serializer.save()
+        invalidate_article_cache(self.article.id)
 
     def perform_destroy(self, instance):
         self.rating.incr_or_decr_rating_by_id(
             action="delete_comment", object_id=self.article.id
         )
-        instance.delete()
+        with transaction.atomic():
+            instance.delete()
+            change_article_counter(self.article.id, "comment_count", -1)
+        invalidate_article_cache(self.article.id)
+
+
+class ArticleListAsyncView(AsyncAPIView):
+    """
+    Асинхронное отображение списка статей (ASGI).
+    Анонимным пользователям страницы отдаются из кэша, рейтинг
+    и просмотры статей страницы читаются из redis одновременно
+    с лайками пользователя из БД
+    """
+
+    permission_classes = ArticleView.permission_classes
+    pagination_class = ArticlePagination
+    sync_view = staticmethod(ArticleView.as_view({"get": "list"}))
+
+    async def get(self, request):
+        cache_key = version = None
+        if not request.user.is_authenticated:
+            cache_key = ARTICLE_LIST_CACHE.get_key(
+                request.build_absolute_uri(request.path), request.GET.dict()
+            )
+        if cache_key is not None:
+            content, version = await ARTICLE_LIST_CACHE.aget(cache_key)
+            if content is not None:
+                return HttpResponse(content, content_type="application/json")
+        limit, offset = self.get_limit_and_offset(request)
+        articles = await sync_to_async(get_filtered_and_sorted_article_list)(
+            request.GET.get("username") or request.user.username,
+            request.GET.get("category"),
+            request.GET.get("filter"),
+            request.GET.get("order"),
+        )
+        count, page = await self.get_page(articles, limit, offset)
+        article_ids = [article.id for article in page]
+        article_stats, liked_article_ids = await asyncio.gather(
+            aget_articles_rating_and_views(article_ids),
+            aget_liked_article_ids(request.user, article_ids),
+        )
+        serializer = ArticleListSerializer(
+            page,
+            many=True,
+            context={
+                "request": request,
+                "article_stats": article_stats,
+                "liked_article_ids": liked_article_ids,
+                "liked_checked_ids": set(article_ids),
+            },
+        )
+        response = self.get_json_response(
+            self.get_paginated_data(request, count, limit, offset, serializer.data)
+        )
+        if cache_key is not None:
+            await ARTICLE_LIST_CACHE.aset(cache_key, response.content, version)
+        return response
+
+
+class ArticleDetailAsyncView(AsyncAPIView):
+    """
+    Асинхронная детализация статьи (ASGI). Кэш страницы, просмотры
+    и рейтинги читаются из redis одновременно с лайком и подпиской из БД
+    """
+
+    permission_classes = ArticleView.permission_classes
+
+    async def get(self, request, pk):
+        article = await aget_article_object(pk)
+        self.check_object_permissions(request, article)
+        if article.status != "draft":
+            await sync_to_async(change_article_views)(
+                article.id, get_viewer_id(request)
+            )
+        data = await aget_article_detail_data(
+            article,
+            request.user,
+            sync_to_async(
+                lambda: ArticleDetailSerializer(
+                    get_article_detail_object(article.id),
+                    context={"request": request},
+                ).data
+            ),
+        )
+        return self.get_json_response(data)
+
+
+class CommentListAsyncView(AsyncAPIView):
+    """Асинхронное отображение списка комментариев (ASGI)"""
+
+    permission_classes = CommentView.permission_classes
+    pagination_class = CommentPagination
+    sync_view = staticmethod(CommentView.as_view({"get": "list"}))
+    article = None
+
+    async def initial(self, request, article_id):
+        self.article = await aget_article_object(article_id)
+
+    async def get(self, request, article_id):
+        limit, offset = self.get_limit_and_offset(request)
+        count, page = await self.get_page(
+            self.article.comments.select_related("author"), limit, offset
+        )
+        serializer = CommentSerializer(page, many=True)
+        return self.get_json_response(
+            self.get_paginated_data(request, count, limit, offset, serializer.data)
+        )
 
 
 class LikeUnlikeView(APIView):
@@ -133,8 +348,11 @@ class LikeUnlikeView(APIView):
     def post(self, request, pk):
         action = request.POST.get("action")
         if action:
-            if like_or_unlike_article(request.user, pk, action):
-                return Response(status=status.HTTP_201_CREATED)
+            like = like_or_unlike_article(request.user, pk, action)
+            if like:
+                if like["changed"]:
+                    invalidate_article_cache(int(pk))
+                return Response(like, status=status.HTTP_201_CREATED)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -145,6 +363,7 @@ class ArticlePublishView(APIView):
 
     def post(self, request, pk):
         if publish_article(self.get_object(pk)):
+            invalidate_article_cache(int(pk))
             return Response(status=status.HTTP_200_OK)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
@@ -186,7 +405,16 @@ class ContentCreateUpdateDeleteView(
             model_name=self.content_type, content_object_id=self.kwargs.get("object_id")
         )
 
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        invalidate_article_cache(self.article.id)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        invalidate_article_cache(self.article.id)
+
     def destroy(self, request, *args, **kwargs):
         content_id = kwargs.get("content_id")
         delete_article_content_by_id(content_id)
+        invalidate_article_cache(self.article.id)
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -33,6 +33,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "rest_framework_simplejwt",
     "rest_framework_simplejwt.token_blacklist",
@@ -131,6 +132,12 @@ STATICFILES_DIRS = [BASE_DIR.joinpath("static")]
 MEDIA_URL = "media/"
 MEDIA_ROOT = BASE_DIR.joinpath("media")
 
+# схема API, собранная командой build_schema при деплое
+API_SCHEMA_DIR = BASE_DIR.joinpath("schema")
+
+# swagger-ui загружает собранную схему, а не строит её заново
+SWAGGER_SETTINGS = {"SPEC_URL": ("schema-json", {"format": ".json"})}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
@@ -140,7 +147,7 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "account.authentication.CachedJWTAuthentication",
     ),
     "DEFAULT_RENDERER_CLASSES": (
         "rest_framework.renderers.JSONRenderer",
@@ -175,8 +182,19 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_REFRESH_EXP_CLAIM": "refresh_exp",
     "SLIDING_TOKEN_LIFETIME": timedelta(minutes=5),
     "SLIDING_TOKEN_REFRESH_LIFETIME": timedelta(days=1),
+    "TOKEN_OBTAIN_SERIALIZER": "account.serializers.TokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "account.serializers.TokenRefreshSerializer",
+    "TOKEN_BLACKLIST_SERIALIZER": "account.serializers.TokenBlacklistSerializer",
 }
 
+# чёрный список refresh токенов в redis: фильтр Блума процесса
+# на TOKEN_BLACKLIST_BLOOM_CAPACITY отозванных токенов с долей ложных
+# срабатываний TOKEN_BLACKLIST_BLOOM_ERROR_RATE дополняется отзывами
+# из redis раз в TOKEN_BLACKLIST_SYNC_INTERVAL сек.
+TOKEN_BLACKLIST_BLOOM_CAPACITY = 100000
+TOKEN_BLACKLIST_BLOOM_ERROR_RATE = 0.001
+TOKEN_BLACKLIST_SYNC_INTERVAL = 1
+
 
 # simulator smtp
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
@@ -186,6 +204,70 @@ EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 REDIS_HOST = "localhost"
 REDIS_PORT = 6379
 REDIS_DB = 0
+# путь к unix socket redis (вместо REDIS_HOST и REDIS_PORT)
+REDIS_UNIX_SOCKET_PATH = None
+# размер пула соединений процесса, таймауты (сек.) операций и подключения,
+# интервал (сек.) проверки простаивавших соединений
+REDIS_MAX_CONNECTIONS = 50
+REDIS_SOCKET_TIMEOUT = 0.5
+REDIS_SOCKET_CONNECT_TIMEOUT = 0.5
+REDIS_HEALTH_CHECK_INTERVAL = 30
+# разбор ответов через hiredis (pip install "redis[hiredis]")
+REDIS_HIREDIS = True
+
+# после REDIS_CIRCUIT_FAILURE_THRESHOLD ошибок подряд redis считается
+# недоступным REDIS_CIRCUIT_RESET_TIMEOUT сек.: чтения возвращают последние
+# прочитанные (до REDIS_STALE_CACHE_SIZE значений) или нулевые значения,
+# записи копятся в очереди повтора (до REDIS_RETRY_QUEUE_SIZE записей)
+REDIS_CIRCUIT_FAILURE_THRESHOLD = 5
+REDIS_CIRCUIT_RESET_TIMEOUT = 30
+REDIS_STALE_CACHE_SIZE = 10000
+REDIS_RETRY_QUEUE_SIZE = 10000
+
+# кэш пользователей для аутентификации по токену: время жизни (сек.)
+# в redis, время жизни (сек.) и размер LRU процесса. После изменения
+# пользователя другие процессы могут отдавать его старую копию
+# до AUTH_USER_LOCAL_CACHE_TIMEOUT сек.
+AUTH_USER_CACHE_TIMEOUT = 5 * 60
+AUTH_USER_LOCAL_CACHE_TIMEOUT = 5
+AUTH_USER_LOCAL_CACHE_SIZE = 10000
+
+# время жизни (сек.) отфильтрованных копий рейтинга в redis
+RATING_FILTER_CACHE_TIMEOUT = 10
+
+# лента подписок: длина, время жизни неактивной ленты (сек.),
+# размер пачки рассылки и количество подписчиков, после которого посты
+# автора не рассылаются по лентам, а подмешиваются при чтении
+TIMELINE_MAX_LENGTH = 1000
+TIMELINE_TIMEOUT = 7 * 24 * 60 * 60
+TIMELINE_FANOUT_BATCH_SIZE = 1000
+TIMELINE_FANOUT_MAX_SUBSCRIBERS = 10000
+
+# время жизни (сек.) закэшированных страниц списка постов для анонимов,
+# кэш сбрасывается при изменении постов, время жизни ограничивает
+# устаревание рейтинга и просмотров
+ARTICLE_LIST_CACHE_TIMEOUT = 60
+
+# время жизни (сек.) закэшированной статической части страницы поста
+ARTICLE_DETAIL_CACHE_TIMEOUT = 60 * 60
+
+# подсчёт просмотров: "exact" - запись в redis при каждом просмотре,
+# "buffered" - просмотры копятся в процессе и записываются пачкой
+# раз в ARTICLE_VIEW_FLUSH_INTERVAL сек. или по достижении
+# ARTICLE_VIEW_FLUSH_THRESHOLD просмотров
+ARTICLE_VIEW_COUNTER_MODE = "exact"
+ARTICLE_VIEW_FLUSH_INTERVAL = 1
+ARTICLE_VIEW_FLUSH_THRESHOLD = 100
+
+# True - рейтинг за просмотры начисляется только за уникальных зрителей
+ARTICLE_RATING_BY_UNIQUE_VIEWS = False
+
+# рейтинг популярности: сколько часов хранятся часовые изменения рейтинга,
+# за сколько часов их вес уменьшается вдвое и как часто (сек.)
+# пересобирается итоговый рейтинг
+TRENDING_WINDOW_HOURS = 48
+TRENDING_HALF_LIFE_HOURS = 6
+TRENDING_CACHE_TIMEOUT = 60
 
 
 USER_RATING_BY_ACTION = {
@@ -212,7 +294,11 @@ ARTICLE_FILTER_LIST = {
     "draft": "Черновики",
 }
 
-ARTICLE_ORDER_LIST = {"rating": "По рейтингу", "date": "Последние"}
+ARTICLE_ORDER_LIST = {
+    "rating": "По рейтингу",
+    "trending": "Популярные",
+    "date": "Последние",
+}
 
 USER_FILTER_LIST = {
     "all": "Все",
@@ -224,6 +310,12 @@ USER_ORDER_LIST = {"rating": "По рейтингу", "article_count": "По к
 
 ARTICLE_CONTENT_TYPES = {"text": "Текст", "image": "Изображение", "video": "Видео"}
 
+# максимальная длина текстового превью статьи
+ARTICLE_TEXT_PREVIEW_LENGTH = 300
+
+# конфигурации полнотекстового поиска PostgreSQL для статей
+ARTICLE_SEARCH_CONFIGS = ("russian", "english")
+
 ALPHABET = {
     "а": "a",
     "б": "b",
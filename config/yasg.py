@@ -1,23 +1,164 @@
 from rest_framework import permissions
+from rest_framework.request import Request
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import RequestFactory
 from django.urls import re_path
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views import View
+from django.views.decorators.http import etag
+from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+import gzip
+import hashlib
+import logging.config
+import re
+import threading
 
 
+logging.config.dictConfig(settings.LOGGING)
+LOGGER = logging.getLogger("blog_logger")
+
+SCHEMA_INFO = openapi.Info(
+    title="Blogging platform",
+    default_version="v1",
+    description="Платформа для регистрации пользователей, создания, просмотра и оценки статей",
+)
+
 schema_view = get_schema_view(
-    openapi.Info(
-        title="Blogging platform",
-        default_version="v1",
-        description="Платформа для регистрации пользователей, создания, просмотра и оценки статей",
-    ),
+    SCHEMA_INFO,
     public=True,
     permission_classes=[permissions.AllowAny],
 )
 
+# формат схемы: (кодек, content type)
+SCHEMA_FORMATS = {
+    ".json": (OpenAPICodecJson, "application/json"),
+    ".yaml": (OpenAPICodecYaml, "application/yaml"),
+}
+
+re_accepts_gzip = re.compile(r"\bgzip\b")
+
+
+class SchemaDocument:
+    """Документ схемы в одном формате: содержимое, оно же в gzip и ETag"""
+
+    def __init__(self, content: bytes, compressed: bytes = None):
+        self.content = content
+        self.compressed = compressed or gzip.compress(content, mtime=0)
+        self.etag = hashlib.sha256(content).hexdigest()[:32]
+
+
+_SCHEMA_DOCUMENTS = {}
+_SCHEMA_LOCK = threading.Lock()
+
+
+def generate_schema(schema_format: str) -> bytes:
+    """
+    Строит схему API в формате schema_format (".json" или ".yaml").
+    Схема строится для анонимного запроса и без хоста, поэтому
+    не зависит от пользователя и адреса, по которому её запросили
+    """
+    request = Request(RequestFactory().get("/swagger.json"))
+    schema = schema_view.generator_class(SCHEMA_INFO).get_schema(request, public=True)
+    schema.pop("host", None)
+    schema.pop("schemes", None)
+    codec_class = SCHEMA_FORMATS[schema_format][0]
+    return codec_class(validators=[]).encode(schema)
+
+
+def get_schema_file_path(schema_format: str, compressed: bool = False):
+    return settings.API_SCHEMA_DIR.joinpath(
+        f"swagger{schema_format}{'.gz' if compressed else ''}"
+    )
+
+
+def build_schema_files() -> list:
+    """Записывает схему во всех форматах (и в gzip) в API_SCHEMA_DIR"""
+    settings.API_SCHEMA_DIR.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for schema_format in SCHEMA_FORMATS:
+        document = SchemaDocument(generate_schema(schema_format))
+        for compressed, content in (
+            (False, document.content),
+            (True, document.compressed),
+        ):
+            path = get_schema_file_path(schema_format, compressed)
+            path.write_bytes(content)
+            paths.append(path)
+    return paths
+
+
+def get_schema_document(schema_format: str) -> SchemaDocument:
+    """
+    Документ схемы, собранный командой build_schema.
+    Если файла нет, схема строится при первом запросе.
+    Документ запоминается в процессе до перезапуска
+    """
+    document = _SCHEMA_DOCUMENTS.get(schema_format)
+    if document is not None:
+        return document
+    with _SCHEMA_LOCK:
+        document = _SCHEMA_DOCUMENTS.get(schema_format)
+        if document is None:
+            document = _load_schema_document(schema_format)
+            _SCHEMA_DOCUMENTS[schema_format] = document
+    return document
+
+
+def _load_schema_document(schema_format: str) -> SchemaDocument:
+    path = get_schema_file_path(schema_format)
+    if not path.exists():
+        LOGGER.warning(
+            f"prebuilt schema {schema_format} not found, run manage.py build_schema"
+        )
+        return SchemaDocument(generate_schema(schema_format))
+    content = path.read_bytes()
+    try:
+        compressed = get_schema_file_path(schema_format, compressed=True).read_bytes()
+    except FileNotFoundError:
+        compressed = None
+    return SchemaDocument(content, compressed)
+
+
+class SchemaFileView(View):
+    """
+    Отдаёт собранную схему API. Повторные запросы с If-None-Match
+    получают 304, клиентам с Accept-Encoding: gzip схема отдаётся сжатой
+    """
+
+    http_method_names = ["get", "head", "options"]
+
+    @staticmethod
+    def get_etag(request, format: str) -> str:
+        # слабый ETag: у сжатого и несжатого ответа он одинаковый
+        return f'W/"{get_schema_document(format).etag}"'
+
+    def get(self, request, format: str):
+        document = get_schema_document(format)
+        if re_accepts_gzip.search(request.META.get("HTTP_ACCEPT_ENCODING", "")):
+            response = HttpResponse(
+                document.compressed, content_type=SCHEMA_FORMATS[format][1]
+            )
+            response["Content-Encoding"] = "gzip"
+        else:
+            response = HttpResponse(
+                document.content, content_type=SCHEMA_FORMATS[format][1]
+            )
+        patch_vary_headers(response, ("Accept-Encoding",))
+        patch_cache_control(response, public=True, no_cache=True)
+        return response
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return etag(cls.get_etag)(super().as_view(**initkwargs))
+
+
 yasg_urlpatterns = [
     re_path(
         r"^swagger(?P<format>\.json|\.yaml)$",
-        schema_view.without_ui(cache_timeout=0),
+        SchemaFileView.as_view(),
         name="schema-json",
     ),
     re_path(